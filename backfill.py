@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Историческая догрузка переводов за интервал дат или блоков.
+Интервал делится на части, которые параллельно запрашиваются у TronGrid и
+BscScan под общим ограничителем запросов. Найденные переводы помечаются
+обработанными и пишутся в журнал без уведомлений, а с --replay проходят
+обычный путь уведомлений. Готовые части записываются в файл прогресса,
+поэтому прерванную догрузку можно продолжить тем же запуском. Пока монитор
+держит то же состояние (lock_state), догрузка не запускается.
+
+Примеры:
+    python backfill.py --network trc20 --from 2024-05-01 --to 2024-05-02
+    python backfill.py --network bep20 --from-block 38000000 --to-block 38100000
+    python backfill.py --from 2024-05-01T12:00 --wallet TW4i7h... --replay
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import config
+import transport
+from bsc_tracker import BscTracker
+from engine import load_wallets
+from ratelimit import RateLimiter, limiter
+from state_store import LEDGER_BACKFILLED, StateLocked, lock_state, open_state, write_atomic
+from tron_tracker import TronTracker
+
+CHECKPOINT_FILE = "backfill_checkpoint.json"
+# Повторы части после ошибки API
+RETRIES = 3
+CHAINS = {"trc20": "tron", "bep20": "bsc"}
+
+
+def parse_time(value: str) -> int:
+    """Дата (YYYY-MM-DD[THH:MM[:SS]], UTC) или unix время в секундах."""
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def split_range(start: int, end: int, size: int) -> list:
+    """Делит [start, end] на части не больше size."""
+    return [(low, min(low + size - 1, end)) for low in range(start, end + 1, size)]
+
+
+class Backfill:
+    """Параллельная догрузка частей интервала с файлом прогресса."""
+
+    def __init__(self, state, replay: bool = False, notifier=None, workers: int = None,
+                 checkpoint: str = CHECKPOINT_FILE, job: dict = None):
+        self.state = state
+        self.replay = replay
+        self.notifier = notifier
+        self.workers = workers or config.POLL_WORKERS
+        self.checkpoint = Path(checkpoint) if checkpoint else None
+        self.job = job or {}
+        self.done = set()
+        self.trackers = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def load_checkpoint(self) -> int:
+        """
+        Загружает готовые части той же задачи.
+
+        Returns:
+            Количество уже готовых частей
+        """
+        if not self.checkpoint or not self.checkpoint.exists():
+            return 0
+        try:
+            with open(self.checkpoint, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Ошибка загрузки {self.checkpoint}: {e}")
+            return 0
+        if data.get("job") != self.job:
+            print(f"{self.checkpoint} относится к другой задаче, начинаем заново")
+            return 0
+        self.done = set(data.get("done", []))
+        return len(self.done)
+
+    def _save_checkpoint(self):
+        """Вызывать под self.lock."""
+        if self.checkpoint:
+            write_atomic(self.checkpoint, json.dumps(
+                {"job": self.job, "done": sorted(self.done)}, indent=1
+            ))
+
+    def tracker(self, network: str, wallet: str):
+        """Трекер кошелька с общим хранилищем обработанных транзакций."""
+        key = (network, wallet)
+        with self.lock:
+            tracker = self.trackers.get(key)
+            if tracker is None:
+                tracker = TronTracker(wallet) if network == "trc20" else BscTracker(wallet)
+                tracker.load_processed(self.state.dedup(tracker.chain))
+                tracker.ledger = self.state
+                if self.notifier:
+                    tracker.notify = self.notifier.submit
+                self.trackers[key] = tracker
+        return tracker
+
+    @staticmethod
+    def chunk_key(chunk: tuple) -> str:
+        network, wallet, start, end = chunk
+        return f"{network}:{wallet}:{start}-{end}"
+
+    def _fetch(self, tracker, start: int, end: int) -> list:
+        """Запрос части с повторами."""
+        for attempt in range(1, RETRIES + 1):
+            try:
+                if tracker.chain == "tron":
+                    return tracker.fetch_range(start * 1000, end * 1000 + 999)
+                return tracker.fetch_range(start, end)
+            except Exception:
+                if attempt == RETRIES:
+                    raise
+                time.sleep(2 * attempt)
+
+    def _ingest(self, tracker, rows: list) -> int:
+        """
+        Отмечает новые переводы обработанными.
+
+        Returns:
+            Количество новых переводов (с --replay - уведомлений)
+        """
+        if self.replay:
+            return tracker.handle_transfers(rows)
+        if tracker.chain == "tron":
+            new_txs = tracker.process_transactions(rows)
+        else:
+            by_contract = {}
+            for row in rows:
+                contract = row.get("contractAddress", "").lower()
+                if contract in tracker.tokens:
+                    by_contract.setdefault(contract, []).append(row)
+            new_txs = []
+            for contract, contract_rows in by_contract.items():
+                new_txs += tracker.process_transactions(contract_rows, tracker.tokens[contract][0])
+        for tx in new_txs:
+            self.state.record_transfer(tx, LEDGER_BACKFILLED)
+        return len(new_txs)
+
+    def process(self, chunk: tuple) -> tuple:
+        """
+        Загружает и обрабатывает одну часть.
+
+        Returns:
+            Пара (получено строк, новых переводов)
+        """
+        network, wallet, start, end = chunk
+        tracker = self.tracker(network, wallet)
+        rows = self._fetch(tracker, start, end)
+        found = self._ingest(tracker, rows)
+        # Часть отмечается готовой только после записи обработанных транзакций
+        with self.lock:
+            self.state.flush()
+            self.done.add(self.chunk_key(chunk))
+            self._save_checkpoint()
+        return len(rows), found
+
+    def run(self, chunks: list) -> dict:
+        """
+        Обрабатывает части параллельно, пропуская готовые.
+
+        Returns:
+            Счётчики по сетям и общее время
+        """
+        todo = [chunk for chunk in chunks if self.chunk_key(chunk) not in self.done]
+        # Части разных сетей чередуются, чтобы оба провайдера были заняты
+        by_network = {}
+        for chunk in todo:
+            by_network.setdefault(chunk[0], []).append(chunk)
+        queues = list(by_network.values())
+        todo = [queue[i] for i in range(max(map(len, queues), default=0))
+                for queue in queues if i < len(queue)]
+
+        stats = {network: {"chunks": 0, "rows": 0, "new": 0, "failed": 0}
+                 for network in by_network}
+        started = time.monotonic()
+        finished = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, self.workers),
+                                      thread_name_prefix="backfill")
+        futures = {executor.submit(self.process, chunk): chunk for chunk in todo}
+        try:
+            for future in as_completed(futures):
+                network, wallet, start, end = futures[future]
+                counters = stats[network]
+                finished += 1
+                try:
+                    rows, found = future.result()
+                    counters["chunks"] += 1
+                    counters["rows"] += rows
+                    counters["new"] += found
+                except Exception as e:
+                    counters["failed"] += 1
+                    print(f"[{CHAINS[network].upper()}] Часть {start}-{end} {wallet}: {e}")
+                if finished % 10 == 0 or finished == len(todo):
+                    elapsed = time.monotonic() - started
+                    eta = elapsed / finished * (len(todo) - finished)
+                    print(f"  {finished}/{len(todo)} частей, {elapsed:.0f} сек, осталось ~{eta:.0f} сек")
+        except KeyboardInterrupt:
+            # Не начатые части отменяются, начатые дорабатывают и попадают в прогресс
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        self.stats = {"networks": stats, "elapsed": time.monotonic() - started,
+                      "skipped": len(chunks) - len(todo)}
+        return self.stats
+
+    def format_report(self) -> str:
+        elapsed = max(self.stats["elapsed"], 1e-9)
+        action = "уведомлений" if self.replay else "новых в журнал"
+        lines = [f"Готово за {elapsed:.1f} сек (пропущено готовых частей: {self.stats['skipped']})"]
+        for network, c in self.stats["networks"].items():
+            lines.append(
+                f"  {network.upper()}: частей {c['chunks']} (ошибок {c['failed']}), "
+                f"переводов {c['rows']} ({c['rows'] / elapsed:.0f}/сек), {action} {c['new']}"
+            )
+        lines.append(f"  Лимиты API: {RateLimiter.format_stats(limiter.stats())}")
+        return "\n".join(lines)
+
+
+def plan(args, wallets: dict) -> list:
+    """Части (сеть, кошелек, начало, конец) по аргументам командной строки."""
+    chunks = []
+    end_time = parse_time(args.to) if args.to else int(time.time())
+    start_time = parse_time(args.start) if args.start else None
+
+    if "trc20" in args.networks:
+        if start_time is None:
+            raise SystemExit("Для TRC20 задайте --from (догрузка по датам)")
+        for wallet in wallets["trc20"]:
+            for low, high in split_range(start_time, end_time, int(args.chunk_hours * 3600)):
+                chunks.append(("trc20", wallet, low, high))
+
+    if "bep20" in args.networks and wallets["bep20"]:
+        start_block, end_block = args.from_block, args.to_block
+        if start_block is None:
+            if start_time is None:
+                raise SystemExit("Для BEP20 задайте --from или --from-block")
+            resolver = BscTracker(wallets["bep20"][0])
+            start_block = resolver.block_at(start_time)
+            if end_block is None:
+                end_block = resolver.block_at(end_time)
+            print(f"BEP20: даты соответствуют блокам {start_block}-{end_block}")
+        elif end_block is None:
+            raise SystemExit("Вместе с --from-block задайте --to-block")
+        for wallet in wallets["bep20"]:
+            for low, high in split_range(start_block, end_block, args.chunk_blocks):
+                chunks.append(("bep20", wallet, low, high))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Догрузка переводов за прошедший интервал")
+    parser.add_argument("--network", choices=["trc20", "bep20", "all"], default="all")
+    parser.add_argument("--wallet", action="append",
+                        help="кошелек (можно несколько раз; по умолчанию все из настроек)")
+    parser.add_argument("--from", dest="start", help="начало: дата UTC или unix время")
+    parser.add_argument("--to", help="конец: дата UTC или unix время (по умолчанию сейчас)")
+    parser.add_argument("--from-block", type=int, help="первый блок BEP20")
+    parser.add_argument("--to-block", type=int, help="последний блок BEP20")
+    parser.add_argument("--chunk-hours", type=float, default=6, help="размер части TRC20, часов")
+    parser.add_argument("--chunk-blocks", type=int, default=20000, help="размер части BEP20, блоков")
+    parser.add_argument("--workers", type=int, default=config.POLL_WORKERS)
+    parser.add_argument("--replay", action="store_true",
+                        help="отправить уведомления о найденных переводах")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="файл прогресса")
+    parser.add_argument("--restart", action="store_true", help="не продолжать с файла прогресса")
+    args = parser.parse_args()
+    args.networks = ["trc20", "bep20"] if args.network == "all" else [args.network]
+
+    wallets = load_wallets()
+    if args.wallet:
+        wallets = {
+            network: [w for w in args.wallet if (w.lower().startswith("0x")) == (network == "bep20")]
+            for network in wallets
+        }
+    wallets = {network: items if network in args.networks else []
+               for network, items in wallets.items()}
+
+    chunks = plan(args, wallets)
+    job = {
+        "replay": args.replay,
+        "chunks": len(chunks),
+        "first": Backfill.chunk_key(chunks[0]) if chunks else None,
+        "last": Backfill.chunk_key(chunks[-1]) if chunks else None,
+    }
+
+    # Монитор держит итоги и журнал в памяти и перезаписал бы записи догрузки
+    try:
+        state_lock = lock_state()
+    except StateLocked as e:
+        raise SystemExit(f"Состояние используется запущенным монитором ({e}); "
+                         f"остановите его перед догрузкой")
+
+    notifier = None
+    if args.replay:
+        from notifier import NotificationQueue
+        if config.NOTIFY_QUEUE:
+            notifier = NotificationQueue()
+
+    state = open_state()
+    backfill = Backfill(state, args.replay, notifier, args.workers, args.checkpoint, job)
+    if not args.restart:
+        resumed = backfill.load_checkpoint()
+        if resumed:
+            print(f"Продолжаем: готово {resumed} из {len(chunks)} частей")
+    mode = "с уведомлениями" if args.replay else "без уведомлений (журнал и дедупликация)"
+    print(f"Догрузка {len(chunks)} частей {mode}, потоков {args.workers}")
+
+    try:
+        backfill.run(chunks)
+        print(backfill.format_report())
+    except KeyboardInterrupt:
+        print("\nОстановлено; готовые части сохранены, повторный запуск продолжит догрузку")
+    finally:
+        if notifier:
+            notifier.close()
+        state.close()
+        state_lock.close()
+        transport.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк и нагрузочный стенд.
+Поднимает локальные заглушки TronGrid transactions/trc20, BscScan tokentx
+и Telegram sendMessage с настраиваемыми задержкой, долей ошибок, ответами
+429 и потоком переводов, затем гоняет по ним трекеры и цикл монитора.
+
+Отчёт: переводов в секунду, задержка от появления перевода до доставки
+уведомления (перцентили), рост памяти хранилища обработанных транзакций
+и число запросов к API на один найденный перевод.
+
+Запуск: python benchmark.py --wallets 20 --rate 50 --duration 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import config
+from bsc_tracker import parse_tokens
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+class Faults:
+    """Параметры деградации одной заглушки."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0):
+        self.latency = latency  # сек на ответ
+        self.error_rate = error_rate  # доля ответов 500
+        self.throttle_rate = throttle_rate  # доля ответов "лимит превышен"
+
+    def roll(self) -> str:
+        """Выбирает исход запроса: ok, error или throttle."""
+        if self.latency:
+            time.sleep(self.latency)
+        value = random.random()
+        if value < self.error_rate:
+            return "error"
+        if value < self.error_rate + self.throttle_rate:
+            return "throttle"
+        return "ok"
+
+
+class MockChain:
+    """
+    Переводы обеих сетей, которые отдают заглушки API.
+    Сумма каждого перевода уникальна, по тексту уведомления находится
+    время его появления.
+    """
+
+    def __init__(self, bsc_contract: str, bsc_label: str):
+        self.bsc_contract = bsc_contract
+        self.bsc_label = bsc_label
+        self.tron = {}  # кошелек -> [строки TronGrid]
+        self.bsc = {}  # кошелек -> [строки BscScan]
+        self.created = {}  # текст уведомления -> время появления перевода
+        self.delivered = {}  # текст уведомления -> время доставки в Telegram
+        self.requests = {"trongrid": 0, "bscscan": 0, "telegram": 0}
+        self.faults_seen = {"error": 0, "throttle": 0}
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def _next_amount(self) -> int:
+        """Уникальная сумма в сотых долях токена."""
+        self.seq += 1
+        return 1000 + self.seq
+
+    def add_tron(self, wallet: str, track: bool = True):
+        with self.lock:
+            cents = self._next_amount()
+            row = {
+                "transaction_id": f"{self.seq:064x}",
+                "from": "TBenchSender",
+                "to": wallet,
+                "value": str(cents * 10 ** 4),
+                "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6},
+                "block_timestamp": int(time.time() * 1000),
+            }
+            self.tron.setdefault(wallet, []).append(row)
+            if track:
+                self.created[f"+{cents / 100:.2f} USDT TRC20"] = time.monotonic()
+
+    def add_bsc(self, wallet: str, track: bool = True):
+        with self.lock:
+            cents = self._next_amount()
+            row = {
+                "hash": f"0x{self.seq:064x}",
+                "from": "0x" + "ef" * 20,
+                "to": wallet,
+                "value": str(cents * 10 ** 16),
+                "tokenDecimal": "18",
+                "contractAddress": self.bsc_contract,
+                "blockNumber": str(40_000_000 + self.seq // 10),
+                "timeStamp": str(int(time.time())),
+            }
+            self.bsc.setdefault(wallet, []).append(row)
+            if track:
+                self.created[f"+{cents / 100:.2f} {self.bsc_label}"] = time.monotonic()
+
+    def trongrid_page(self, wallet: str, params: dict) -> dict:
+        """Ответ transactions/trc20: от min_timestamp по возрастанию, страницы по fingerprint."""
+        with self.lock:
+            rows = list(self.tron.get(wallet, []))
+        limit = int(params.get("limit", 20))
+        if "min_timestamp" not in params:
+            return {"data": rows[-limit:][::-1], "success": True, "meta": {}}
+        min_timestamp = int(params["min_timestamp"])
+        max_timestamp = int(params.get("max_timestamp", 2 ** 63))
+        rows = [row for row in rows if min_timestamp <= row["block_timestamp"] <= max_timestamp]
+        offset = int(params.get("fingerprint", 0))
+        page = rows[offset:offset + limit]
+        meta = {}
+        if offset + limit < len(rows):
+            meta["fingerprint"] = str(offset + limit)
+        return {"data": page, "success": True, "meta": meta}
+
+    def bscscan_page(self, params: dict) -> dict:
+        """Ответ tokentx с учётом startblock/endblock, page/offset и sort."""
+        with self.lock:
+            rows = list(self.bsc.get(params.get("address", "").lower(), []))
+        contract = params.get("contractaddress")
+        if contract:
+            rows = [row for row in rows if row["contractAddress"] == contract.lower()]
+        start = int(params.get("startblock", 0))
+        end = int(params.get("endblock", 2 ** 63))
+        rows = [row for row in rows if start <= int(row["blockNumber"]) <= end]
+        if params.get("sort") == "desc":
+            rows = rows[::-1]
+        offset = int(params.get("offset", 100))
+        page = int(params.get("page", 1))
+        rows = rows[(page - 1) * offset:page * offset]
+        if not rows:
+            return {"status": "0", "message": "No transactions found", "result": []}
+        return {"status": "1", "message": "OK", "result": rows}
+
+    def deliver(self, text: str):
+        now = time.monotonic()
+        with self.lock:
+            for line in text.split("\n"):
+                self.delivered.setdefault(line, now)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Один сервер на все три API, провайдер определяется по пути."""
+
+    chain = None  # MockChain
+    faults = {}  # провайдер -> Faults
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _outcome(self, provider: str) -> str:
+        with self.chain.lock:
+            self.chain.requests[provider] += 1
+        outcome = self.faults[provider].roll()
+        if outcome != "ok":
+            with self.chain.lock:
+                self.chain.faults_seen[outcome] += 1
+        return outcome
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path.startswith("/v1/accounts/"):
+            outcome = self._outcome("trongrid")
+            if outcome == "error":
+                return self._reply(500, {"success": False})
+            if outcome == "throttle":
+                return self._reply(429, {"success": False, "error": "rate limit"})
+            wallet = url.path.split("/")[3]
+            return self._reply(200, self.chain.trongrid_page(wallet, params))
+
+        if url.path == "/api":
+            outcome = self._outcome("bscscan")
+            if outcome == "error":
+                return self._reply(500, {"status": "0"})
+            if outcome == "throttle":
+                # BscScan сообщает о лимите в теле ответа с кодом 200
+                return self._reply(200, {
+                    "status": "0", "message": "NOTOK", "result": "Max rate limit reached"
+                })
+            return self._reply(200, self.chain.bscscan_page(params))
+
+        self._reply(404, {})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/sendMessage"):
+            return self._reply(404, {})
+        outcome = self._outcome("telegram")
+        if outcome == "error":
+            return self._reply(500, {"ok": False})
+        if outcome == "throttle":
+            return self._reply(429, {
+                "ok": False, "error_code": 429, "parameters": {"retry_after": 1}
+            })
+        self.chain.deliver(body.get("text", ""))
+        self._reply(200, {"ok": True, "result": {}})
+
+
+def start_mock(chain: MockChain, faults: dict) -> ThreadingHTTPServer:
+    """Запускает заглушки и направляет на них config."""
+    handler = type("Handler", (MockHandler,), {"chain": chain, "faults": faults})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base = f"http://127.0.0.1:{server.server_port}"
+    config.TRONGRID_API_URL = base
+    config.BSCSCAN_API_URL = f"{base}/api"
+    config.TELEGRAM_API_URL = base
+    config.TELEGRAM_BOT_TOKEN = "bench"
+    config.TELEGRAM_CHAT_ID = "1"
+    return server
+
+
+def bench_dedup(count: int) -> dict:
+    """Память хранилища обработанных транзакций на count записей."""
+    from dedup import DedupStore
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    store = DedupStore(capacity=count)
+    for i in range(count):
+        store.add(f"{i:064x}")
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"entries": len(store), "bytes": after - before}
+
+
+def bench_throughput(chain: MockChain, count: int) -> dict:
+    """
+    Переводов в секунду: трекеры выбирают count переводов страницами от курсора
+    (запрос, разбор, фильтр и дедупликация), уведомления не отправляются.
+    """
+    from bsc_tracker import BscTracker
+    from tron_tracker import TronTracker
+
+    results = {}
+    for name, tracker, add in (
+        ("TronTracker", TronTracker("TBenchThroughput"), chain.add_tron),
+        ("BscTracker", BscTracker("0x" + "aa" * 20), chain.add_bsc),
+    ):
+        for _ in range(count):
+            add(tracker.wallet, track=False)
+        tracker.notify = lambda amount, label: True
+        tracker.load_cursors({source: 0 for source in tracker.sources()})
+        before = dict(chain.requests)
+
+        started = time.perf_counter()
+        found = 0
+        while True:
+            new = tracker.check_and_notify()
+            found += new
+            if not new:
+                break
+        elapsed = time.perf_counter() - started
+
+        provider = tracker.provider
+        results[name] = {
+            "found": found,
+            "seconds": elapsed,
+            "per_second": found / elapsed if elapsed else 0.0,
+            "requests": chain.requests[provider] - before[provider],
+        }
+    return results
+
+
+def bench_monitor(chain: MockChain, args) -> dict:
+    """Цикл монитора как в main.run_monitor под постоянным потоком переводов."""
+    from bsc_tracker import BscTracker
+    from engine import TrackerEngine
+    from notifier import NotificationQueue
+    from state_store import FileState
+    from tron_tracker import TronTracker
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    config.DEDUP_FILE_TEMPLATE = f"{workdir}/processed_{{chain}}.bin"
+    tron_wallets = [f"TBenchWallet{i:04d}" for i in range(args.wallets)]
+    bsc_wallets = ["0x" + f"{i:040x}" for i in range(args.wallets)]
+
+    trackers = [TronTracker(w) for w in tron_wallets] + [BscTracker(w) for w in bsc_wallets]
+    notifier = NotificationQueue()
+    engine = TrackerEngine(trackers, state=FileState(f"{workdir}/state.json"), notifier=notifier)
+    engine.seed()
+
+    stop = threading.Event()
+
+    def generate():
+        interval = 1.0 / args.rate
+        while not stop.is_set():
+            if random.random() < 0.5:
+                chain.add_tron(random.choice(tron_wallets))
+            else:
+                chain.add_bsc(random.choice(bsc_wallets))
+            time.sleep(interval)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    generator = threading.Thread(target=generate, daemon=True)
+    generator.start()
+    before = dict(chain.requests)
+
+    cycles = 0
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        engine.run_cycle()
+        cycles += 1
+        time.sleep(min(engine.next_wakeup(), max(0.0, deadline - time.monotonic())))
+
+    stop.set()
+    generator.join()
+    # Последний проход, чтобы забрать переводы, появившиеся под конец
+    for source in engine.scheduler.sources:
+        source.next_due = 0
+    engine.run_cycle()
+    engine.save()
+    engine.shutdown()
+
+    latencies = [
+        chain.delivered[text] - created
+        for text, created in chain.created.items()
+        if text in chain.delivered
+    ]
+    requests = {
+        provider: chain.requests[provider] - before[provider] for provider in chain.requests
+    }
+    detected = len(latencies)
+    return {
+        "cycles": cycles,
+        "generated": len(chain.created),
+        "detected": detected,
+        "latencies": latencies,
+        "requests": requests,
+        "requests_per_transfer": sum(
+            requests[p] for p in ("trongrid", "bscscan")
+        ) / detected if detected else 0.0,
+        "dedup_entries": {c: len(engine.get_processed(c)) for c in ("tron", "bsc")},
+        "rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+        "notifier": {"sent": notifier.sent, "failed": notifier.failed},
+    }
+
+
+def configure(args):
+    """Интервалы и лимиты под стенд: измеряется трекер, а не ожидание лимитов."""
+    from ratelimit import limiter
+
+    config.CHECK_INTERVAL = args.interval
+    config.POLL_MIN_INTERVAL = min(args.interval, config.POLL_MIN_INTERVAL)
+    config.POLL_MAX_INTERVAL = max(args.interval, args.interval * 4)
+    config.NOTIFY_COALESCE_WINDOW = args.coalesce
+    config.TELEGRAM_CHAT_RATE = args.telegram_rate
+    limiter.configure("trongrid", args.api_rate)
+    limiter.configure("bscscan", args.api_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк трекеров на локальных заглушках API")
+    parser.add_argument("--wallets", type=int, default=10, help="кошельков в каждой сети")
+    parser.add_argument("--rate", type=float, default=20, help="новых переводов в секунду")
+    parser.add_argument("--duration", type=float, default=20, help="длительность цикла, сек")
+    parser.add_argument("--volume", type=int, default=5000, help="переводов для замера пропускной способности")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка API, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов о лимите")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-throttle", type=float, default=0.0)
+    parser.add_argument("--telegram-rate", type=float, default=config.TELEGRAM_CHAT_RATE)
+    parser.add_argument("--coalesce", type=float, default=config.NOTIFY_COALESCE_WINDOW)
+    parser.add_argument("--interval", type=float, default=2, help="базовый интервал опроса, сек")
+    parser.add_argument("--api-rate", type=float, default=100, help="лимит запросов к API в секунду")
+    parser.add_argument("--dedup-entries", type=int, default=100_000)
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод трекеров")
+    args = parser.parse_args()
+
+    configure(args)
+    api_faults = Faults(args.latency, args.error_rate, args.throttle_rate)
+    contract, (_, _, label) = next(iter(parse_tokens(config.BEP20_TOKENS).items()))
+    chain = MockChain(contract, label)
+    server = start_mock(chain, {
+        "trongrid": api_faults,
+        "bscscan": api_faults,
+        "telegram": Faults(args.telegram_latency, 0.0, args.telegram_throttle),
+    })
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        throughput = bench_throughput(chain, args.volume)
+        monitor = bench_monitor(chain, args)
+    dedup = bench_dedup(args.dedup_entries)
+    server.shutdown()
+
+    print("=" * 60)
+    print("Пропускная способность (запрос + разбор + дедупликация):")
+    for name, result in throughput.items():
+        print(f"  {name}: {result['found']} переводов за {result['seconds']:.2f} сек "
+              f"= {result['per_second']:.0f} tx/сек, запросов {result['requests']}")
+
+    latencies = monitor["latencies"]
+    print(f"\nЦикл монитора: {args.wallets}+{args.wallets} кошельков, "
+          f"{args.rate:.0f} tx/сек, {args.duration:.0f} сек, циклов {monitor['cycles']}")
+    print(f"  Переводов: появилось {monitor['generated']}, доставлено {monitor['detected']}")
+    print(f"  Задержка до доставки: p50 {percentile(latencies, 0.5):.2f} сек, "
+          f"p90 {percentile(latencies, 0.9):.2f}, p99 {percentile(latencies, 0.99):.2f}, "
+          f"max {max(latencies, default=0):.2f}")
+    requests = monitor["requests"]
+    print(f"  Запросов: TronGrid {requests['trongrid']}, BscScan {requests['bscscan']}, "
+          f"Telegram {requests['telegram']}; "
+          f"к API на перевод {monitor['requests_per_transfer']:.2f}")
+    print(f"  Сбоев заглушек: ошибок {chain.faults_seen['error']}, "
+          f"лимитов {chain.faults_seen['throttle']}")
+    print(f"  Уведомлений: отправлено {monitor['notifier']['sent']}, "
+          f"не доставлено {monitor['notifier']['failed']}")
+    print(f"  Хранилище обработанных: TRON {monitor['dedup_entries']['tron']}, "
+          f"BSC {monitor['dedup_entries']['bsc']} записей; рост RSS {monitor['rss_growth_kb']} КБ")
+
+    print(f"\nПамять хранилища: {dedup['entries']} записей = "
+          f"{dedup['bytes'] / 1024 / 1024:.1f} МБ ({dedup['bytes'] / dedup['entries']:.0f} байт/запись)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Сканирование BNB Chain напрямую через JSON-RPC (eth_getLogs).
+Альтернатива индексатору BscScan: один запрос на диапазон блоков
+покрывает все отслеживаемые кошельки и токены.
+"""
+
+import config
+import transport
+from bsc_tracker import ALL_TOKENS, BscTracker, parse_tokens
+from metrics import metrics
+from providers import get_pool
+from ratelimit import limiter, retry_after
+from telegram_bot import send_notification
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+# Селектор decimals()
+DECIMALS_SELECTOR = "0x313ce567"
+# Ключ курсора: последний полностью просканированный блок
+LOGS_CURSOR = "logs"
+# Ответы узлов о слишком большом диапазоне или числе логов: только после
+# них порция блоков уменьшается, на прочие ошибки (429, таймаут) - пауза
+RANGE_ERRORS = ("more than", "too many", "too large", "block range", "range is",
+                "response size", "results exceed")
+# Сколько блоков запрашивать в одном пакете eth_getBlockByNumber
+BLOCK_BATCH = 50
+# Сколько времён блоков помнить
+BLOCK_TIME_CACHE = 4096
+
+
+class RpcError(Exception):
+    """Ошибка JSON-RPC узла."""
+
+
+def is_range_error(error: Exception) -> bool:
+    """Узел отказал из-за размера диапазона, а не из-за лимита или сбоя."""
+    if not isinstance(error, RpcError):
+        return False
+    message = str(error).lower()
+    if "rate" in message:
+        return False
+    return any(marker in message for marker in RANGE_ERRORS)
+
+
+def address_topic(address: str) -> str:
+    """Дополняет адрес до 32-байтного индексированного топика."""
+    return "0x" + address.lower().replace("0x", "").rjust(64, "0")
+
+
+def topic_address(topic: str) -> str:
+    """Извлекает адрес из 32-байтного топика."""
+    return "0x" + topic[-40:].lower()
+
+
+class BscRpcTracker:
+    """Отслеживание BEP20 переводов на все кошельки через eth_getLogs."""
+
+    chain = "bsc"
+    provider = "bsc_rpc"
+
+    def __init__(self, wallets: list = None, rpc_url: str = None):
+        wallets = wallets or [config.BEP20_WALLET]
+        self.wallets = [w.lower() for w in wallets if w]
+        self.wallet = "rpc"  # для ключей курсоров и логов
+        self.pool = get_pool(self.provider, rpc_url or config.BSC_RPC_URL,
+                             "" if rpc_url else config.BSC_RPC_URLS)
+        self.rpc_url = self.pool.primary
+        self.tokens = parse_tokens(config.BEP20_TOKENS)
+        self.decimals = {}
+        self.block_times = {}  # номер блока -> timestamp (eth_getLogs его не отдаёт)
+        self.chunk = config.BSC_RPC_CHUNK
+        self.processed_txs = set()
+        self.cursors = {}
+        self.fetch_errors = {}
+        self.ledger = None
+        self.notify = send_notification
+        self.confirmations = None
+        self.wallet_trackers = {}
+        self._request_id = 0
+
+    def _call(self, method: str, params: list = None) -> dict:
+        """Тело вызова JSON-RPC со следующим id."""
+        self._request_id += 1
+        return {
+            "jsonrpc": "2.0",
+            "id": self._request_id,
+            "method": method,
+            "params": params or []
+        }
+
+    def _post(self, payload, endpoint: str):
+        """
+        Отправляет запрос (или пакет) JSON-RPC и возвращает разобранный ответ.
+        Токен ограничителя берётся на каждую попытку пула, после 429
+        следующая попытка ждёт паузу (Retry-After).
+        """
+        def attempt(url):
+            limiter.acquire(self.provider)
+            response = transport.post(self.provider, url, json=payload, endpoint=endpoint)
+            if response.status_code == 429:
+                limiter.reject(self.provider, retry_after=retry_after(response))
+            return response
+
+        response = self.pool.request(attempt)
+        if response.status_code != 200:
+            raise RpcError(f"HTTP {response.status_code}")
+        return response.json()
+
+    def _rpc(self, method: str, params: list = None):
+        """Вызывает метод JSON-RPC и возвращает result."""
+        data = self._post(self._call(method, params), method)
+        if data.get("error"):
+            raise RpcError(data["error"].get("message", str(data["error"])))
+        return data.get("result")
+
+    def get_block_times(self, numbers) -> dict:
+        """
+        Время блоков (сек) пакетными запросами eth_getBlockByNumber,
+        уже известные берутся из кэша.
+
+        Raises:
+            RpcError: Блок не получен
+        """
+        missing = sorted({number for number in numbers if number not in self.block_times})
+        for offset in range(0, len(missing), BLOCK_BATCH):
+            batch = missing[offset:offset + BLOCK_BATCH]
+            calls = [self._call("eth_getBlockByNumber", [hex(number), False]) for number in batch]
+            replies = {reply.get("id"): reply for reply in self._post(calls, "batch")}
+            for number, call in zip(batch, calls):
+                block = (replies.get(call["id"]) or {}).get("result")
+                if not block:
+                    raise RpcError(f"блок {number} не получен")
+                self.block_times[number] = int(block["timestamp"], 16)
+        while len(self.block_times) > BLOCK_TIME_CACHE:
+            del self.block_times[next(iter(self.block_times))]
+        return {number: self.block_times.get(number, 0) for number in numbers}
+
+    def get_head_block(self) -> int:
+        """Номер последнего блока с учётом BSC_RPC_LAG."""
+        return int(self._rpc("eth_blockNumber"), 16) - config.BSC_RPC_LAG
+
+    def get_decimals(self, contract_address: str) -> int:
+        """Возвращает decimals токена (запрашивается один раз)."""
+        decimals = self.decimals.get(contract_address)
+        if decimals is None:
+            try:
+                result = self._rpc("eth_call", [
+                    {"to": contract_address, "data": DECIMALS_SELECTOR}, "latest"
+                ])
+                decimals = int(result, 16)
+            except Exception as e:
+                print(f"[BSC RPC] Не удалось получить decimals {contract_address}: {e}")
+                return 18
+            self.decimals[contract_address] = decimals
+        return decimals
+
+    def decode_log(self, log: dict, block_times: dict = None) -> dict:
+        """
+        Переводит лог Transfer в запись того же вида, что отдаёт BscScan tokentx.
+        Время блока берётся из blockTimestamp, если узел его отдаёт, иначе из
+        block_times (get_block_times).
+
+        Returns:
+            Словарь с полями hash/from/to/value/tokenDecimal/contractAddress/
+            blockNumber/blockHash/timeStamp или None, если лог не подходит
+        """
+        topics = log.get("topics", [])
+        if log.get("removed") or len(topics) < 3 or topics[0] != TRANSFER_TOPIC:
+            return None
+
+        contract = log.get("address", "").lower()
+        block = int(log.get("blockNumber", "0x0"), 16)
+        if log.get("blockTimestamp"):
+            timestamp = int(log["blockTimestamp"], 16)
+        else:
+            timestamp = (block_times or {}).get(block, 0)
+        return {
+            "hash": log.get("transactionHash"),
+            "from": topic_address(topics[1]),
+            "to": topic_address(topics[2]),
+            "value": str(int(log.get("data") or "0x0", 16)),
+            "tokenDecimal": str(self.get_decimals(contract)),
+            "contractAddress": contract,
+            "blockNumber": str(block),
+            "blockHash": log.get("blockHash"),
+            "logIndex": str(int(log.get("logIndex") or "0x0", 16)),
+            "timeStamp": str(timestamp),
+        }
+
+    def get_token_transfers(self, contract_address: str = ALL_TOKENS) -> list:
+        """
+        Сканирует блоки после курсора порциями, подстраивая размер порции:
+        если узел отвечает, что результатов слишком много или диапазон
+        слишком велик, порция уменьшается вдвое, после успешного запроса -
+        растёт. Прочие ошибки (429, таймаут) прерывают цикл без изменения
+        курсора и порции, а расписание откладывает следующий опрос.
+
+        Returns:
+            Список переводов в формате BscScan tokentx
+        """
+        self.fetch_errors[contract_address] = False
+        try:
+            head = self.get_head_block()
+        except Exception as e:
+            print(f"[BSC RPC] ❌ Ошибка запроса: {e}")
+            self.fetch_errors[contract_address] = True
+            return []
+
+        cursor = self.cursors.get(LOGS_CURSOR)
+        if cursor is None:
+            # Первый запуск: начинаем с текущего блока
+            self.cursors[LOGS_CURSOR] = head
+            return []
+
+        contracts = list(self.tokens) if contract_address == ALL_TOKENS else [contract_address]
+        wallet_topics = [address_topic(w) for w in self.wallets]
+
+        transfers = []
+        start = cursor + 1
+        for _ in range(config.MAX_PAGES):
+            if start > head:
+                break
+            end = min(start + self.chunk - 1, head)
+            log_filter = {
+                "fromBlock": hex(start),
+                "toBlock": hex(end),
+                "address": contracts,
+                "topics": [TRANSFER_TOPIC, None, wallet_topics],
+            }
+            try:
+                logs = self._rpc("eth_getLogs", [log_filter]) or []
+                block_times = self.get_block_times({
+                    int(log.get("blockNumber", "0x0"), 16)
+                    for log in logs if not log.get("blockTimestamp")
+                })
+            except Exception as e:
+                if is_range_error(e) and self.chunk > 1:
+                    self.chunk = max(1, self.chunk // 2)
+                    continue
+                print(f"[BSC RPC] ❌ Ошибка запроса: {e}")
+                self.fetch_errors[contract_address] = True
+                break
+
+            metrics.record_fetched(self.chain, len(logs))
+            for log in logs:
+                transfer = self.decode_log(log, block_times)
+                if transfer:
+                    transfers.append(transfer)
+
+            self.cursors[LOGS_CURSOR] = end
+            start = end + 1
+            self.chunk = min(self.chunk * 2, config.BSC_RPC_MAX_CHUNK)
+
+        return transfers
+
+    def tracker_for(self, wallet: str) -> BscTracker:
+        """Трекер кошелька, разделяющий хранилище и уведомления со сканером."""
+        tracker = self.wallet_trackers.get(wallet)
+        if tracker is None:
+            tracker = self.wallet_trackers[wallet] = BscTracker(wallet)
+        tracker.processed_txs = self.processed_txs
+        tracker.notify = self.notify
+        tracker.ledger = self.ledger
+        tracker.confirmations = self.confirmations
+        return tracker
+
+    def sources(self) -> list:
+        """Один источник на все кошельки и токены."""
+        return [ALL_TOKENS]
+
+    def check_source(self, source: str = ALL_TOKENS) -> int:
+        """
+        Сканирует новые блоки и отправляет уведомления по всем кошелькам.
+
+        Returns:
+            Количество новых уведомлений
+        """
+        transfers = self.get_token_transfers(source)
+        by_wallet = {}
+        for transfer in transfers:
+            by_wallet.setdefault(transfer["to"], []).append(transfer)
+
+        total_notifications = 0
+        for wallet, wallet_transfers in by_wallet.items():
+            if wallet in self.wallets:
+                tracker = self.tracker_for(wallet)
+                total_notifications += tracker.handle_transfers(wallet_transfers)
+        return total_notifications
+
+    def check_and_notify(self) -> int:
+        """Проверяет новые транзакции и отправляет уведомления."""
+        return self.check_source(ALL_TOKENS)
+
+    def seed(self, force: bool = False) -> int:
+        """Ставит курсор на текущий блок, если его ещё нет (или force)."""
+        if force or LOGS_CURSOR not in self.cursors:
+            self.cursors.pop(LOGS_CURSOR, None)
+            self.get_token_transfers()
+        return 0
+
+    def load_processed(self, tx_ids: set):
+        """Загружает ранее обработанные транзакции."""
+        self.processed_txs = tx_ids
+
+    def get_processed(self) -> set:
+        """Возвращает множество обработанных транзакций."""
+        return self.processed_txs
+
+    def load_cursors(self, cursors: dict):
+        """Загружает курсор сканирования."""
+        self.cursors = dict(cursors)
+
+    def get_cursors(self) -> dict:
+        """Возвращает курсор сканирования."""
+        return dict(self.cursors)
+
+
+if __name__ == "__main__":
+    # Тест
+    tracker = BscRpcTracker()
+    print(f"RPC: {tracker.rpc_url}")
+    head = tracker.get_head_block()
+    print(f"Последний блок: {head}")
+    tracker.cursors[LOGS_CURSOR] = head - 200
+    transfers = tracker.get_token_transfers()
+    print(f"Найдено переводов за 200 блоков: {len(transfers)}")
@@ -1,49 +1,183 @@
-import requests
 import config
+import transport
+from decoding import TransferFilter, take_new
+from metrics import metrics
+from providers import get_pool
+from ratelimit import limiter, retry_after
+from routing import NOT_ROUTED, deliver
+from streaming import BSCSCAN, Page, read_page
 from telegram_bot import send_notification
 
+# Источник, объединяющий все токены кошелька в одном запросе tokentx
+ALL_TOKENS = "*"
+
+
+def parse_tokens(raw: str) -> dict:
+    """
+    Разбирает список отслеживаемых токенов.
+    
+    Args:
+        raw: Строка вида "контракт:тип:подпись,..." (подпись необязательна)
+    
+    Returns:
+        Словарь контракт -> (token_type, символ для логов, подпись уведомления)
+    """
+    tokens = {}
+    for item in raw.split(","):
+        parts = [part.strip() for part in item.split(":")]
+        if not parts[0]:
+            continue
+        token_type = parts[1].lower() if len(parts) > 1 and parts[1] else "token"
+        label = parts[2] if len(parts) > 2 and parts[2] else f"{token_type.upper()} BNB"
+        tokens[parts[0].lower()] = (token_type, token_type.upper(), label)
+    return tokens
+
+
+def _cacheable(response) -> bool:
+    """Ответ о превышении лимита приходит с кодом 200 и не кэшируется."""
+    if response.status_code != 200:
+        return False
+    data = response.json()
+    return data.get("status") == "1" or data.get("message") == "No transactions found"
+
+
+def _rate_limited(data: dict) -> bool:
+    """BscScan сообщает о превышении лимита в теле ответа с кодом 200."""
+    return "rate limit" in str(data.get("result", "")).lower()
+
+
+def _failed(response) -> bool:
+    """Ответ, после которого стоит спросить другой адрес BscScan."""
+    if response.status_code == 304:
+        return False  # сохранённый в кэше ответ не изменился
+    try:
+        return not _cacheable(response)
+    except ValueError:
+        return True
+
 
 class BscTracker:
     """Отслеживание BEP20 USDT/BUSDT транзакций на BNB Chain."""
     
-    def __init__(self):
-        self.wallet = config.BEP20_WALLET.lower()
-        self.usdt_contract = config.USDT_BEP20_CONTRACT.lower()
-        self.busdt_contract = config.BUSDT_BEP20_CONTRACT.lower()
+    chain = "bsc"
+    provider = "bscscan"
+    
+    def __init__(self, wallet: str = None):
+        self.wallet = (wallet or config.BEP20_WALLET).lower()
+        # контракт -> (token_type, символ для логов, подпись уведомления)
+        self.tokens = parse_tokens(config.BEP20_TOKENS)
+        # combined: один запрос tokentx на кошелек для всех токенов
+        self.combined = config.BSC_FETCH_MODE == "combined"
         self.min_amount = config.MIN_AMOUNT
-        self.api_key = config.BSCSCAN_API_KEY
+        self.filter = TransferFilter([self.wallet], min_amount=self.min_amount, lowercase=True)
         self.processed_txs = set()
-        self.api_url = "https://api.bscscan.com/api"
+        self.cursors = {}  # контракт (или ALL_TOKENS) -> последний просмотренный блок
+        self.fetch_errors = {}  # источник -> был ли последний запрос неудачным
+        self.ledger = None  # журнал переводов (state_store), если задан
+        self.notify = send_notification  # или NotificationQueue.submit
+        self.confirmations = None  # ConfirmationTracker, если нужны подтверждения
+        # Основной адрес BscScan и совместимые с ним адреса
+        self.pool = get_pool(self.provider, config.BSCSCAN_API_URL, config.BSCSCAN_API_URLS)
+        self.api_url = self.pool.primary
     
-    def get_token_transfers(self, contract_address: str) -> list:
+    def get_token_transfers(self, contract_address: str = ALL_TOKENS) -> list:
         """
         Получает BEP20 переводы на кошелек для указанного контракта.
         
+        Без курсора возвращает последние переводы, с курсором - только
+        переводы начиная с сохранённого блока (startblock), листая
+        страницы вперёд, пока они заполнены целиком.
+        
         Args:
-            contract_address: Адрес контракта токена
+            contract_address: Адрес контракта токена или ALL_TOKENS,
+                чтобы получить переводы всех токенов одним запросом
             
         Returns:
             Список транзакций
         """
+        cursor = self.cursors.get(contract_address)
         params = {
             "module": "account",
             "action": "tokentx",
-            "contractaddress": contract_address,
             "address": self.wallet,
             "page": 1,
             "offset": 100,  # Увеличиваем лимит для лучшего покрытия
             "sort": "desc"
         }
+        if contract_address != ALL_TOKENS:
+            params["contractaddress"] = contract_address
+        if cursor is not None:
+            params.update({
+                "startblock": cursor,
+                "offset": config.BSC_PAGE_SIZE,
+                "sort": "asc"
+            })
+        
+        transactions = []
+        latest = 0
+        self.fetch_errors[contract_address] = False
+        for _ in range(config.MAX_PAGES):
+            page = self._fetch_page(params)
+            if page is None:
+                self.fetch_errors[contract_address] = True
+                break
+            transactions.extend(page.rows)
+            latest = max(latest, page.latest)
+            
+            if cursor is None or page.total < params["offset"]:
+                break
+            
+            # BscScan отдаёт не больше 10000 записей на один запрос:
+            # дальше продолжаем с последнего блока с первой страницы
+            if (params["page"] + 1) * params["offset"] > 10000:
+                params["startblock"] = page.last or cursor
+                params["page"] = 1
+            else:
+                params["page"] += 1
+        
+        self._advance_cursor(contract_address, latest)
+        return transactions
+    
+    def _fetch_page(self, params: dict):
+        """
+        Запрашивает одну страницу tokentx.
+        
+        При STREAM_PARSE тело читается потоково и в page.rows остаются только
+        входящие на кошелек переводы не меньше MIN_AMOUNT.
+        
+        Returns:
+            Страница (streaming.Page) или None при ошибке
+        """
+        query = dict(params)  # params меняются при листании страниц
         
-        if self.api_key:
-            params["apikey"] = self.api_key
+        def attempt(base, conditions):
+            # Лимит BscScan общий для всех трекеров; ключи выдаются по кругу.
+            # Токен берётся на каждую попытку, включая дубль и переход на другой адрес
+            api_key = limiter.acquire(self.provider)
+            response = transport.get(
+                self.provider, base, params=dict(query, apikey=api_key) if api_key else query,
+                headers=conditions, endpoint=query.get("action"), stream=config.STREAM_PARSE,
+            )
+            page = read_page(response, BSCSCAN, self.filter)
+            if response.status_code == 429 or (page.status_code == 200 and _rate_limited(page.envelope)):
+                # Ключ на паузе: следующая попытка с ним ждёт, а не повторяет сразу
+                limiter.reject(self.provider, api_key, retry_after(response))
+            return page
+        
+        def request(conditions=None):
+            page = self.pool.request(lambda base: attempt(base, conditions), _failed)
+            if page.status_code == 200:
+                # Только полученные от API строки (не из кэша), до потокового фильтра
+                metrics.record_fetched(self.chain, page.total)
+            return page
         
         try:
-            response = requests.get(self.api_url, params=params, timeout=15)
+            # Одинаковые запросы трекеров в пределах CACHE_TTL делят один ответ
+            response = transport.cached(self.api_url, params, request, _cacheable)
             
             if response.status_code != 200:
                 print(f"[BSC] ❌ Ошибка API: {response.status_code} - {response.text}")
-                return []
+                return None
             
             data = response.json()
             
@@ -53,18 +187,91 @@ class BscTracker:
                 result = data.get("result", "")
                 if msg != "No transactions found":
                     print(f"[BSC] ⚠️ API: {msg} - {result}")
-                return []
-            
-            result = data.get("result", [])
-            if isinstance(result, list):
-                return result
-            return []
+                    return None
+                return Page(response.status_code)
+            return response
             
         except Exception as e:
             print(f"[BSC] ❌ Ошибка запроса: {e}")
             import traceback
             traceback.print_exc()
-            return []
+            return None
+    
+    def fetch_range(self, start_block: int, end_block: int) -> list:
+        """
+        Все переводы токенов кошелька в диапазоне блоков (для backfill).
+        
+        Args:
+            start_block, end_block: Границы диапазона (включительно)
+        
+        Returns:
+            Список транзакций в формате tokentx
+        
+        Raises:
+            RuntimeError: Страница не получена
+        """
+        params = {
+            "module": "account",
+            "action": "tokentx",
+            "address": self.wallet,
+            "startblock": start_block,
+            "endblock": end_block,
+            "page": 1,
+            "offset": config.BSC_PAGE_SIZE,
+            "sort": "asc",
+        }
+        transactions = []
+        while True:
+            page = self._fetch_page(params)
+            if page is None:
+                raise RuntimeError(f"BscScan: блоки {start_block}-{end_block} не получены")
+            transactions.extend(page.rows)
+            if page.total < params["offset"]:
+                return transactions
+            # Окно выдачи BscScan - 10000 записей: продолжаем с последнего блока
+            if (params["page"] + 1) * params["offset"] > 10000:
+                last_block = page.last or start_block
+                if last_block <= params["startblock"]:
+                    raise RuntimeError(f"BscScan: в блоке {last_block} больше 10000 переводов")
+                params["startblock"] = last_block
+                params["page"] = 1
+            else:
+                params["page"] += 1
+    
+    def block_at(self, timestamp: int) -> int:
+        """
+        Номер последнего блока не позже timestamp (для backfill по датам).
+        
+        Raises:
+            RuntimeError: Ответ не получен
+        """
+        params = {
+            "module": "block",
+            "action": "getblocknobytime",
+            "timestamp": int(timestamp),
+            "closest": "before",
+        }
+        
+        def attempt(base):
+            api_key = limiter.acquire(self.provider)
+            response = transport.get(
+                self.provider, base, params=dict(params, apikey=api_key) if api_key else params,
+                endpoint="getblocknobytime",
+            )
+            if response.status_code == 429:
+                limiter.reject(self.provider, api_key, retry_after(response))
+            return response
+        
+        response = self.pool.request(attempt, _failed)
+        data = response.json() if response.status_code == 200 else {}
+        if data.get("status") != "1":
+            raise RuntimeError(f"BscScan getblocknobytime: {data.get('result') or response.status_code}")
+        return int(data["result"])
+    
+    def _advance_cursor(self, contract_address: str, latest: int):
+        """Сдвигает курсор контракта на самый поздний блок из ответа."""
+        if latest and latest > self.cursors.get(contract_address, 0):
+            self.cursors[contract_address] = latest
     
     def process_transactions(self, transactions: list, token_type: str) -> list:
         """
@@ -77,93 +284,113 @@ class BscTracker:
         Returns:
             Список новых транзакций для уведомления
         """
-        new_transactions = []
+        # Входящие (to = наш кошелек) не меньше минимальной суммы; исходящие
+        # и мелкие переводы отбрасываются без записи в хранилище - повторно
+        # их не запросит курсор
+        transfers = take_new(self.filter.decode_bscscan(transactions), self.processed_txs)
+        metrics.record_transfers(self.chain, transfers)
+        return [t.to_dict(token_type, "bep20", "tx_hash") for t in transfers]
+    
+    def tracker_for(self, wallet: str) -> "BscTracker":
+        """Трекер, обрабатывающий переводы кошелька (у этого трекера кошелек один)."""
+        return self
+    
+    def sources(self) -> list:
+        """Возвращает источники, опрашиваемые отдельными запросами."""
+        if self.combined:
+            return [ALL_TOKENS]
+        return list(self.tokens)
+    
+    def check_source(self, source: str) -> int:
+        """
+        Проверяет новые транзакции источника и отправляет уведомления.
         
-        for tx in transactions:
-            tx_hash = tx.get("hash")
-            if not tx_hash:
-                continue
-            
-            # Пропускаем уже обработанные
-            if tx_hash in self.processed_txs:
-                # Логируем только для входящих транзакций, чтобы не спамить
-                to_address_check = tx.get("to", "").lower()
-                if to_address_check == self.wallet:
-                    value_check = tx.get("value", "0")
-                    decimals_check = int(tx.get("tokenDecimal", 18))
-                    amount_check = int(value_check) / (10 ** decimals_check)
-                    if amount_check >= self.min_amount:
-                        print(f"[BSC] ⚠️ Транзакция {tx_hash[:16]}... уже обработана (сумма: {amount_check:.6f})")
-                continue
-            
-            # Проверяем что это входящая транзакция (to = наш кошелек)
-            to_address = tx.get("to", "").lower()
-            from_address = tx.get("from", "").lower()
-            
-            # Логируем для отладки
-            if to_address == self.wallet:
-                # Получаем сумму (USDT/BUSDT имеют 18 decimals на BSC)
-                value = tx.get("value", "0")
-                decimals = int(tx.get("tokenDecimal", 18))
-                amount = int(value) / (10 ** decimals)
-                
-                print(f"[BSC] Найдена входящая транзакция {token_type.upper()}: {tx_hash[:10]}... сумма: {amount:.6f}, мин: {self.min_amount}")
-                
-                # Фильтруем по минимальной сумме
-                if amount < self.min_amount:
-                    print(f"[BSC] Транзакция {tx_hash[:10]}... пропущена: сумма {amount:.6f} < {self.min_amount}")
-                    self.processed_txs.add(tx_hash)
-                    continue
-                
-                new_transactions.append({
-                    "tx_hash": tx_hash,
-                    "amount": amount,
-                    "token": token_type,
-                    "network": "bep20"
-                })
-                
-                self.processed_txs.add(tx_hash)
-            else:
-                # Это исходящая транзакция или транзакция на другой адрес
-                # Помечаем как обработанную, чтобы не проверять снова
-                self.processed_txs.add(tx_hash)
+        Args:
+            source: Адрес контракта или ALL_TOKENS
+        
+        Returns:
+            Количество новых уведомлений
+        """
+        txs = self.get_token_transfers(source)
+        if source != ALL_TOKENS:
+            return self._notify_contract(source, txs)
         
-        return new_transactions
+        print(f"[BSC] Получено транзакций от API: {len(txs)}")
+        return self.handle_transfers(txs)
     
-    def check_and_notify(self) -> int:
+    def handle_transfers(self, txs: list) -> int:
         """
-        Проверяет новые транзакции и отправляет уведомления.
+        Раскладывает переводы разных токенов по отслеживаемым контрактам
+        и уведомляет о новых; переводы остальных токенов пропускаются.
         
         Returns:
             Количество новых уведомлений
         """
+        by_contract = {}
+        for tx in txs:
+            contract = tx.get("contractAddress", "").lower()
+            if contract in self.tokens:
+                by_contract.setdefault(contract, []).append(tx)
+        
+        total_notifications = 0
+        for contract, contract_txs in by_contract.items():
+            total_notifications += self._notify_contract(contract, contract_txs)
+        return total_notifications
+    
+    def _notify_contract(self, contract_address: str, txs: list) -> int:
+        """Отправляет уведомления о новых транзакциях одного контракта."""
+        token_type, symbol, label = self.tokens[contract_address]
         total_notifications = 0
         
-        # Проверяем USDT
-        usdt_txs = self.get_token_transfers(self.usdt_contract)
-        print(f"[BSC] Получено USDT транзакций от API: {len(usdt_txs)}")
-        new_usdt = self.process_transactions(usdt_txs, "usdt")
+        if not self.combined:
+            print(f"[BSC] Получено {symbol} транзакций от API: {len(txs)}")
+        new_txs = self.process_transactions(txs, token_type)
         
-        for tx in new_usdt:
-            print(f"[BSC] ✅ Новая транзакция: +{tx['amount']:.2f} USDT (BEP20) | Hash: {tx['tx_hash'][:16]}...")
-            if send_notification(tx["amount"], "USDT BNB"):
+        for tx in new_txs:
+            if self.confirmations is not None and self.confirmations.hold(self.chain, tx, label):
+                continue
+            print(f"[BSC] ✅ Новая транзакция: +{tx['amount']:.2f} {symbol} (BEP20) | Hash: {tx['tx_hash'][:16]}...")
+            notified = deliver(self.notify, tx, label)
+            if notified is NOT_ROUTED:
+                print(f"[BSC] Транзакция {tx['tx_hash'][:16]}... не отправляется по маршрутам")
+            elif notified:
                 total_notifications += 1
             else:
                 print(f"[BSC] ❌ Ошибка отправки уведомления для транзакции {tx['tx_hash'][:16]}...")
+            if self.ledger:
+                self.ledger.record_transfer(tx, notified)
         
-        # Проверяем BUSDT (BUSD)
-        busdt_txs = self.get_token_transfers(self.busdt_contract)
-        print(f"[BSC] Получено BUSDT транзакций от API: {len(busdt_txs)}")
-        new_busdt = self.process_transactions(busdt_txs, "busdt")
+        return total_notifications
+    
+    def check_and_notify(self) -> int:
+        """
+        Проверяет новые транзакции и отправляет уведомления.
         
-        for tx in new_busdt:
-            print(f"[BSC] ✅ Новая транзакция: +{tx['amount']:.2f} BUSDT (BEP20) | Hash: {tx['tx_hash'][:16]}...")
-            if send_notification(tx["amount"], "BUSD BNB"):
-                total_notifications += 1
-            else:
-                print(f"[BSC] ❌ Ошибка отправки уведомления для транзакции {tx['tx_hash'][:16]}...")
+        Returns:
+            Количество новых уведомлений
+        """
+        return sum(self.check_source(contract) for contract in self.sources())
+    
+    def seed(self, force: bool = False) -> int:
+        """
+        Помечает текущие транзакции обработанными без уведомлений.
+        Источники с сохранённым курсором пропускаются: их переводы
+        догоняются обычным опросом от курсора.
         
-        return total_notifications
+        Args:
+            force: Помечать и при наличии курсора (старый холодный старт)
+        
+        Returns:
+            Количество помеченных транзакций
+        """
+        count = 0
+        for source in self.sources():
+            if not force and source in self.cursors:
+                continue
+            for transfer in self.filter.decode_bscscan(self.get_token_transfers(source)):
+                self.processed_txs.add(transfer.key)
+                count += 1
+        return count
     
     def load_processed(self, tx_ids: set):
         """Загружает ранее обработанные транзакции."""
@@ -172,6 +399,18 @@ class BscTracker:
     def get_processed(self) -> set:
         """Возвращает множество обработанных транзакций."""
         return self.processed_txs
+    
+    def load_cursors(self, cursors: dict):
+        """Загружает курсоры по контрактам."""
+        self.cursors = dict(cursors)
+        # При переходе на общий запрос продолжаем с самого отстающего контракта
+        per_contract = [v for k, v in self.cursors.items() if k in self.tokens]
+        if self.combined and ALL_TOKENS not in self.cursors and per_contract:
+            self.cursors[ALL_TOKENS] = min(per_contract)
+    
+    def get_cursors(self) -> dict:
+        """Возвращает курсоры по контрактам."""
+        return dict(self.cursors)
 
 
 if __name__ == "__main__":
@@ -179,10 +418,7 @@ if __name__ == "__main__":
     tracker = BscTracker()
     print(f"Отслеживание кошелька: {tracker.wallet}")
     
-    print("\nПроверка USDT транзакций...")
-    usdt_txs = tracker.get_token_transfers(tracker.usdt_contract)
-    print(f"Найдено USDT транзакций: {len(usdt_txs)}")
-    
-    print("\nПроверка BUSDT транзакций...")
-    busdt_txs = tracker.get_token_transfers(tracker.busdt_contract)
-    print(f"Найдено BUSDT транзакций: {len(busdt_txs)}")
+    for contract, (token_type, symbol, _) in tracker.tokens.items():
+        print(f"\nПроверка {symbol} транзакций...")
+        txs = tracker.get_token_transfers(contract)
+        print(f"Найдено {symbol} транзакций: {len(txs)}")
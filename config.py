@@ -4,20 +4,162 @@ import os
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 TELEGRAM_TOPIC_ID = int(os.getenv("TELEGRAM_THREAD_ID", "4"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Очередь уведомлений
+NOTIFY_QUEUE = os.getenv("NOTIFY_QUEUE", "1") == "1"
+NOTIFY_COALESCE_WINDOW = float(os.getenv("NOTIFY_COALESCE_WINDOW", "2"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "5"))
+# Через сколько секунд повторить сообщение, не отправленное за NOTIFY_MAX_RETRIES попыток
+NOTIFY_REQUEUE_DELAY = float(os.getenv("NOTIFY_REQUEUE_DELAY", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # сообщений в секунду
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
 
 # Wallet Addresses
 TRC20_WALLET = os.getenv("TRC20_WALLET", "")
 BEP20_WALLET = os.getenv("BEP20_WALLET", "")
 
+# Списки кошельков: через запятую/пробел в env или JSON-файл
+# вида {"trc20": ["T..."], "bep20": ["0x..."]}
+TRC20_WALLETS = os.getenv("TRC20_WALLETS", "")
+BEP20_WALLETS = os.getenv("BEP20_WALLETS", "")
+WALLETS_FILE = os.getenv("WALLETS_FILE", "")
+
 # Contract Addresses (публичные, не секретные)
 USDT_TRC20_CONTRACT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
 USDT_BEP20_CONTRACT = "0x55d398326f99059fF775485246999027B3197955"
 BUSDT_BEP20_CONTRACT = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
 
+# Отслеживаемые BEP20 токены: "контракт:тип:подпись" через запятую
+BEP20_TOKENS = os.getenv(
+    "BEP20_TOKENS",
+    f"{USDT_BEP20_CONTRACT}:usdt:USDT BNB,{BUSDT_BEP20_CONTRACT}:busdt:BUSD BNB"
+)
+# combined - один запрос на кошелек для всех токенов, per_contract - запрос на токен
+BSC_FETCH_MODE = os.getenv("BSC_FETCH_MODE", "combined")
+
+# Источник TRON: trongrid (REST по кошелькам) или blocks (сканирование блоков узла)
+TRON_SOURCE = os.getenv("TRON_SOURCE", "trongrid")
+TRON_NODE_URL = os.getenv("TRON_NODE_URL", "https://api.trongrid.io")
+TRON_NODE_LAG = int(os.getenv("TRON_NODE_LAG", "0"))  # отставание от головы цепи в блоках
+TRON_SCAN_MAX_BLOCKS = int(os.getenv("TRON_SCAN_MAX_BLOCKS", "100"))  # блоков за опрос
+TRON_SCAN_BATCH = int(os.getenv("TRON_SCAN_BATCH", "20"))  # блоков в одном getblockbylimitnext (до 100)
+TRON_NODE_RATE = float(os.getenv("TRON_NODE_RATE", "10"))  # запросов в секунду
+
+# Источник BSC: bscscan (индексатор) или rpc (eth_getLogs напрямую с узла)
+BSC_SOURCE = os.getenv("BSC_SOURCE", "bscscan")
+BSC_RPC_URL = os.getenv("BSC_RPC_URL", "https://bsc-dataseed.binance.org")
+BSC_RPC_CHUNK = int(os.getenv("BSC_RPC_CHUNK", "1000"))  # блоков на eth_getLogs
+BSC_RPC_MAX_CHUNK = int(os.getenv("BSC_RPC_MAX_CHUNK", "5000"))
+BSC_RPC_LAG = int(os.getenv("BSC_RPC_LAG", "0"))  # отставание от головы цепи в блоках
+BSC_RPC_RATE = float(os.getenv("BSC_RPC_RATE", "10"))  # запросов в секунду
+
+# Подтверждения: уведомление после N блоков поверх блока перевода (0 - сразу)
+TRON_CONFIRMATIONS = int(os.getenv("TRON_CONFIRMATIONS", "0"))  # 19 - необратимый блок
+BSC_CONFIRMATIONS = int(os.getenv("BSC_CONFIRMATIONS", "0"))
+CONFIRM_CHECK_INTERVAL = float(os.getenv("CONFIRM_CHECK_INTERVAL", "3"))  # сек
+
+# Адреса API (меняются для тестовых стендов и бенчмарка)
+TRONGRID_API_URL = os.getenv("TRONGRID_API_URL", "https://api.trongrid.io")
+BSCSCAN_API_URL = os.getenv("BSCSCAN_API_URL", "https://api.bscscan.com/api")
+
+# Дополнительные взаимозаменяемые адреса API через запятую (тот же формат API)
+TRONGRID_API_URLS = os.getenv("TRONGRID_API_URLS", "")
+BSCSCAN_API_URLS = os.getenv("BSCSCAN_API_URLS", "")
+BSC_RPC_URLS = os.getenv("BSC_RPC_URLS", "")
+TRON_NODE_URLS = os.getenv("TRON_NODE_URLS", "")
+# Предохранитель адреса: ошибок подряд до выключения и пауза (сек)
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+# Дублирование запроса на второй адрес после p95 задержки (не раньше HEDGE_MIN_DELAY сек)
+PROVIDER_HEDGE = os.getenv("PROVIDER_HEDGE", "1") == "1"
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
 # API Keys
 BSCSCAN_API_KEY = os.getenv("BSCSCAN_API_KEY", "")
+# Несколько ключей через запятую используются по кругу
+BSCSCAN_API_KEYS = os.getenv("BSCSCAN_API_KEYS", "")
+TRONGRID_API_KEYS = os.getenv("TRONGRID_API_KEYS", "")
 
 # Settings
 MIN_AMOUNT = int(os.getenv("MIN_AMOUNT", "5"))
+# Маршруты уведомлений по кошелькам (JSON, см. routing.py) и период проверки
+# изменений файла, сек; без файла все уведомления идут в TELEGRAM_CHAT_ID
+ROUTES_FILE = os.getenv("ROUTES_FILE", "")
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", "5"))
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "30"))
 STATE_FILE = "last_transactions.json"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file")  # file или sqlite
+STATE_DB = os.getenv("STATE_DB", "state.db")
+
+# Хранилище обработанных транзакций (32 байта на запись)
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "100000"))
+DEDUP_FILE_TEMPLATE = os.getenv("DEDUP_FILE_TEMPLATE", "processed_{chain}.bin")
+
+# Постраничная загрузка от курсора
+TRON_PAGE_LIMIT = int(os.getenv("TRON_PAGE_LIMIT", "200"))
+BSC_PAGE_SIZE = int(os.getenv("BSC_PAGE_SIZE", "100"))
+MAX_PAGES = int(os.getenv("MAX_PAGES", "20"))
+# Потоковый разбор страниц: в словари превращаются только входящие
+# переводы не меньше MIN_AMOUNT, остальные строки отбрасываются по тексту
+STREAM_PARSE = os.getenv("STREAM_PARSE", "1") == "1"
+
+# HTTP транспорт (пулы keep-alive соединений)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+
+# Тёплый старт: источники с сохранённым курсором не помечаются заново,
+# а догоняются от курсора (не больше CATCHUP_ROUNDS раундов постраничных запросов)
+WARM_START = os.getenv("WARM_START", "1") == "1"
+CATCHUP_ROUNDS = int(os.getenv("CATCHUP_ROUNDS", "10"))
+
+# Кэш ответов API: время жизни (сек, 0 - выключен) и число записей
+CACHE_TTL = float(os.getenv("CACHE_TTL", "2"))
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "256"))
+
+# Итоги поступлений: часов и дней хранения корзин, смещение от UTC в часах
+ROLLUP_HOURS = int(os.getenv("ROLLUP_HOURS", "168"))
+ROLLUP_DAYS = int(os.getenv("ROLLUP_DAYS", "400"))
+ROLLUP_UTC_OFFSET = float(os.getenv("ROLLUP_UTC_OFFSET", "0"))
+# Файл итогов при STATE_BACKEND=file и как часто он перезаписывается (сек)
+ROLLUP_FILE = os.getenv("ROLLUP_FILE", "rollups.json")
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "60"))
+
+# Адаптивное расписание опроса (сек)
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "5"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "120"))
+POLL_IDLE_BACKOFF = float(os.getenv("POLL_IDLE_BACKOFF", "1.5"))
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))
+BSCSCAN_RATE = float(os.getenv("BSCSCAN_RATE", "5"))  # запросов в секунду на ключ
+TRONGRID_RATE = float(os.getenv("TRONGRID_RATE", "10"))  # запросов в секунду на ключ
+
+# Шардирование: SHARD_PROCESSES процессов на машине или шард SHARD_INDEX из SHARD_COUNT
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "1"))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "100"))  # виртуальных узлов на шард
+# Число шардов, с которым шардирование включено впервые (см. sharding.inheritance_allowed)
+SHARD_LAYOUT_FILE = os.getenv("SHARD_LAYOUT_FILE", "shards.json")
+
+# Метрики: Prometheus /metrics на порту (0 - выключено) и JSON журнал событий
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_LOG = os.getenv("METRICS_LOG", "")
+
+# Приём переводов от индексатора (webhook): порт (0 - выключен) и общий секрет подписи.
+# С webhook опрос становится редкой сверкой раз в WEBHOOK_RECONCILE_INTERVAL сек
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "0"))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_TOLERANCE = int(os.getenv("WEBHOOK_TOLERANCE", "300"))  # допустимый сдвиг X-Timestamp, сек
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", "1048576"))  # байт
+WEBHOOK_RECONCILE_INTERVAL = float(os.getenv("WEBHOOK_RECONCILE_INTERVAL", "300"))
+
+# Параллельный опрос
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", "16"))
+TRONGRID_CONCURRENCY = int(os.getenv("TRONGRID_CONCURRENCY", "4"))
+BSCSCAN_CONCURRENCY = int(os.getenv("BSCSCAN_CONCURRENCY", "2"))
@@ -0,0 +1,241 @@
+"""
+Подтверждение переводов перед уведомлением.
+Новый перевод сначала ждёт, пока поверх его блока не наберётся
+TRON_CONFIRMATIONS / BSC_CONFIRMATIONS блоков. Голова цепи запрашивается
+один раз за цикл на сеть, хэши блоков BSC сверяются одним пакетным
+запросом; перевод из блока, отброшенного реорганизацией, снимается.
+"""
+
+import threading
+
+import config
+import transport
+from decoding import amount_of
+from providers import get_pool
+from ratelimit import limiter, retry_after
+from routing import NOT_ROUTED, deliver
+from telegram_bot import send_notification
+
+# Среднее время блока TRON (сек) - для переводов TronGrid без номера блока
+TRON_BLOCK_TIME = 3
+
+
+class ConfirmationTracker:
+    """Переводы в ожидании подтверждений по сетям."""
+
+    def __init__(self, state=None, notify=None, confirmations: dict = None):
+        self.state = state  # хранилище состояния: снятие отметок и журнал
+        self.notify = notify or send_notification
+        self.required = confirmations or {
+            "tron": config.TRON_CONFIRMATIONS,
+            "bsc": config.BSC_CONFIRMATIONS,
+        }
+        self.pending = {}  # (сеть, ключ перевода) -> {"chain", "tx_id", "key", "label", "tx"}
+        self.heads = {}  # сеть -> (номер блока, timestamp в секундах)
+        self.confirmed = 0
+        self.reorged = 0
+        self._lock = threading.Lock()
+        self._request_id = 0
+
+    def enabled(self, chain: str) -> bool:
+        return self.required.get(chain, 0) > 0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def hold(self, chain: str, tx: dict, label: str) -> bool:
+        """
+        Ставит перевод в ожидание подтверждений.
+
+        Returns:
+            True, если перевод отложен; False, если для сети подтверждения не нужны
+        """
+        if not self.enabled(chain):
+            return False
+        tx_id = tx.get("tx_id") or tx.get("tx_hash")
+        key = tx.get("key") or tx_id
+        with self._lock:
+            self.pending[(chain, key)] = {
+                "chain": chain, "tx_id": tx_id, "key": key, "label": label, "tx": tx
+            }
+        print(f"[{chain.upper()}] ⏳ Ожидает подтверждений: +{tx['amount']:.2f} {label}")
+        return True
+
+    @staticmethod
+    def _post(provider: str, pool, path: str, payload, endpoint: str):
+        """
+        POST запрос к узлу через общий со сканерами пул адресов. Токен
+        ограничителя берётся на каждую попытку, после 429 следующая ждёт Retry-After.
+        """
+        def attempt(base):
+            limiter.acquire(provider)
+            response = transport.post(provider, base + path, json=payload, endpoint=endpoint)
+            if response.status_code == 429:
+                limiter.reject(provider, retry_after=retry_after(response))
+            return response
+
+        response = pool.request(attempt)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.json()
+
+    def _rpc_batch(self, calls: list) -> list:
+        """Пакетный JSON-RPC запрос к узлу BSC, результаты в порядке вызовов."""
+        payload = []
+        for method, params in calls:
+            self._request_id += 1
+            payload.append({
+                "jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params
+            })
+        pool = get_pool("bsc_rpc", config.BSC_RPC_URL, config.BSC_RPC_URLS)
+        replies = {reply.get("id"): reply
+                   for reply in self._post("bsc_rpc", pool, "", payload, "batch")}
+        return [replies.get(call["id"], {}).get("result") for call in payload]
+
+    def get_head(self, chain: str) -> tuple:
+        """
+        Один запрос головы цепи.
+
+        Returns:
+            Пара (номер блока, timestamp в секундах)
+        """
+        if chain == "bsc":
+            (block,) = self._rpc_batch([("eth_getBlockByNumber", ["latest", False])])
+            return int(block["number"], 16), int(block["timestamp"], 16)
+
+        pool = get_pool("tron_node", config.TRON_NODE_URL, config.TRON_NODE_URLS)
+        block = self._post("tron_node", pool, "/wallet/getnowblock", {}, "getnowblock")
+        header = block["block_header"]["raw_data"]
+        return header["number"], header["timestamp"] // 1000
+
+    def get_block_hashes(self, chain: str, numbers: set) -> dict:
+        """
+        Канонические хэши блоков одним пакетным запросом.
+        Для TRON не запрашиваются: блок с 19+ подтверждениями необратим.
+
+        Returns:
+            Словарь {номер блока: хэш}
+        """
+        if chain != "bsc" or not numbers:
+            return {}
+        numbers = sorted(numbers)
+        blocks = self._rpc_batch([
+            ("eth_getBlockByNumber", [hex(number), False]) for number in numbers
+        ])
+        return {
+            number: block["hash"].lower()
+            for number, block in zip(numbers, blocks)
+            if block
+        }
+
+    @staticmethod
+    def depth(tx: dict, head: tuple) -> int:
+        """Число подтверждений перевода при заданной голове цепи."""
+        head_number, head_timestamp = head
+        if tx.get("block"):
+            return head_number - tx["block"]
+        return (head_timestamp - (tx.get("timestamp") or 0)) // TRON_BLOCK_TIME
+
+    def check(self) -> int:
+        """
+        Проверяет ожидающие переводы и уведомляет о подтверждённых.
+
+        Returns:
+            Количество отправленных уведомлений
+        """
+        with self._lock:
+            entries = list(self.pending.values())
+        by_chain = {}
+        for entry in entries:
+            by_chain.setdefault(entry["chain"], []).append(entry)
+
+        total_notifications = 0
+        for chain, chain_entries in by_chain.items():
+            tag = f"[{chain.upper()}]"
+            try:
+                head = self.heads[chain] = self.get_head(chain)
+                ready = [
+                    entry for entry in chain_entries
+                    if self.depth(entry["tx"], head) >= self.required.get(chain, 0)
+                ]
+                hashes = self.get_block_hashes(chain, {
+                    entry["tx"]["block"] for entry in ready if entry["tx"].get("block_hash")
+                })
+            except Exception as e:
+                print(f"{tag} Ошибка проверки подтверждений: {e}")
+                continue
+
+            for entry in ready:
+                tx = entry["tx"]
+                expected = (tx.get("block_hash") or "").lower()
+                if expected:
+                    canonical = hashes.get(tx["block"])
+                    if canonical is None:
+                        continue  # блок не получен - проверим в следующем цикле
+                    if canonical != expected:
+                        self._drop(entry)
+                        continue
+                if self._confirm(entry):
+                    total_notifications += 1
+        return total_notifications
+
+    def _confirm(self, entry: dict) -> bool:
+        """
+        Уведомляет о подтверждённом переводе и записывает его в журнал.
+
+        Returns:
+            False, если по маршрутам перевод никуда не отправляется
+        """
+        with self._lock:
+            self.pending.pop((entry["chain"], entry["key"]), None)
+        tx = entry["tx"]
+        print(f"[{entry['chain'].upper()}] ✅ Подтверждена транзакция: "
+              f"+{tx['amount']:.2f} {entry['label']}")
+        notified = deliver(self.notify, tx, entry["label"])
+        if self.state:
+            self.state.record_transfer(tx, notified)
+        self.confirmed += 1
+        return notified is not NOT_ROUTED
+
+    def _drop(self, entry: dict):
+        """
+        Снимает перевод из блока, отброшенного реорганизацией. Отметка об
+        обработке тоже снимается: если перевод войдёт в другой блок, его
+        найдёт следующий опрос.
+        """
+        with self._lock:
+            self.pending.pop((entry["chain"], entry["key"]), None)
+        print(f"[{entry['chain'].upper()}] ⚠️ Блок {entry['tx'].get('block')} отменён "
+              f"реорганизацией, перевод {entry['tx_id'][:16]}... снят")
+        if self.state:
+            self.state.dedup(entry["chain"]).discard(entry["key"])
+        self.reorged += 1
+
+    def to_state(self) -> list:
+        """Ожидающие переводы в виде, пригодном для JSON."""
+        with self._lock:
+            entries = list(self.pending.values())
+        items = []
+        for entry in entries:
+            tx = dict(entry["tx"])
+            tx.pop("amount", None)  # восстанавливается из units/decimals
+            items.append({**entry, "tx": tx})
+        return items
+
+    def restore(self, items: list):
+        """Возвращает в ожидание переводы, сохранённые до перезапуска."""
+        with self._lock:
+            for item in items:
+                tx = dict(item["tx"])
+                tx["amount"] = amount_of(tx["units"], tx["decimals"])
+                # Записи до перехода на ключи переводов хранили только tx_id
+                key = item.get("key") or item["tx_id"]
+                self.pending[(item["chain"], key)] = {**item, "key": key, "tx": tx}
+
+    def stats(self) -> dict:
+        """Счётчики для периодического вывода."""
+        return {
+            "pending": len(self.pending),
+            "confirmed": self.confirmed,
+            "reorged": self.reorged,
+        }
@@ -0,0 +1,255 @@
+"""
+Пакетное декодирование и фильтрация переводов.
+Адреса нормализуются один раз при сборке фильтра, суммы хранятся в целых
+базовых единицах токена, Decimal появляется только при форматировании.
+Фильтр по кошельку, контракту и минимальной сумме - один проход по ответу.
+"""
+
+from decimal import Decimal
+
+import config
+
+
+def amount_of(units: int, decimals: int) -> Decimal:
+    """Точная сумма в токенах из базовых единиц."""
+    return Decimal(units).scaleb(-decimals)
+
+
+def transfer_key(tx_id: str, wallet: str, contract: str = None, log_index=None) -> str:
+    """
+    Ключ перевода в хранилище обработанных: одна транзакция может платить
+    нескольким отслеживаемым кошелькам (пакетные выплаты бирж) или нести
+    переводы разных токенов, поэтому одного хэша недостаточно.
+    Номер лога добавляется, когда источник его отдаёт (eth_getLogs).
+    """
+    key = f"{tx_id}:{wallet}:{(contract or '').lower()}"
+    if log_index not in (None, ""):
+        key += f":{int(log_index)}"
+    return key
+
+
+class Transfer:
+    """Компактная запись входящего перевода."""
+
+    __slots__ = ("tx_id", "wallet", "contract", "sender", "units", "decimals",
+                 "block", "timestamp", "block_hash", "log_index")
+
+    def __init__(self, tx_id, wallet, contract, sender, units, decimals, block, timestamp,
+                 block_hash=None, log_index=None):
+        self.tx_id = tx_id
+        self.wallet = wallet
+        self.contract = contract
+        self.sender = sender
+        self.units = units
+        self.decimals = decimals
+        self.block = block
+        self.timestamp = timestamp
+        self.block_hash = block_hash
+        self.log_index = log_index
+
+    @property
+    def amount(self) -> Decimal:
+        return amount_of(self.units, self.decimals)
+
+    @property
+    def key(self) -> str:
+        """Ключ в хранилище обработанных (см. transfer_key)."""
+        return transfer_key(self.tx_id, self.wallet, self.contract, self.log_index)
+
+    def to_dict(self, token: str, network: str, id_key: str) -> dict:
+        """Запись в формате, который трекеры отдают на уведомление."""
+        return {
+            id_key: self.tx_id,
+            "key": self.key,
+            "amount": self.amount,
+            "units": self.units,
+            "decimals": self.decimals,
+            "token": token,
+            "network": network,
+            "wallet": self.wallet,
+            "from": self.sender,
+            "block": self.block,
+            "block_hash": self.block_hash,
+            "timestamp": self.timestamp,
+        }
+
+
+class TransferFilter:
+    """Скомпилированный фильтр: кошельки, контракты и минимальная сумма."""
+
+    def __init__(self, wallets, contracts=None, min_amount=None, lowercase: bool = False):
+        self.lowercase = lowercase
+        self.wallets = frozenset(w.lower() if lowercase else w for w in wallets)
+        # Адреса TRON (base58) сравниваются точно, BSC - в нижнем регистре
+        self.contracts = (
+            frozenset(c.lower() if lowercase else c for c in contracts) if contracts else None
+        )
+        min_amount = config.MIN_AMOUNT if min_amount is None else min_amount
+        self.min_amount = Decimal(str(min_amount))
+        self._thresholds = {}  # decimals -> минимум в базовых единицах
+
+    def threshold(self, decimals: int) -> int:
+        """Минимальная сумма в базовых единицах для заданных decimals."""
+        units = self._thresholds.get(decimals)
+        if units is None:
+            scaled = self.min_amount.scaleb(decimals)
+            units = int(scaled.to_integral_value(rounding="ROUND_CEILING"))
+            self._thresholds[decimals] = units
+        return units
+
+    def decode_trongrid(self, rows: list) -> list:
+        """
+        Отбирает входящие переводы из ответа TronGrid transactions/trc20.
+
+        Returns:
+            Список Transfer
+        """
+        wallets = self.wallets
+        contracts = self.contracts
+        threshold = self.threshold
+        result = []
+        for row in rows:
+            to_address = row.get("to")
+            if to_address not in wallets:
+                continue
+            token_info = row.get("token_info") or {}
+            # Токен с тем же символом, но другим контрактом - не USDT
+            if contracts is not None and token_info.get("address") not in contracts:
+                continue
+            decimals = int(token_info.get("decimals", 6))
+            units = int(row.get("value") or 0)
+            if units < threshold(decimals):
+                continue
+            result.append(Transfer(
+                row.get("transaction_id"),
+                to_address,
+                token_info.get("address"),
+                row.get("from"),
+                units,
+                decimals,
+                row.get("block"),
+                (row.get("block_timestamp") or 0) // 1000,
+            ))
+        return result
+
+    def decode_bscscan(self, rows: list) -> list:
+        """
+        Отбирает входящие переводы из ответа BscScan tokentx
+        (или записей того же вида из eth_getLogs).
+
+        Returns:
+            Список Transfer
+        """
+        wallets = self.wallets
+        contracts = self.contracts
+        threshold = self.threshold
+        result = []
+        for row in rows:
+            to_address = row.get("to") or ""
+            # BscScan уже отдаёт адреса в нижнем регистре, lower() только при расхождении
+            if to_address not in wallets:
+                to_address = to_address.lower()
+                if to_address not in wallets:
+                    continue
+            contract = row.get("contractAddress") or ""
+            if contracts is not None and contract not in contracts:
+                contract = contract.lower()
+                if contract not in contracts:
+                    continue
+            tx_hash = row.get("hash")
+            if not tx_hash:
+                continue
+            decimals = int(row.get("tokenDecimal") or 18)
+            units = int(row.get("value") or 0)
+            if units < threshold(decimals):
+                continue
+            result.append(Transfer(
+                tx_hash,
+                to_address,
+                contract.lower(),
+                (row.get("from") or "").lower(),
+                units,
+                decimals,
+                int(row.get("blockNumber") or 0),
+                int(row.get("timeStamp") or 0),
+                row.get("blockHash"),
+                row.get("logIndex"),
+            ))
+        return result
+
+
+def take_new(transfers: list, processed) -> list:
+    """
+    Оставляет ещё не обработанные переводы и помечает их обработанными.
+    Отметка ставится по ключу перевода (хэш, кошелек, контракт), а не по
+    хэшу транзакции. Хранилище, у которого add возвращает False для уже
+    отмеченного ключа, защищает от двойного уведомления, когда один перевод
+    одновременно приходит из опроса и из webhook.
+    """
+    new_transfers = []
+    for transfer in transfers:
+        key = transfer.key
+        # Записи прежнего формата (только хэш) тоже считаются обработанными
+        if key in processed or transfer.tx_id in processed:
+            continue
+        if processed.add(key) is False:
+            continue
+        new_transfers.append(transfer)
+    return new_transfers
+
+
+def _legacy_process(rows: list, wallet: str, min_amount: float, processed: set) -> list:
+    """Прежняя обработка словарями (для сравнения в бенчмарке)."""
+    result = []
+    for tx in rows:
+        tx_hash = tx.get("hash")
+        if tx_hash in processed:
+            to_check = tx.get("to", "").lower()
+            if to_check == wallet:
+                int(tx.get("value", "0")) / (10 ** int(tx.get("tokenDecimal", 18)))
+            continue
+        to_address = tx.get("to", "").lower()
+        tx.get("from", "").lower()
+        if to_address == wallet:
+            amount = int(tx.get("value", "0")) / (10 ** int(tx.get("tokenDecimal", 18)))
+            if amount >= min_amount:
+                result.append({"tx_hash": tx_hash, "amount": amount})
+        processed.add(tx_hash)
+    return result
+
+
+def benchmark(count: int = 100_000, match_ratio: float = 0.1):
+    """Микробенчмарк: стоимость обработки одной транзакции, старый и новый путь."""
+    import random
+    import time
+
+    wallet = "0x" + "ab" * 20
+    rows = []
+    for i in range(count):
+        rows.append({
+            "hash": f"0x{i:064x}",
+            "to": wallet if random.random() < match_ratio else "0x" + "cd" * 20,
+            "from": "0x" + "ef" * 20,
+            "value": str(random.randint(1, 50) * 10 ** 18),
+            "tokenDecimal": "18",
+            "contractAddress": "0x" + "12" * 20,
+            "blockNumber": str(30_000_000 + i),
+            "timeStamp": "1700000000",
+        })
+
+    started = time.perf_counter()
+    _legacy_process(rows, wallet, 5, set())
+    legacy = time.perf_counter() - started
+
+    flt = TransferFilter([wallet], min_amount=5, lowercase=True)
+    started = time.perf_counter()
+    take_new(flt.decode_bscscan(rows), set())
+    batch = time.perf_counter() - started
+
+    print(f"Транзакций: {count}, доля входящих: {match_ratio:.0%}")
+    print(f"  словари (старый путь): {legacy / count * 1e6:.2f} мкс/tx")
+    print(f"  пакетный фильтр:       {batch / count * 1e6:.2f} мкс/tx")
+
+
+if __name__ == "__main__":
+    benchmark()
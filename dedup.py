@@ -0,0 +1,181 @@
+"""
+Ограниченное хранилище обработанных транзакций.
+Хэши хранятся как 32-байтные записи в кольцевом буфере с индексом,
+на диск дописываются только новые записи и отметки об удалении.
+"""
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import config
+
+RECORD_SIZE = 32
+# Запись-маркер: следующая за ней запись в файле - снятый ключ
+TOMBSTONE = hashlib.sha256(b"dedup:tombstone").digest()
+
+
+def tx_key(tx_id: str) -> bytes:
+    """
+    Переводит идентификатор транзакции в 32-байтный ключ.
+
+    Хэши TRON и BSC - это 32 байта в hex, остальные строки хэшируются.
+    """
+    raw = tx_id[2:] if tx_id.startswith(("0x", "0X")) else tx_id
+    if len(raw) == RECORD_SIZE * 2:
+        try:
+            return bytes.fromhex(raw)
+        except ValueError:
+            pass
+    return hashlib.sha256(tx_id.encode()).digest()
+
+
+class DedupStore:
+    """
+    Множество обработанных транзакций с фиксированным объёмом памяти.
+
+    При переполнении вытесняются самые старые записи. Транзакции старше
+    окна не запрашиваются повторно благодаря курсорам трекеров, поэтому
+    окна в capacity записей достаточно для защиты от дубликатов.
+    """
+
+    def __init__(self, capacity: int = None, path: str = None):
+        self.capacity = capacity or config.DEDUP_CAPACITY
+        self.path = Path(path) if path else None
+        self._ring = bytearray(self.capacity * RECORD_SIZE)
+        self._index = {}  # ключ -> номер слота
+        self._next = 0
+        self._pending = []
+        self._file_records = 0
+        self._lock = threading.Lock()
+
+        if self.path:
+            self._load()
+
+    def _load(self):
+        """Загружает последние capacity записей из файла."""
+        if not self.path.exists():
+            return
+        try:
+            data = self.path.read_bytes()
+        except Exception as e:
+            print(f"Ошибка загрузки {self.path}: {e}")
+            return
+
+        usable = len(data) - len(data) % RECORD_SIZE
+        self._file_records = usable // RECORD_SIZE
+        start = max(0, usable - self.capacity * RECORD_SIZE)
+        # Окно могло начаться сразу после маркера удаления
+        removed = start > 0 and data[start - RECORD_SIZE:start] == TOMBSTONE
+        for offset in range(start, usable, RECORD_SIZE):
+            key = bytes(data[offset:offset + RECORD_SIZE])
+            if removed:
+                self._index.pop(key, None)
+                removed = False
+            elif key == TOMBSTONE:
+                removed = True
+            else:
+                self._insert(key)
+
+    def _insert(self, key: bytes) -> bool:
+        """Кладёт ключ в кольцо, вытесняя самый старый. Вызывать под блокировкой."""
+        if key in self._index:
+            return False
+
+        slot = self._next
+        offset = slot * RECORD_SIZE
+        old_key = bytes(self._ring[offset:offset + RECORD_SIZE])
+        if self._index.get(old_key) == slot:
+            del self._index[old_key]
+
+        self._ring[offset:offset + RECORD_SIZE] = key
+        self._index[key] = slot
+        self._next = (slot + 1) % self.capacity
+        return True
+
+    def add(self, tx_id: str) -> bool:
+        """
+        Помечает транзакцию обработанной.
+
+        Returns:
+            False, если транзакция уже была отмечена (например, другим потоком)
+        """
+        key = tx_key(tx_id)
+        with self._lock:
+            if not self._insert(key):
+                return False
+            self._pending.append(key)
+            return True
+
+    def update(self, tx_ids):
+        """Добавляет несколько транзакций."""
+        for tx_id in tx_ids:
+            self.add(tx_id)
+
+    def discard(self, tx_id: str):
+        """
+        Снимает отметку обработки (например, после реорганизации блока).
+        В файл дописывается маркер удаления, поэтому после перезапуска
+        отметка не возвращается; сжатие файла снятые записи не переносит.
+        """
+        key = tx_key(tx_id)
+        with self._lock:
+            self._index.pop(key, None)
+            self._pending.extend((TOMBSTONE, key))
+
+    def __contains__(self, tx_id) -> bool:
+        return tx_key(tx_id) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def keys(self) -> list:
+        """Возвращает 32-байтные ключи всех записей."""
+        with self._lock:
+            return list(self._index)
+
+    def flush(self):
+        """Дописывает в файл только новые записи; при разрастании файла сжимает его."""
+        if not self.path:
+            self._pending.clear()
+            return
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._file_records + len(pending) > self.capacity * 2:
+                self._compact()
+                return
+
+        if not pending:
+            return
+        try:
+            with open(self.path, "ab") as f:
+                f.write(b"".join(pending))
+            self._file_records += len(pending)
+        except Exception as e:
+            print(f"Ошибка сохранения {self.path}: {e}")
+            with self._lock:
+                self._pending = pending + self._pending
+
+    def _compact(self):
+        """Переписывает файл содержимым кольца в порядке добавления. Вызывать под блокировкой."""
+        records = []
+        for i in range(self.capacity):
+            slot = (self._next + i) % self.capacity
+            key = bytes(self._ring[slot * RECORD_SIZE:(slot + 1) * RECORD_SIZE])
+            if self._index.get(key) == slot:
+                records.append(key)
+        count = len(records)
+        data = b"".join(records)
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file_records = count
+        except Exception as e:
+            print(f"Ошибка сжатия {self.path}: {e}")
@@ -0,0 +1,348 @@
+"""
+Движок отслеживания множества кошельков.
+Опрашивает все трекеры параллельно в ограниченном пуле потоков
+с лимитом одновременных запросов на каждого провайдера API.
+"""
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+import transport
+from confirmations import ConfirmationTracker
+from metrics import metrics
+from scheduler import PollScheduler
+from sharding import shard_count, shard_wallets
+from state_store import FileState
+from tron_tracker import TronTracker
+from tron_blocks import TronBlockTracker
+from bsc_tracker import BscTracker
+from bsc_rpc import BscRpcTracker
+
+
+def _split_wallets(raw: str) -> list:
+    """Разбивает строку адресов, разделённых запятыми или пробелами."""
+    return [w for w in re.split(r"[\s,;]+", raw or "") if w]
+
+
+def load_wallets() -> dict:
+    """
+    Собирает списки кошельков из env и WALLETS_FILE.
+
+    Returns:
+        Словарь {"trc20": [...], "bep20": [...]} без дубликатов
+    """
+    wallets = {
+        "trc20": [config.TRC20_WALLET] + _split_wallets(config.TRC20_WALLETS),
+        "bep20": [config.BEP20_WALLET] + _split_wallets(config.BEP20_WALLETS),
+    }
+
+    if config.WALLETS_FILE:
+        try:
+            with open(Path(config.WALLETS_FILE), "r") as f:
+                data = json.load(f)
+            for network in wallets:
+                wallets[network] += data.get(network, [])
+        except Exception as e:
+            print(f"Ошибка загрузки списка кошельков: {e}")
+
+    result = {}
+    for network, items in wallets.items():
+        seen = set()
+        result[network] = []
+        for wallet in items:
+            # BEP20 адреса регистронезависимы, TRON base58 - чувствителен
+            key = wallet.lower() if network == "bep20" else wallet
+            if wallet and key not in seen:
+                seen.add(key)
+                result[network].append(wallet)
+    return result
+
+
+class TrackerEngine:
+    """Параллельный опрос трекеров с лимитами на провайдеров."""
+
+    def __init__(self, trackers: list, max_workers: int = None, limits: dict = None,
+                 state=None, notifier=None, intervals: dict = None):
+        """
+        Args:
+            intervals: Интервалы опроса для PollScheduler (base_interval,
+                min_interval, max_interval), например режим сверки с webhook
+        """
+        self.trackers = trackers
+        self.state = state or FileState()
+        self.notifier = notifier
+        self.max_workers = max_workers or config.POLL_WORKERS
+        limits = limits or {
+            "trongrid": config.TRONGRID_CONCURRENCY,
+            "bscscan": config.BSCSCAN_CONCURRENCY,
+        }
+        self.slots = {
+            provider: threading.BoundedSemaphore(max(1, limit))
+            for provider, limit in limits.items()
+        }
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(trackers) or 1)),
+            thread_name_prefix="poll",
+        )
+        self.last_cycle_duration = 0.0
+        self.last_stats = {}
+        self.confirmations = ConfirmationTracker(
+            self.state, notifier.submit if notifier else None
+        )
+        # Трекеры одной сети делят общее хранилище обработанных транзакций
+        for tracker in trackers:
+            tracker.load_processed(self.state.dedup(tracker.chain))
+            tracker.ledger = self.state
+            tracker.confirmations = self.confirmations
+            if notifier:
+                tracker.notify = notifier.submit
+        self.load_cursors(self.state.load_cursors())
+        self.scheduler = PollScheduler(trackers, **(intervals or {}))
+        self.wallet_index = self._index_wallets()
+        self.confirmations.restore(self._own_pending(self.state.load_pending()))
+        self.save_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, state=None, notifier=None, intervals: dict = None) -> "TrackerEngine":
+        """Создаёт движок для кошельков из конфигурации (только своего шарда)."""
+        wallets = shard_wallets(load_wallets())
+        if config.TRON_SOURCE == "blocks":
+            # Один сканер блоков обслуживает все TRC20 кошельки
+            trackers = [TronBlockTracker(wallets["trc20"])]
+        else:
+            trackers = [TronTracker(w) for w in wallets["trc20"]]
+        if config.BSC_SOURCE == "rpc":
+            # Один сканер логов обслуживает все BEP20 кошельки
+            trackers.append(BscRpcTracker(wallets["bep20"]))
+        else:
+            trackers += [BscTracker(w) for w in wallets["bep20"]]
+        return cls(trackers, state=state, notifier=notifier, intervals=intervals)
+
+    def _call(self, tracker, method: str, *args) -> int:
+        """Вызывает метод трекера, удерживая слот его провайдера."""
+        slot = self.slots.get(tracker.provider)
+        if slot is None:
+            return getattr(tracker, method)(*args)
+        with slot:
+            return getattr(tracker, method)(*args)
+
+    def _fan_out(self, method: str, *args) -> int:
+        """Запускает метод на всех трекерах и суммирует результаты."""
+        futures = [
+            self.executor.submit(self._call, tracker, method, *args)
+            for tracker in self.trackers
+        ]
+        total = 0
+        for tracker, future in zip(self.trackers, futures):
+            try:
+                total += future.result() or 0
+            except Exception as e:
+                print(f"[{tracker.chain.upper()}] Ошибка опроса {tracker.wallet}: {e}")
+        return total
+
+    def _own_pending(self, items: list) -> list:
+        """
+        Ожидающие переводы кошельков этого шарда: состояние, скопированное
+        из общего, содержит ожидающие переводы всех шардов.
+        """
+        if shard_count() <= 1:
+            return items
+        owned = []
+        for item in items:
+            wallet = item["tx"].get("wallet") or ""
+            if (item["chain"], wallet.lower() if item["chain"] == "bsc" else wallet) in self.wallet_index:
+                owned.append(item)
+        return owned
+
+    def _index_wallets(self) -> dict:
+        """Индекс {(сеть, кошелек): трекер} для переводов, пришедших извне."""
+        index = {}
+        for tracker in self.trackers:
+            if isinstance(tracker, BscRpcTracker):
+                wallets = tracker.wallets
+            elif isinstance(tracker, TronBlockTracker):
+                wallets = tracker.index.values()
+            else:
+                wallets = [tracker.wallet]
+            for wallet in wallets:
+                index[(tracker.chain, wallet.lower() if tracker.chain == "bsc" else wallet)] = tracker
+        return index
+
+    def ingest(self, chain: str, rows: list) -> int:
+        """
+        Обрабатывает переводы, присланные индексатором (webhook), тем же
+        путём process_transactions -> уведомление, что и опрос.
+
+        Args:
+            chain: Сеть ("tron" или "bsc")
+            rows: Переводы в формате TronGrid (tron) или BscScan tokentx (bsc)
+
+        Returns:
+            Количество отправленных уведомлений
+        """
+        metrics.record_fetched(chain, len(rows))
+        by_wallet = {}
+        for row in rows:
+            wallet = row.get("to") or ""
+            by_wallet.setdefault(wallet.lower() if chain == "bsc" else wallet, []).append(row)
+
+        total = 0
+        for wallet, wallet_rows in by_wallet.items():
+            tracker = self.wallet_index.get((chain, wallet))
+            if tracker is None:
+                continue  # чужой кошелек или кошелек другого шарда
+            total += tracker.tracker_for(wallet).handle_transfers(wallet_rows)
+        if total:
+            self.save()
+        return total
+
+    def get_processed(self, chain: str):
+        """Возвращает хранилище обработанных транзакций сети."""
+        return self.state.dedup(chain)
+
+    def save(self):
+        """Сохраняет обработанные транзакции, журнал, ожидающие переводы и курсоры."""
+        with self.save_lock:
+            self.state.flush()
+            self.state.save_pending(self.confirmations.to_state())
+            self.state.save_cursors(self.get_cursors())
+
+    def load_cursors(self, cursors: dict):
+        """
+        Загружает курсоры трекеров.
+
+        Args:
+            cursors: Словарь {"сеть:кошелек:контракт": значение}
+        """
+        for tracker in self.trackers:
+            prefix = f"{tracker.chain}:{tracker.wallet}:"
+            tracker.load_cursors({
+                key[len(prefix):]: value
+                for key, value in cursors.items()
+                if key.startswith(prefix)
+            })
+
+    def get_cursors(self) -> dict:
+        """Возвращает курсоры всех трекеров в формате load_cursors."""
+        cursors = {}
+        for tracker in self.trackers:
+            for contract, value in tracker.get_cursors().items():
+                cursors[f"{tracker.chain}:{tracker.wallet}:{contract}"] = value
+        return cursors
+
+    def restored_sources(self) -> list:
+        """Источники, для которых из состояния восстановлен курсор."""
+        return [
+            source for source in self.scheduler.sources
+            if source.contract in source.tracker.cursors
+        ]
+
+    def seed(self, force: bool = None) -> int:
+        """
+        Помечает текущие транзакции обработанными без уведомлений.
+        При тёплом старте (WARM_START) - только у источников без курсора.
+        """
+        force = not config.WARM_START if force is None else force
+        return self._fan_out("seed", force)
+
+    def catch_up(self, sources: list) -> int:
+        """
+        Догоняет переводы, пришедшие, пока монитор был остановлен:
+        источники параллельно опрашиваются страницами от своих курсоров,
+        пока находят новые переводы (не больше CATCHUP_ROUNDS раундов).
+
+        Returns:
+            Количество отправленных уведомлений
+        """
+        total = 0
+        for _ in range(config.CATCHUP_ROUNDS):
+            if not sources:
+                break
+            futures = [
+                self.executor.submit(self._call, source.tracker, "check_source", source.contract)
+                for source in sources
+            ]
+            next_round = []
+            for source, future in zip(sources, futures):
+                try:
+                    found = future.result() or 0
+                    error = source.tracker.fetch_errors.get(source.contract, False)
+                except Exception as e:
+                    print(f"[{source.tracker.chain.upper()}] Ошибка опроса {source.key}: {e}")
+                    found, error = 0, True
+                total += found
+                self.scheduler.report(source, found, error)
+                if found and not error:
+                    next_round.append(source)
+            sources = next_round
+        return total
+
+    def run_cycle(self) -> int:
+        """
+        Опрашивает источники, время которых наступило по расписанию.
+
+        Returns:
+            Количество отправленных уведомлений
+        """
+        started = time.monotonic()
+        due = self.scheduler.due(started)
+        futures = [
+            self.executor.submit(self._call, source.tracker, "check_source", source.contract)
+            for source in due
+        ]
+
+        total = 0
+        for source, future in zip(due, futures):
+            try:
+                found = future.result() or 0
+                error = source.tracker.fetch_errors.get(source.contract, False)
+            except Exception as e:
+                print(f"[{source.tracker.chain.upper()}] Ошибка опроса {source.key}: {e}")
+                metrics.event("poll_error", source=source.key, error=str(e))
+                found, error = 0, True
+            total += found
+            self.scheduler.report(source, found, error)
+
+        # Одна проверка головы цепи на сеть для всех ожидающих переводов
+        if len(self.confirmations):
+            total += self.confirmations.check()
+
+        self.last_cycle_duration = time.monotonic() - started
+        self.last_stats = self.scheduler.stats(polled=len(due))
+        self.last_stats["duration"] = self.last_cycle_duration
+        if metrics.enabled:
+            self._report_metrics(len(due), total)
+        return total
+
+    def _report_metrics(self, polled: int, notified: int):
+        """Метрики цикла: длительность, размер хранилищ и очереди."""
+        metrics.observe("cycle_seconds", self.last_cycle_duration)
+        for chain in {tracker.chain for tracker in self.trackers}:
+            metrics.set("dedup_entries", len(self.state.dedup(chain)), chain=chain)
+        if self.notifier:
+            metrics.set("notify_queue_depth", self.notifier.depth())
+        for name, value in transport.cache.stats().items():
+            if name != "hit_ratio":
+                metrics.set("response_cache", value, result=name)
+        metrics.event("cycle", polled=polled, notified=notified,
+                      duration=round(self.last_cycle_duration, 3),
+                      pending=len(self.confirmations))
+
+    def next_wakeup(self) -> float:
+        """Сколько секунд ждать до следующего цикла."""
+        wakeup = self.scheduler.next_wakeup()
+        if len(self.confirmations):
+            return min(wakeup, config.CONFIRM_CHECK_INTERVAL)
+        return wakeup
+
+    def shutdown(self):
+        """Останавливает пул потоков, досылает уведомления и закрывает хранилище."""
+        self.executor.shutdown(wait=True)
+        if self.notifier:
+            self.notifier.close()
+        self.state.close()
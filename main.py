@@ -4,40 +4,28 @@ Crypto Wallet Tracker Bot
 Отслеживает входящие USDT/BUSDT транзакции и отправляет уведомления в Telegram.
 """
 
-import json
 import time
 import sys
-from pathlib import Path
 
 import config
-from tron_tracker import TronTracker
-from bsc_tracker import BscTracker
+import transport
+from engine import TrackerEngine, load_wallets
+from metrics import metrics
+from notifier import NotificationQueue
+from providers import ProviderPool, pools
+from ratelimit import RateLimiter, limiter
+from response_cache import ResponseCache
+from routing import router
+from scheduler import PollScheduler
+from sharding import run_coordinator, shard_count, shard_index, shard_wallets
+from state_store import StateLocked, lock_state, open_state
+from webhook import WebhookServer, reconcile_intervals
 
 
-def load_state() -> dict:
-    """Загружает состояние из файла."""
-    state_file = Path(config.STATE_FILE)
-    
-    if state_file.exists():
-        try:
-            with open(state_file, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Ошибка загрузки состояния: {e}")
-    
-    return {"tron": [], "bsc": []}
-
-
-def save_state(tron_txs: set, bsc_txs: set):
-    """Сохраняет состояние в файл."""
-    state = {
-        "tron": list(tron_txs),
-        "bsc": list(bsc_txs)
-    }
-    
+def save_state(engine: TrackerEngine):
+    """Сохраняет состояние: обработанные транзакции, журнал и курсоры."""
     try:
-        with open(config.STATE_FILE, "w") as f:
-            json.dump(state, f, indent=2)
+        engine.save()
     except Exception as e:
         print(f"Ошибка сохранения состояния: {e}")
 
@@ -47,14 +35,35 @@ def print_banner():
     print("=" * 60)
     print("       CRYPTO WALLET TRACKER BOT")
     print("=" * 60)
+    wallets = load_wallets()
     print(f"\nОтслеживаемые кошельки:")
-    print(f"  TRC20: {config.TRC20_WALLET}")
-    print(f"  BEP20: {config.BEP20_WALLET}")
+    for network, label in (("trc20", "TRC20"), ("bep20", "BEP20")):
+        shown = ", ".join(wallets[network][:3])
+        extra = len(wallets[network]) - 3
+        if extra > 0:
+            shown += f" (+{extra})"
+        print(f"  {label}: {shown}")
     print(f"\nМинимальная сумма для уведомления: {config.MIN_AMOUNT} USDT")
-    print(f"Интервал проверки: {config.CHECK_INTERVAL} сек")
-    print(f"BscScan API Key: {'установлен' if config.BSCSCAN_API_KEY else 'НЕТ'}")
+    print(f"Интервал проверки: {config.CHECK_INTERVAL} сек "
+          f"(адаптивно {config.POLL_MIN_INTERVAL:.0f}-{config.POLL_MAX_INTERVAL:.0f} сек)")
+    bscscan_keys = limiter.key_count("bscscan")
+    print(f"BscScan API Key: {f'установлен ({bscscan_keys} шт.)' if bscscan_keys else 'НЕТ'}")
+    print(f"Хранилище состояния: {config.STATE_BACKEND}")
+    if shard_count() > 1:
+        owned = shard_wallets(wallets)
+        print(f"Шард: {shard_index()} из {shard_count()} "
+              f"(TRC20 {len(owned['trc20'])}, BEP20 {len(owned['bep20'])})")
+    if config.METRICS_PORT:
+        print(f"Метрики: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    print(f"Подтверждения: TRON {config.TRON_CONFIRMATIONS}, BSC {config.BSC_CONFIRMATIONS} блоков")
+    if config.WEBHOOK_PORT:
+        print(f"Webhook: http://{config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}/webhook/{{tron,bsc}}, "
+              f"сверка опросом раз в {config.WEBHOOK_RECONCILE_INTERVAL:.0f} сек")
     chat_id_display = config.TELEGRAM_CHAT_ID or "НЕ УСТАНОВЛЕН"
     print(f"\nChat ID: {chat_id_display}")
+    if config.ROUTES_FILE:
+        print(f"Маршруты уведомлений: {config.ROUTES_FILE} "
+              f"(проверка изменений раз в {config.ROUTES_RELOAD_INTERVAL:g} сек)")
     
     print("\n" + "=" * 60)
 
@@ -64,63 +73,86 @@ def check_config():
     missing = []
     if not config.TELEGRAM_BOT_TOKEN:
         missing.append("TELEGRAM_BOT_TOKEN")
-    if not config.TELEGRAM_CHAT_ID:
+    if not config.TELEGRAM_CHAT_ID and not config.ROUTES_FILE:
         missing.append("TELEGRAM_CHAT_ID")
-    if not config.TRC20_WALLET:
+    wallets = load_wallets()
+    if not wallets["trc20"]:
         missing.append("TRC20_WALLET")
-    if not config.BEP20_WALLET:
+    if not wallets["bep20"]:
         missing.append("BEP20_WALLET")
     
+    if config.WEBHOOK_PORT and not config.WEBHOOK_SECRET:
+        missing.append("WEBHOOK_SECRET")
+    
     if missing:
         print(f"\n❌ Не установлены переменные: {', '.join(missing)}")
         print("Добавьте их в Railway Variables")
         sys.exit(1)
 
 
-def run_monitor():
-    """Основной цикл мониторинга."""
+def run_monitor(notifier=None):
+    """
+    Основной цикл мониторинга.
+    
+    Args:
+        notifier: Очередь уведомлений (у процесса-шарда - канал к координатору)
+    """
     print_banner()
     check_config()
     
-    # Инициализация трекеров
-    tron_tracker = TronTracker()
-    bsc_tracker = BscTracker()
+    metrics.start()
+    
+    # Маршруты загружаются сразу, чтобы ошибки в файле были видны при старте
+    if router.enabled:
+        router.reload()
+    
+    # Второй процесс с тем же состоянием перезаписал бы итоги и журнал
+    try:
+        state_lock = lock_state()
+    except StateLocked as e:
+        print(f"\n❌ Состояние уже используется: {e}")
+        sys.exit(1)
     
-    # Загрузка сохранённого состояния
-    state = load_state()
-    tron_tracker.load_processed(set(state.get("tron", [])))
-    bsc_tracker.load_processed(set(state.get("bsc", [])))
+    # Инициализация трекеров и загрузка сохранённого состояния
+    if notifier is None and config.NOTIFY_QUEUE:
+        notifier = NotificationQueue()
+    # Переводы приходят через webhook, опрос остаётся редкой сверкой
+    intervals = reconcile_intervals() if config.WEBHOOK_PORT else None
+    engine = TrackerEngine.from_config(open_state(), notifier, intervals)
+    webhook = None
     
     print(f"\nЗагружено из кэша:")
-    print(f"  TRON транзакций: {len(tron_tracker.get_processed())}")
-    print(f"  BSC транзакций: {len(bsc_tracker.get_processed())}")
-    
-    # Первый запуск - инициализируем без уведомлений
-    print("\nИнициализация (первичная загрузка транзакций)...")
-    
-    # Загружаем текущие транзакции чтобы не спамить уведомлениями о старых
-    # Используем process_transactions для правильной фильтрации
-    tron_txs = tron_tracker.get_trc20_transfers()
-    for tx in tron_txs:
-        tx_id = tx.get("transaction_id")
-        if tx_id:
-            tron_tracker.processed_txs.add(tx_id)
-    
-    bsc_usdt_txs = bsc_tracker.get_token_transfers(bsc_tracker.usdt_contract)
-    bsc_busdt_txs = bsc_tracker.get_token_transfers(bsc_tracker.busdt_contract)
-    # Обрабатываем через process_transactions, но не отправляем уведомления
-    # Это правильно помечает транзакции как обработанные с учетом всех фильтров
-    for tx in bsc_usdt_txs + bsc_busdt_txs:
-        tx_hash = tx.get("hash")
-        if tx_hash:
-            bsc_tracker.processed_txs.add(tx_hash)
+    print(f"  TRON транзакций: {len(engine.get_processed('tron'))}")
+    print(f"  BSC транзакций: {len(engine.get_processed('bsc'))}")
+    
+    # Источники с сохранёнными курсорами догоняются, а не помечаются заново
+    restored = engine.restored_sources() if config.WARM_START else []
+    print(f"\nИнициализация (первичная загрузка транзакций)...")
+    if restored:
+        print(f"  Курсоры восстановлены: {len(restored)} из {len(engine.scheduler.sources)} источников")
+    
+    # Загружаем текущие транзакции источников без курсора,
+    # чтобы не спамить уведомлениями о старых
+    engine.seed()
     
     # Сохраняем начальное состояние
-    save_state(tron_tracker.get_processed(), bsc_tracker.get_processed())
+    save_state(engine)
     
     print(f"Инициализировано транзакций:")
-    print(f"  TRON: {len(tron_tracker.get_processed())}")
-    print(f"  BSC: {len(bsc_tracker.get_processed())}")
+    print(f"  TRON: {len(engine.get_processed('tron'))}")
+    print(f"  BSC: {len(engine.get_processed('bsc'))}")
+    
+    if restored:
+        # Переводы, пришедшие во время простоя, уведомляются, а не теряются
+        print(f"\nДогоняем переводы от сохранённых курсоров...")
+        caught_up = engine.catch_up(restored)
+        print(f"Пропущенных за время простоя переводов: {caught_up}")
+        save_state(engine)
+    
+    if config.WEBHOOK_PORT:
+        webhook = WebhookServer(engine.ingest)
+        webhook.start()
+        print(f"\nWebhook принимает переводы на порту {webhook.port}")
     
     print(f"\n🚀 Мониторинг запущен! Нажмите Ctrl+C для остановки.\n")
     
@@ -130,37 +162,59 @@ def run_monitor():
         while True:
             check_count += 1
             
-            # Проверяем TRON
-            tron_notifications = tron_tracker.check_and_notify()
-            
-            # Небольшая пауза между API вызовами
-            time.sleep(1)
-            
-            # Проверяем BSC
-            bsc_notifications = bsc_tracker.check_and_notify()
-            
-            total = tron_notifications + bsc_notifications
+            # Опрашиваем параллельно источники, чей срок наступил
+            total = engine.run_cycle()
             
             if total > 0:
-                print(f"[{check_count}] Отправлено уведомлений: {total}")
+                action = "Поставлено в очередь" if notifier else "Отправлено"
+                print(f"[{check_count}] {action} уведомлений: {total}")
                 # Сохраняем состояние после новых транзакций
-                save_state(tron_tracker.get_processed(), bsc_tracker.get_processed())
+                save_state(engine)
             else:
                 # Периодически показываем что бот работает
                 if check_count % 10 == 0:
                     print(f"[{check_count}] Проверка... новых транзакций нет")
             
+            if check_count % 10 == 0:
+                stats = PollScheduler.format_stats(engine.last_stats)
+                print(f"[{check_count}] Планировщик: {stats}, цикл {engine.last_cycle_duration:.1f} сек")
+                print(f"[{check_count}] Лимиты API: {RateLimiter.format_stats(limiter.stats())}")
+                if transport.cache.enabled:
+                    print(f"[{check_count}] Кэш API: {ResponseCache.format_stats(transport.cache.stats())}")
+                for pool in pools():
+                    if len(pool.endpoints) > 1:
+                        print(f"[{check_count}] Адреса {pool.name}: {ProviderPool.format_stats(pool.stats())}")
+                if webhook:
+                    print(f"[{check_count}] Webhook: {WebhookServer.format_stats(webhook.stats())}")
+                confirmations = engine.confirmations.stats()
+                if confirmations["pending"] or confirmations["reorged"]:
+                    print(f"[{check_count}] Подтверждения: ожидают {confirmations['pending']}, "
+                          f"подтверждено {confirmations['confirmed']}, "
+                          f"снято реорганизацией {confirmations['reorged']}")
+            
             # Периодическое сохранение состояния
             if check_count % 20 == 0:
-                save_state(tron_tracker.get_processed(), bsc_tracker.get_processed())
+                save_state(engine)
             
-            time.sleep(config.CHECK_INTERVAL)
+            # Спим до ближайшего опроса по расписанию
+            time.sleep(engine.next_wakeup())
             
     except KeyboardInterrupt:
         print("\n\nОстановка мониторинга...")
-        save_state(tron_tracker.get_processed(), bsc_tracker.get_processed())
+        save_state(engine)
         print("Состояние сохранено. До свидания!")
+    finally:
+        if webhook:
+            webhook.close()
+        engine.shutdown()
+        transport.close_all()
+        metrics.close()
+        state_lock.close()
 
 
 if __name__ == "__main__":
-    run_monitor()
+    if config.SHARD_PROCESSES > 1:
+        check_config()
+        run_coordinator()
+    else:
+        run_monitor()
@@ -0,0 +1,210 @@
+"""
+Метрики монитора: счётчики, значения и гистограммы с метками.
+Отдаются в формате Prometheus на локальном /metrics (METRICS_PORT) и,
+по желанию, пишутся событиями JSON построчно (METRICS_LOG).
+Пока метрики выключены, каждый вызов - одна проверка флага.
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+PREFIX = "tracker_"
+# Границы гистограмм задержек (сек)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Границы задержки обнаружения перевода (сек)
+LAG_BUCKETS = (1, 3, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+HELP = {
+    "api_requests_total": "Запросы к API по провайдеру, методу и статусу",
+    "api_request_seconds": "Длительность запросов к API",
+    "transfers_fetched_total": "Строки переводов, полученные от API (до фильтра)",
+    "transfers_new_total": "Новые переводы после фильтра и дедупликации",
+    "detection_lag_seconds": "Время от блока перевода до его обнаружения",
+    "dedup_entries": "Записей в хранилище обработанных транзакций",
+    "notification_send_seconds": "Отправка уведомления с повторами",
+    "notifications_total": "Уведомления по результату",
+    "notify_queue_depth": "Уведомлений в очереди",
+    "cycle_seconds": "Длительность цикла опроса",
+    "response_cache": "Счётчики кэша ответов API",
+    "provider_hedged_total": "Запросы, продублированные на второй адрес после p95",
+    "provider_hedge_wins_total": "Продублированные запросы, где первым ответил второй адрес",
+    "provider_failovers_total": "Переходы на следующий адрес после ошибки",
+    "provider_breaker_open_total": "Срабатывания предохранителя адреса",
+    "webhook_requests_total": "Запросы к webhook по сети и статусу",
+    "webhook_events_total": "Переводы, принятые через webhook",
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Накопительная гистограмма с фиксированными границами."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Реестр метрик."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.counters = {}  # имя -> {метки: значение}
+        self.gauges = {}
+        self.histograms = {}  # имя -> {метки: Histogram}
+        self.sink = None
+        self.lock = threading.Lock()
+        self.server = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличивает счётчик."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Задаёт текущее значение."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """Добавляет наблюдение в гистограмму."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_fetched(self, chain: str, fetched: int):
+        """Строки, полученные от API, включая отброшенные фильтром при разборе."""
+        if self.enabled:
+            self.inc("transfers_fetched_total", fetched, chain=chain)
+
+    def record_transfers(self, chain: str, transfers: list):
+        """Новые переводы опроса и задержка их обнаружения."""
+        if not self.enabled:
+            return
+        self.inc("transfers_new_total", len(transfers), chain=chain)
+        now = time.time()
+        for transfer in transfers:
+            if transfer.timestamp:
+                self.observe("detection_lag_seconds", max(0.0, now - transfer.timestamp),
+                             LAG_BUCKETS, chain=chain)
+
+    def event(self, name: str, **fields):
+        """Пишет событие в JSON журнал, если он задан."""
+        if self.sink is None:
+            return
+        record = json.dumps({"ts": round(time.time(), 3), "event": name, **fields},
+                            ensure_ascii=False, default=str)
+        with self.lock:
+            self.sink.write(record + "\n")
+            self.sink.flush()
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus."""
+        lines = []
+        with self.lock:
+            for kind, store in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(store.items()):
+                    full = PREFIX + name
+                    lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{full}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                full = PREFIX + name
+                lines.append(f"# HELP {full} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{full}_bucket{_format_labels(key, le)} {cumulative}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {histogram.total}")
+                    lines.append(f"{full}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def start(self, port: int = None, log_path: str = None):
+        """
+        Включает метрики: HTTP сервер /metrics и JSON журнал.
+
+        Args:
+            port: Порт /metrics (0 - без сервера)
+            log_path: Файл JSON журнала (пусто - без журнала)
+        """
+        port = config.METRICS_PORT if port is None else port
+        log_path = config.METRICS_LOG if log_path is None else log_path
+        if not port and not log_path:
+            return
+        self.enabled = True
+        if log_path:
+            self.sink = open(log_path, "a", encoding="utf-8")
+        if port:
+            registry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def log_message(self, *args):
+                    pass
+
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    body = registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self.server = ThreadingHTTPServer((config.METRICS_HOST, port), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics",
+                             daemon=True).start()
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+        if self.sink:
+            self.sink.close()
+            self.sink = None
+
+
+metrics = Metrics()
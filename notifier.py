@@ -0,0 +1,163 @@
+"""
+Очередь уведомлений Telegram.
+Трекеры кладут уведомления в очередь и сразу продолжают опрос, а фоновый
+поток склеивает близкие по времени уведомления в одно сообщение и
+отправляет их с учётом лимитов Telegram на чат. Сообщение, не
+отправленное за NOTIFY_MAX_RETRIES попыток, возвращается в очередь через
+NOTIFY_REQUEUE_DELAY и теряется только при остановке.
+"""
+
+import queue
+import threading
+import time
+
+import config
+from metrics import metrics
+from ratelimit import TokenBucket
+from telegram_bot import send_message, format_notification
+
+# Лимит длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class NotificationQueue:
+    """Фоновая отправка уведомлений со склейкой и ограничением частоты."""
+
+    def __init__(self, window: float = None, rate: float = None, burst: float = None,
+                 max_retries: int = None, sender=send_message, requeue_delay: float = None):
+        self.window = config.NOTIFY_COALESCE_WINDOW if window is None else window
+        self.rate = rate or config.TELEGRAM_CHAT_RATE
+        self.burst = burst or config.TELEGRAM_CHAT_BURST
+        self.max_retries = config.NOTIFY_MAX_RETRIES if max_retries is None else max_retries
+        self.requeue_delay = (config.NOTIFY_REQUEUE_DELAY if requeue_delay is None
+                              else requeue_delay)
+        self.sender = sender
+        self.queue = queue.Queue()
+        self.retry = []  # (срок повтора, chat_id, thread_id, текст); только поток очереди
+        self.buckets = {}
+        self.sent = 0
+        self.failed = 0
+        self.requeued = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, amount: float, token_type: str, chat_id=None, thread_id=None) -> bool:
+        """
+        Ставит уведомление в очередь.
+
+        Returns:
+            True (уведомление принято и будет отправлено, пока очередь работает)
+        """
+        self.queue.put((chat_id, thread_id, format_notification(amount, token_type)))
+        return True
+
+    def depth(self) -> int:
+        """Количество уведомлений, ожидающих отправки (с отложенными повторами)."""
+        return self.queue.qsize() + len(self.retry)
+
+    def _due_retries(self) -> list:
+        """Отложенные сообщения, срок повтора которых наступил (при остановке - все)."""
+        now = time.monotonic()
+        stopping = self._stop.is_set()
+        due = [item[1:] for item in self.retry if stopping or item[0] <= now]
+        if due:
+            self.retry = [item for item in self.retry if not (stopping or item[0] <= now)]
+        return due
+
+    def _collect(self) -> dict:
+        """
+        Забирает уведомления, пришедшие в течение окна склейки.
+
+        Returns:
+            Словарь {(chat_id, thread_id): [строки]}
+        """
+        batch = self._due_retries()
+        try:
+            batch.append(self.queue.get(timeout=0 if batch else 0.5))
+        except queue.Empty:
+            if not batch:
+                return {}
+
+        deadline = time.monotonic() + self.window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        groups = {}
+        for chat_id, thread_id, text in batch:
+            groups.setdefault((chat_id, thread_id), []).append(text)
+        return groups
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.buckets[chat_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _deliver(self, chat_id, thread_id, text: str) -> bool:
+        """Отправляет сообщение с повторами и экспоненциальной задержкой."""
+        bucket = self._bucket(chat_id)
+        backoff = 1.0
+        for _ in range(self.max_retries + 1):
+            bucket.acquire()
+            ok, retry_after = self.sender(text, chat_id, thread_id)
+            if ok:
+                return True
+            if retry_after:
+                # Telegram сам сообщает, сколько ждать
+                bucket.pause(retry_after)
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+        return False
+
+    @staticmethod
+    def _split(lines: list) -> list:
+        """Разбивает строки на сообщения не длиннее лимита Telegram."""
+        messages = []
+        current = ""
+        for line in lines:
+            if current and len(current) + 1 + len(line) > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            messages.append(current)
+        return messages
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty() and not self.retry):
+            for (chat_id, thread_id), lines in self._collect().items():
+                for text in self._split(lines):
+                    started = time.monotonic()
+                    delivered = self._deliver(chat_id, thread_id, text)
+                    metrics.observe("notification_send_seconds", time.monotonic() - started)
+                    if delivered:
+                        result = "sent"
+                        self.sent += 1
+                    elif not self._stop.is_set():
+                        # Telegram недоступен дольше всех попыток: повторим позже, а не теряем
+                        result = "requeued"
+                        self.requeued += 1
+                        self.retry.append((time.monotonic() + self.requeue_delay,
+                                           chat_id, thread_id, text))
+                        print(f"⚠️ Уведомление не доставлено, повтор через "
+                              f"{self.requeue_delay:.0f} сек: {text}")
+                    else:
+                        result = "failed"
+                        self.failed += 1
+                        print(f"❌ Уведомление не доставлено: {text}")
+                    metrics.inc("notifications_total", len(text.split("\n")), result=result)
+
+    def close(self, timeout: float = 30):
+        """Отправляет оставшиеся уведомления и останавливает поток."""
+        self._stop.set()
+        self._thread.join(timeout)
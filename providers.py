@@ -0,0 +1,298 @@
+"""
+Пулы взаимозаменяемых адресов API одного провайдера.
+У каждого адреса свой предохранитель (после BREAKER_THRESHOLD ошибок подряд
+адрес выключается на BREAKER_COOLDOWN сек, затем пропускает один пробный
+запрос), запросы распределяются с весом, обратным средней задержке.
+Если ответ не пришёл за p95 задержки пула, тот же запрос уходит на второй
+адрес (hedged request) и берётся первый успешный ответ. Ошибка или отказ
+адреса сразу переводит запрос на следующий.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+from metrics import metrics
+
+# Сглаживание средней задержки адреса
+LATENCY_ALPHA = 0.2
+# Задержка адреса без замеров (сек) - новые адреса тоже получают запросы
+DEFAULT_LATENCY = 0.5
+# Сколько последних задержек пула хранится для p95
+LATENCY_WINDOW = 200
+
+_pools = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _split_urls(raw: str) -> list:
+    return [url.strip().rstrip("/") for url in (raw or "").split(",") if url.strip()]
+
+
+def default_failed(response) -> bool:
+    """Ответ, после которого стоит спросить другой адрес: 5xx или 429."""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class Endpoint:
+    """Адрес API с предохранителем и средней задержкой."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = None  # сглаженная задержка успешных ответов (сек)
+        self.failures = 0  # ошибок подряд
+        self.opened_at = None  # когда сработал предохранитель
+        self.trial = False  # идёт пробный запрос после паузы
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.trial else "open"
+
+    def available(self, now: float) -> bool:
+        """Можно ли отправить запрос; после паузы пропускает один пробный."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if now - self.opened_at < config.BREAKER_COOLDOWN:
+                return False
+            # Следующая проба - не раньше чем через паузу
+            self.opened_at = now
+            self.trial = True
+            return True
+
+    def weight(self) -> float:
+        return 1.0 / max(self.latency or DEFAULT_LATENCY, 0.001)
+
+    def success(self, elapsed: float):
+        with self.lock:
+            self.requests += 1
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_ALPHA * (elapsed - self.latency)
+
+    def failure(self) -> bool:
+        """
+        Учитывает ошибку.
+
+        Returns:
+            True, если предохранитель только что сработал
+        """
+        with self.lock:
+            self.requests += 1
+            self.errors += 1
+            self.failures += 1
+            if self.trial or (self.opened_at is None
+                              and self.failures >= config.BREAKER_THRESHOLD):
+                self.opened_at = time.monotonic()
+                self.trial = False
+                return True
+            return False
+
+
+class ProviderPool:
+    """Взаимозаменяемые адреса одного API."""
+
+    def __init__(self, name: str, urls: list, hedge: bool = None):
+        self.name = name
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.hedge = config.PROVIDER_HEDGE if hedge is None else hedge
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def primary(self) -> str:
+        return self.endpoints[0].url
+
+    def candidates(self) -> list:
+        """
+        Порядок адресов для запроса: сначала адрес после паузы (пробный
+        запрос), затем доступные в случайном порядке с весом по задержке.
+        Если все выключены, пробуется тот, чья пауза кончится раньше.
+        """
+        now = time.monotonic()
+        available = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not available:
+            return [min(self.endpoints, key=lambda endpoint: endpoint.opened_at or 0)]
+        ordered = [endpoint for endpoint in available if endpoint.trial]
+        available = [endpoint for endpoint in available if not endpoint.trial]
+        while available:
+            (endpoint,) = random.choices(available, [e.weight() for e in available])
+            available.remove(endpoint)
+            ordered.append(endpoint)
+        return ordered
+
+    def hedge_delay(self):
+        """p95 задержки пула или None, пока замеров мало или hedging выключен."""
+        if not self.hedge or len(self.endpoints) < 2:
+            return None
+        with self.lock:
+            if len(self.samples) < config.HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return max(config.HEDGE_MIN_DELAY, ordered[int(len(ordered) * 0.95) - 1])
+
+    def _call(self, endpoint: Endpoint, call, failed):
+        """Запрос к одному адресу с учётом результата в предохранителе."""
+        started = time.perf_counter()
+        try:
+            response = call(endpoint.url)
+            bad = failed(response)
+        except Exception:
+            self._failed(endpoint)
+            raise
+        if bad:
+            self._failed(endpoint)
+        else:
+            elapsed = time.perf_counter() - started
+            endpoint.success(elapsed)
+            with self.lock:
+                self.samples.append(elapsed)
+        return response
+
+    def _failed(self, endpoint: Endpoint):
+        if endpoint.failure():
+            print(f"[{self.name}] Адрес {endpoint.url} выключен на {config.BREAKER_COOLDOWN:.0f} сек")
+            metrics.inc("provider_breaker_open_total", provider=self.name)
+
+    def request(self, call, failed=None):
+        """
+        Выполняет запрос на лучшем адресе с переходом на следующий при
+        ошибке и дублированием после p95 задержки.
+
+        Args:
+            call: Функция (базовый адрес) -> ответ
+            failed: Проверка ответа, после которого нужен другой адрес
+                (по умолчанию 5xx и 429)
+
+        Returns:
+            Первый успешный ответ или последний неуспешный
+        """
+        failed = failed or default_failed
+        candidates = self.candidates()
+        if len(self.endpoints) == 1:
+            return self._call(candidates[0], call, failed)
+
+        futures = {}  # future -> номер адреса в candidates
+        last_error = last_response = None
+
+        def launch():
+            position = len(futures)
+            future = _pool_executor().submit(self._call, candidates[position], call, failed)
+            futures[future] = position
+            return future
+
+        pending = {launch()}
+        hedged = False
+        while pending:
+            # Дублируется не больше одного раза на запрос
+            can_hedge = not hedged and len(futures) < len(candidates)
+            delay = self.hedge_delay() if can_hedge else None
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Ответа нет дольше p95 - дублируем запрос на следующий адрес
+                hedged = True
+                self._count("hedged")
+                pending.add(launch())
+                continue
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if not failed(response):
+                    if futures[future] > 0 and self._hedging(futures):
+                        self._count("hedge_wins")
+                    return response
+                last_response = response
+            if not pending and len(futures) < len(candidates):
+                self._count("failovers")
+                pending.add(launch())
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    @staticmethod
+    def _hedging(futures: dict) -> bool:
+        """Первый адрес ещё не ответил - выиграл дублирующий запрос."""
+        return any(not future.done() for future, position in futures.items() if position == 0)
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+        metrics.inc(f"provider_{name}_total", provider=self.name)
+
+    def stats(self) -> dict:
+        """Счётчики пула и состояние адресов."""
+        with self.lock:
+            stats = dict(self.counters)
+        stats["endpoints"] = [
+            {"url": e.url, "state": e.state, "latency": e.latency,
+             "requests": e.requests, "errors": e.errors}
+            for e in self.endpoints
+        ]
+        return stats
+
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        endpoints = ", ".join(
+            f"{e['url']} {e['state']}"
+            + (f" {e['latency'] * 1000:.0f}мс" if e["latency"] is not None else "")
+            + f" ({e['errors']}/{e['requests']} ошибок)"
+            for e in stats["endpoints"]
+        )
+        return (f"дублировано {stats['hedged']} (выиграло {stats['hedge_wins']}), "
+                f"переключений {stats['failovers']}; {endpoints}")
+
+
+def _pool_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(4, config.POLL_WORKERS * 2),
+                                               thread_name_prefix="provider")
+    return _executor
+
+
+def get_pool(name: str, primary: str, extra: str = "") -> ProviderPool:
+    """
+    Общий пул адресов провайдера: трекеры с одинаковыми адресами делят
+    предохранители и замеры задержки.
+
+    Args:
+        name: Имя провайдера ('trongrid', 'bscscan', 'bsc_rpc', 'tron_node')
+        primary: Основной адрес
+        extra: Дополнительные адреса через запятую
+    """
+    urls = []
+    for url in [primary.rstrip("/")] + _split_urls(extra):
+        if url not in urls:
+            urls.append(url)
+    key = (name, tuple(urls))
+    pool = _pools.get(key)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ProviderPool(name, urls)
+    return pool
+
+
+def pools() -> list:
+    """Все созданные пулы."""
+    return list(_pools.values())
@@ -0,0 +1,208 @@
+"""
+Ограничение частоты запросов.
+"""
+
+import threading
+import time
+
+import config
+
+
+def retry_after(response):
+    """Пауза из заголовка Retry-After в секундах (None, если его нет)."""
+    value = (getattr(response, "headers", None) or {}).get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None  # HTTP-дата вместо секунд
+
+
+class TokenBucket:
+    """Потокобезопасное ведро токенов: rate токенов в секунду, не больше burst."""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Пытается забрать токены без ожидания.
+
+        Returns:
+            0 если токены получены, иначе сколько секунд ждать
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Ждёт, пока появятся токены, и забирает их.
+
+        Returns:
+            Сколько секунд пришлось ждать
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float):
+        """Опустошает ведро так, чтобы следующий токен появился через seconds."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Общий ограничитель запросов по провайдерам.
+
+    У каждого API ключа провайдера своё ведро токенов, ключи выдаются
+    по кругу. Считаются запросы, ожидания лимита и отказы провайдера.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # провайдер -> [(ключ, ведро)]
+        self.positions = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def configure(self, provider: str, rate: float, burst: float = 1, keys: list = None):
+        """
+        Задаёт лимит провайдера.
+
+        Args:
+            provider: Имя провайдера
+            rate: Запросов в секунду на один ключ
+            burst: Допустимая пачка запросов на ключ
+            keys: API ключи; пустой список - запросы без ключа
+        """
+        keys = [k for k in (keys or []) if k] or [None]
+        with self.lock:
+            self.buckets[provider] = [(key, TokenBucket(rate, burst)) for key in keys]
+            self.positions[provider] = 0
+            self.counters[provider] = {
+                "requests": 0, "throttled": 0, "rejected": 0, "wait_seconds": 0.0,
+            }
+
+    def scale(self, factor: float):
+        """Меняет лимиты всех провайдеров в factor раз (доля процесса-шарда)."""
+        with self.lock:
+            for entries in self.buckets.values():
+                for _, bucket in entries:
+                    bucket.rate *= factor
+
+    def capacity(self, provider: str) -> float:
+        """Суммарное число запросов в секунду по всем ключам провайдера."""
+        return sum(bucket.rate for _, bucket in self.buckets.get(provider, []))
+
+    def key_count(self, provider: str) -> int:
+        """Количество API ключей провайдера."""
+        return sum(1 for key, _ in self.buckets.get(provider, []) if key)
+
+    def acquire(self, provider: str):
+        """
+        Ждёт разрешения на запрос и выбирает ключ.
+
+        Returns:
+            API ключ для запроса (None - без ключа)
+        """
+        entries = self.buckets.get(provider)
+        if not entries:
+            return None
+
+        with self.lock:
+            start = self.positions[provider]
+            self.positions[provider] = (start + 1) % len(entries)
+
+        # Сначала ищем ключ со свободным токеном, начиная с очередного по кругу
+        best = None
+        for i in range(len(entries)):
+            key, bucket = entries[(start + i) % len(entries)]
+            delay = bucket.try_acquire()
+            if delay <= 0:
+                self._count(provider, 0.0)
+                return key
+            if best is None or delay < best[0]:
+                best = (delay, key, bucket)
+
+        _, key, bucket = best
+        waited = bucket.acquire()
+        self._count(provider, waited)
+        return key
+
+    def reject(self, provider: str, key=None, retry_after: float = None):
+        """Учитывает отказ провайдера по лимиту и притормаживает ключ."""
+        with self.lock:
+            counters = self.counters.get(provider)
+            if counters is not None:
+                counters["rejected"] += 1
+        for entry_key, bucket in self.buckets.get(provider, []):
+            if entry_key == key:
+                bucket.pause(retry_after or 1.0 / bucket.rate)
+
+    def _count(self, provider: str, waited: float):
+        with self.lock:
+            counters = self.counters[provider]
+            counters["requests"] += 1
+            if waited > 0:
+                counters["throttled"] += 1
+                counters["wait_seconds"] += waited
+
+    def stats(self) -> dict:
+        """Счётчики по провайдерам."""
+        with self.lock:
+            return {provider: dict(c) for provider, c in self.counters.items()}
+
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        return ", ".join(
+            f"{provider}: {c['requests']} запр., ожиданий {c['throttled']}, отказов {c['rejected']}"
+            for provider, c in stats.items()
+        )
+
+
+def _split_keys(*values) -> list:
+    keys = []
+    for value in values:
+        for key in (value or "").replace(";", ",").split(","):
+            key = key.strip()
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def build_limiter() -> RateLimiter:
+    """Создаёт ограничитель по настройкам из config."""
+    rate_limiter = RateLimiter()
+
+    bscscan_keys = _split_keys(config.BSCSCAN_API_KEY, config.BSCSCAN_API_KEYS)
+    # Без ключа BscScan допускает 1 запрос в 5 секунд
+    bscscan_rate = config.BSCSCAN_RATE if bscscan_keys else 0.2
+    rate_limiter.configure("bscscan", bscscan_rate, keys=bscscan_keys)
+
+    trongrid_keys = _split_keys(config.TRONGRID_API_KEYS)
+    rate_limiter.configure("trongrid", config.TRONGRID_RATE, keys=trongrid_keys)
+
+    rate_limiter.configure("bsc_rpc", config.BSC_RPC_RATE)
+    rate_limiter.configure("tron_node", config.TRON_NODE_RATE)
+    return rate_limiter
+
+
+limiter = build_limiter()
@@ -0,0 +1,159 @@
+"""
+Кэш ответов API с коротким временем жизни и условными запросами.
+Одинаковые запросы (адрес + параметры без API ключа) в пределах CACHE_TTL
+получают сохранённый ответ, а одновременные одинаковые запросы ждут
+один HTTP вызов. Устаревший ответ с ETag или Last-Modified не удаляется:
+следующий такой же запрос уходит с If-None-Match / If-Modified-Since, и
+на 304 сохранённый ответ используется снова без передачи и разбора тела.
+Размер ограничен CACHE_SIZE, вытесняются давно не использованные ответы.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Параметры, не влияющие на содержимое ответа
+IGNORED_PARAMS = frozenset({"apikey"})
+# Заголовок ответа -> заголовок условного запроса при перепроверке
+VALIDATORS = (("ETag", "If-None-Match"), ("Last-Modified", "If-Modified-Since"))
+
+
+class _Call:
+    """Запрос в полёте, результат которого ждут повторные вызовы."""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """LRU кэш ответов с TTL и объединением одновременных запросов."""
+
+    def __init__(self, ttl: float = None, size: int = None):
+        self.ttl = config.CACHE_TTL if ttl is None else ttl
+        self.size = config.CACHE_SIZE if size is None else size
+        self.entries = OrderedDict()  # ключ -> (истекает, ответ)
+        self.inflight = {}  # ключ -> _Call
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "revalidated": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.size > 0
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> tuple:
+        """Нормализованный ключ: адрес и отсортированные параметры."""
+        items = tuple(sorted(
+            (name, str(value)) for name, value in (params or {}).items()
+            if name not in IGNORED_PARAMS
+        ))
+        return url, items
+
+    @staticmethod
+    def conditions(headers) -> dict:
+        """
+        Заголовки условного запроса по заголовкам ответа.
+
+        Returns:
+            {"If-None-Match": ..., "If-Modified-Since": ...} или пустой словарь
+        """
+        return {request: headers[response] for response, request in VALIDATORS
+                if headers.get(response)}
+
+    def fetch(self, key: tuple, loader, cacheable=None):
+        """
+        Возвращает ответ из кэша или загружает его.
+
+        Args:
+            key: Ключ запроса (ResponseCache.key)
+            loader: Функция, выполняющая запрос; для перепроверки устаревшего
+                ответа получает заголовки условного запроса (ответ 304 - не изменился)
+            cacheable: Проверка, можно ли сохранить ответ (по умолчанию HTTP 200)
+        """
+        now = time.monotonic()
+        stale = None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[1]
+                if getattr(entry[1], "conditions", None):
+                    stale = entry[1]  # остаётся в кэше до ответа на условный запрос
+                else:
+                    del self.entries[key]
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = _Call()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if stale is None:
+                call.result = loader()
+            else:
+                call.result = loader(stale.conditions)
+                if call.result.status_code == 304:
+                    call.result = stale
+                    with self.lock:
+                        self.counters["revalidated"] += 1
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                if call.error is None and self._cacheable(call.result, cacheable):
+                    self.entries[key] = (time.monotonic() + self.ttl, call.result)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+                        self.counters["evicted"] += 1
+            call.event.set()
+
+    @staticmethod
+    def _cacheable(response, cacheable) -> bool:
+        try:
+            if cacheable is not None:
+                return bool(cacheable(response))
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий, промахов и объединённых запросов."""
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.entries))
+        requests = stats["hits"] + stats["misses"] + stats["coalesced"]
+        saved = stats["hits"] + stats["coalesced"] + stats["revalidated"]
+        stats["hit_ratio"] = saved / requests if requests else 0.0
+        return stats
+
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        return (
+            f"попаданий {stats['hits']}, промахов {stats['misses']}, "
+            f"объединено {stats['coalesced']}, не изменилось (304) {stats['revalidated']}, "
+            f"записей {stats['entries']} "
+            f"({stats['hit_ratio']:.0%})"
+        )
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Накопительные итоги поступлений по часам и дням.
+Каждый записанный в журнал перевод за O(1) добавляется в корзины
+(сеть, токен, кошелек, час) и (сеть, токен, кошелек, день), поэтому отчёт
+читает только корзины своего периода и не перебирает историю.
+Хранятся последние ROLLUP_HOURS часовых и ROLLUP_DAYS дневных корзин.
+
+Отчёт:
+    python rollups.py                 # сегодня по кошелькам
+    python rollups.py --period hour --last 24
+    python rollups.py --period day --last 7 --telegram
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import config
+
+# Длительность корзины в секундах
+GRANULARITIES = {"hour": 3600, "day": 86400}
+# Максимальная длина сообщения Telegram
+TELEGRAM_LIMIT = 4096
+
+
+def bucket_start(timestamp: int, granularity: str) -> int:
+    """Начало корзины (unix время) с учётом ROLLUP_UTC_OFFSET."""
+    size = GRANULARITIES[granularity]
+    offset = int(config.ROLLUP_UTC_OFFSET * 3600)
+    return (int(timestamp) + offset) // size * size - offset
+
+
+class Rollups:
+    """Итоги по корзинам: {детализация: {начало корзины: {серия: [число, сумма]}}}."""
+
+    def __init__(self):
+        self.buckets = {granularity: {} for granularity in GRANULARITIES}
+        self.retention = {"hour": config.ROLLUP_HOURS, "day": config.ROLLUP_DAYS}
+        self.dirty = set()  # (детализация, корзина, серия) для пакетной записи
+        self.pruned = {}  # детализация -> граница удалённых корзин
+        self.lock = threading.Lock()
+
+    def add(self, tx: dict):
+        """Добавляет перевод во все корзины (O(1))."""
+        series = (tx.get("network", ""), tx.get("token", ""), tx.get("wallet", ""))
+        now = time.time()
+        timestamp = tx.get("timestamp") or now
+        amount = Decimal(tx["amount"])
+        with self.lock:
+            for granularity, buckets in self.buckets.items():
+                start = bucket_start(timestamp, granularity)
+                bucket = buckets.get(start)
+                if bucket is None:
+                    cutoff = self._cutoff(granularity, now)
+                    if start <= cutoff:
+                        continue  # старше срока хранения (например, при догрузке)
+                    bucket = buckets[start] = {}
+                    self._prune(granularity, cutoff)
+                totals = bucket.get(series)
+                if totals is None:
+                    bucket[series] = [1, amount]
+                else:
+                    totals[0] += 1
+                    totals[1] += amount
+                self.dirty.add((granularity, start, series))
+
+    def _cutoff(self, granularity: str, now: float) -> int:
+        """Начало последней корзины, вышедшей за срок хранения."""
+        size = GRANULARITIES[granularity]
+        return bucket_start(now, granularity) - self.retention[granularity] * size
+
+    def _prune(self, granularity: str, cutoff: int):
+        """Удаляет корзины старше срока хранения. Вызывать под блокировкой."""
+        buckets = self.buckets[granularity]
+        stale = [start for start in buckets if start <= cutoff]
+        for start in stale:
+            del buckets[start]
+        if stale:
+            self.pruned[granularity] = max(self.pruned.get(granularity, cutoff), cutoff)
+
+    def totals(self, granularity: str, since: int, until: int = None) -> dict:
+        """
+        Итоги корзин с началом в [since, until).
+
+        Returns:
+            Словарь {(сеть, токен, кошелек): [число переводов, сумма]}
+        """
+        size = GRANULARITIES[granularity]
+        until = until if until is not None else bucket_start(time.time(), granularity) + size
+        result = {}
+        with self.lock:
+            buckets = self.buckets[granularity]
+            for start in range(bucket_start(since, granularity), until, size):
+                for series, (count, amount) in buckets.get(start, {}).items():
+                    totals = result.setdefault(series, [0, Decimal(0)])
+                    totals[0] += count
+                    totals[1] += amount
+        return result
+
+    def series(self, granularity: str, since: int, until: int = None) -> list:
+        """
+        Итоги по корзинам периода (все кошельки вместе).
+
+        Returns:
+            Список (начало корзины, {(сеть, токен): [число, сумма]})
+        """
+        size = GRANULARITIES[granularity]
+        until = until if until is not None else bucket_start(time.time(), granularity) + size
+        rows = []
+        with self.lock:
+            buckets = self.buckets[granularity]
+            for start in range(bucket_start(since, granularity), until, size):
+                merged = {}
+                for (network, token, _), (count, amount) in buckets.get(start, {}).items():
+                    totals = merged.setdefault((network, token), [0, Decimal(0)])
+                    totals[0] += count
+                    totals[1] += amount
+                rows.append((start, merged))
+        return rows
+
+    def take_dirty(self) -> tuple:
+        """
+        Изменённые корзины с их текущими итогами и границы удалённых.
+
+        Returns:
+            Пара ([(детализация, корзина, сеть, токен, кошелек, число, сумма)],
+            {детализация: граница})
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            pruned, self.pruned = self.pruned, {}
+            rows = []
+            for granularity, start, series in dirty:
+                totals = self.buckets[granularity].get(start, {}).get(series)
+                if totals is not None:
+                    rows.append((granularity, start, *series, totals[0], str(totals[1])))
+        return rows, pruned
+
+    def load_rows(self, rows):
+        """Загружает корзины из строк (детализация, корзина, сеть, токен, кошелек, число, сумма)."""
+        with self.lock:
+            for granularity, start, network, token, wallet, count, amount in rows:
+                buckets = self.buckets.get(granularity)
+                if buckets is None:
+                    continue
+                totals = buckets.setdefault(int(start), {}).setdefault(
+                    (network, token, wallet), [0, Decimal(0)]
+                )
+                totals[0] += int(count)
+                totals[1] += Decimal(amount)
+
+    def to_rows(self) -> list:
+        """Все корзины в виде строк для JSON."""
+        with self.lock:
+            return [
+                [granularity, start, *series, count, str(amount)]
+                for granularity, buckets in self.buckets.items()
+                for start, bucket in buckets.items()
+                for series, (count, amount) in bucket.items()
+            ]
+
+
+def format_report(rollups: Rollups, granularity: str, last: int, by_wallet: bool = True) -> str:
+    """Текст отчёта за последние last корзин."""
+    size = GRANULARITIES[granularity]
+    now = time.time()
+    since = bucket_start(now, granularity) - (last - 1) * size
+    offset = config.ROLLUP_UTC_OFFSET
+    fmt = "%d.%m %H:00" if granularity == "hour" else "%d.%m.%Y"
+
+    def stamp(start: int) -> str:
+        return time.strftime(fmt, time.gmtime(start + offset * 3600))
+
+    period = f"{stamp(since)} - {stamp(bucket_start(now, granularity))}" if last > 1 else stamp(since)
+    lines = [f"Поступления {period} (UTC{offset:+g}):"]
+    totals = rollups.totals(granularity, since)
+    if not totals:
+        lines.append("  нет переводов")
+        return "\n".join(lines)
+
+    by_token = {}
+    for (network, token, wallet), (count, amount) in sorted(totals.items()):
+        token_totals = by_token.setdefault((network, token), [0, Decimal(0)])
+        token_totals[0] += count
+        token_totals[1] += amount
+        if by_wallet:
+            lines.append(f"  {token.upper()} {network.upper()} {wallet[:6]}...{wallet[-4:]}: "
+                         f"{amount:.2f} ({count} пер.)")
+    lines.append("Итого:")
+    for (network, token), (count, amount) in sorted(by_token.items()):
+        lines.append(f"  {token.upper()} {network.upper()}: {amount:.2f} ({count} пер.)")
+
+    if last > 1:
+        lines.append("По периодам:")
+        for start, merged in rollups.series(granularity, since):
+            if merged:
+                parts = ", ".join(f"{amount:.2f} {token.upper()} {network.upper()}"
+                                  for (network, token), (_, amount) in sorted(merged.items()))
+                lines.append(f"  {stamp(start)}: {parts}")
+    return "\n".join(lines)
+
+
+def read_rollup_file(path) -> list:
+    """Строки итогов из ROLLUP_FILE (или прежнего поля "rollups" STATE_FILE)."""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка загрузки {path}: {e}")
+        return []
+    if isinstance(data, dict):
+        data = data.get("rollups", [])
+    return data if isinstance(data, list) else []
+
+
+def _read_db(path: Path) -> list:
+    """Строки таблицы rollups базы, открытой только на чтение."""
+    conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT * FROM rollups").fetchall()
+    except sqlite3.OperationalError:
+        return []  # база без таблицы итогов
+    finally:
+        conn.close()
+
+
+def load_rollups() -> Rollups:
+    """
+    Итоги для отчёта: общее состояние (итоги до шардирования) и все уже
+    существующие файлы шардов. Файлы только читаются - отчёт не создаёт
+    файлы шардов и не меняет настройки шардирования процесса.
+    """
+    from sharding import shard_count, shard_path
+
+    count = max(shard_count(), config.SHARD_PROCESSES)
+    indexes = [None] + (list(range(count)) if count > 1 else [])
+    merged = Rollups()
+    for index in indexes:
+        def path_of(path: str) -> Path:
+            return Path(path if index is None else shard_path(path, index, count))
+
+        if config.STATE_BACKEND == "sqlite":
+            db_path = path_of(config.STATE_DB)
+            if db_path.exists():
+                merged.load_rows(_read_db(db_path))
+            continue
+        rollup_path, state_path = path_of(config.ROLLUP_FILE), path_of(config.STATE_FILE)
+        if rollup_path.exists():
+            merged.load_rows(read_rollup_file(rollup_path))
+        elif state_path.exists():
+            merged.load_rows(read_rollup_file(state_path))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Итоги поступлений по часам и дням")
+    parser.add_argument("--period", choices=sorted(GRANULARITIES), default="day")
+    parser.add_argument("--last", type=int, default=1, help="сколько последних корзин")
+    parser.add_argument("--totals-only", action="store_true", help="без разбивки по кошелькам")
+    parser.add_argument("--telegram", action="store_true", help="отправить отчёт в Telegram")
+    args = parser.parse_args()
+
+    rollups = load_rollups()
+    text = format_report(rollups, args.period, max(1, args.last), not args.totals_only)
+    print(text)
+    if args.telegram:
+        from telegram_bot import send_message
+        if len(text) > TELEGRAM_LIMIT:
+            # Разбивка по кошелькам не помещается в одно сообщение
+            text = format_report(rollups, args.period, max(1, args.last), False)
+        send_message(text[:TELEGRAM_LIMIT])
+
+
+if __name__ == "__main__":
+    main()
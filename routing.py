@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Маршрутизация уведомлений по кошелькам.
+Правила из ROUTES_FILE (кошелек / сеть / токен -> список чатов и тем со своей
+минимальной суммой) при загрузке компилируются в словарь, поэтому маршрут
+перевода находится поиском по ключу, а не перебором правил. Файл
+перечитывается при изменении без перезапуска монитора.
+
+Формат ROUTES_FILE (JSON):
+    {
+      "default": [{"chat": "-100111", "thread": 4}],
+      "routes": [
+        {"wallet": "TXYZ...", "targets": [{"chat": "-100222", "min_amount": 100}]},
+        {"network": "bep20", "token": "busdt", "targets": [{"chat": "-100333", "thread": 7}]}
+      ]
+    }
+Не указанные wallet, network, token подходят к любому значению. Перевод
+уходит во все цели всех подошедших правил (чат+тема - один раз, с меньшей
+из минимальных сумм); без подошедших правил - в "default", а без него - в
+TELEGRAM_CHAT_ID. Тема 0 или отсутствие "thread" - сообщение без темы.
+
+Проверка:
+    python routing.py                              # скомпилированные маршруты
+    python routing.py TXYZ... trc20 usdt 150       # куда уйдёт перевод
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+import config
+
+# Имена сетей, принятые в правилах наравне с network переводов
+NETWORK_ALIASES = {"tron": "trc20", "bsc": "bep20"}
+# Цель по умолчанию: TELEGRAM_CHAT_ID и TELEGRAM_TOPIC_ID
+DEFAULT_TARGET = (None, None)
+# Отметка об отсутствующем файле маршрутов
+MISSING = -1
+# Результат deliver, когда маршруты намеренно не отправляют перевод
+# (сумма меньше min_amount всех целей) - это не ошибка отправки
+NOT_ROUTED = None
+
+
+def _wallet_key(wallet):
+    """Адреса BSC сравниваются без учёта регистра, адреса TRON - точно."""
+    if not wallet:
+        return None
+    wallet = str(wallet).strip()
+    return wallet.lower() if wallet.lower().startswith("0x") else wallet
+
+
+def _network_key(network):
+    if not network:
+        return None
+    network = str(network).strip().lower()
+    return NETWORK_ALIASES.get(network, network)
+
+
+def _token_key(token):
+    return str(token).strip().lower() if token else None
+
+
+class Target:
+    """Чат и тема с минимальной суммой маршрута."""
+
+    __slots__ = ("chat_id", "thread_id", "min_amount")
+
+    def __init__(self, chat_id, thread_id, min_amount: Decimal):
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.min_amount = min_amount
+
+    @classmethod
+    def parse(cls, raw: dict) -> "Target":
+        if "chat" not in raw:
+            raise ValueError(f"цель без chat: {raw}")
+        thread = raw.get("thread")
+        return cls(str(raw["chat"]), int(thread or 0), Decimal(str(raw.get("min_amount", 0))))
+
+    def __repr__(self):
+        topic = f"/{self.thread_id}" if self.thread_id else ""
+        return f"{self.chat_id}{topic} от {self.min_amount}"
+
+
+def _merge(targets) -> list:
+    """Одна цель на чат+тему с наименьшей минимальной суммой."""
+    merged = {}
+    for target in targets:
+        key = (target.chat_id, target.thread_id)
+        current = merged.get(key)
+        if current is None or target.min_amount < current.min_amount:
+            merged[key] = target
+    return list(merged.values())
+
+
+class RoutingTable:
+    """Скомпилированные правила: {(кошелек, сеть, токен): [Target]}, None - любое значение."""
+
+    def __init__(self, index: dict, default):
+        self.index = index
+        self.default = default  # список Target или None - TELEGRAM_CHAT_ID
+        self.resolved = {}  # конкретный ключ перевода -> итоговые цели
+
+    @classmethod
+    def parse(cls, data: dict) -> "RoutingTable":
+        """
+        Компилирует правила.
+
+        Raises:
+            ValueError: Ошибка в правилах
+        """
+        index = {}
+        for rule in data.get("routes", []):
+            key = (_wallet_key(rule.get("wallet")), _network_key(rule.get("network")),
+                   _token_key(rule.get("token")))
+            targets = [Target.parse(raw) for raw in rule.get("targets", [])]
+            if not targets:
+                raise ValueError(f"правило без targets: {rule}")
+            index.setdefault(key, []).extend(targets)
+        index = {key: _merge(targets) for key, targets in index.items()}
+        default = data.get("default")
+        if default is not None:
+            default = _merge(Target.parse(raw) for raw in default)
+        return cls(index, default)
+
+    def lookup(self, wallet, network, token) -> list:
+        """
+        Цели перевода без учёта суммы. Первый перевод с новым ключом
+        проверяет 8 сочетаний конкретных и любых значений, дальше - одно
+        обращение к словарю.
+        """
+        key = (_wallet_key(wallet), _network_key(network), _token_key(token))
+        targets = self.resolved.get(key)
+        if targets is None:
+            matched = []
+            for w in (key[0], None):
+                for n in (key[1], None):
+                    for t in (key[2], None):
+                        matched.extend(self.index.get((w, n, t), ()))
+            if matched:
+                targets = _merge(matched)
+            elif self.default is not None:
+                targets = self.default
+            else:
+                targets = [Target(*DEFAULT_TARGET, Decimal(0))]
+            self.resolved[key] = targets
+        return targets
+
+    def __len__(self):
+        return len(self.index)
+
+
+class Router:
+    """Текущая таблица маршрутов с перечитыванием изменённого файла."""
+
+    def __init__(self, path: str = None, interval: float = None):
+        self.path = config.ROUTES_FILE if path is None else path
+        self.interval = config.ROUTES_RELOAD_INTERVAL if interval is None else interval
+        self.table = None
+        self.mtime = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Перечитывает файл, если он изменился. При ошибке остаются прежние маршруты.
+
+        Returns:
+            True, если таблица заменена
+        """
+        with self.lock:
+            self.checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self.mtime != MISSING or force:
+                    # Пишем один раз, пока файл не появится снова
+                    print(f"[ROUTES] Файл маршрутов недоступен: {e}")
+                    self.mtime = MISSING
+                return False
+            if mtime == self.mtime and not force:
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    table = RoutingTable.parse(json.load(f))
+            except (ValueError, TypeError, AttributeError, ArithmeticError) as e:
+                print(f"[ROUTES] Ошибка в {self.path}: {e}; оставлены прежние маршруты")
+                self.mtime = mtime  # не разбирать тот же файл каждые interval сек
+                return False
+            self.table, self.mtime = table, mtime
+            print(f"[ROUTES] Загружено правил: {len(table)} из {self.path}")
+            return True
+
+    def current(self):
+        """Таблица маршрутов; файл проверяется не чаще раза в interval сек."""
+        if time.monotonic() - self.checked >= self.interval:
+            self.reload()
+        return self.table
+
+    def targets(self, tx: dict) -> list:
+        """
+        Чаты и темы, в которые уходит уведомление о переводе.
+
+        Returns:
+            Список (chat_id, thread_id); None в паре - значение из config
+        """
+        table = self.current() if self.enabled else None
+        if table is None:
+            return [DEFAULT_TARGET]
+        amount = Decimal(str(tx["amount"]))
+        return [
+            (target.chat_id, target.thread_id)
+            for target in table.lookup(tx.get("wallet"), tx.get("network"), tx.get("token"))
+            if amount >= target.min_amount
+        ]
+
+
+router = Router()
+
+
+def deliver(notify, tx: dict, label: str) -> bool:
+    """
+    Отправляет уведомление о переводе по маршрутам: по одному вызову
+    notify на чат+тему (очередь склеивает их с другими переводами того же чата).
+
+    Args:
+        notify: send_notification, NotificationQueue.submit или ShardNotifier.submit
+        tx: Перевод в формате Transfer.to_dict
+        label: Подпись токена ('USDT TRC20')
+
+    Returns:
+        True, если уведомление принято хотя бы одной целью; NOT_ROUTED,
+        если по маршрутам перевод никуда не отправляется
+    """
+    targets = router.targets(tx)
+    if not targets:
+        return NOT_ROUTED
+    if targets == [DEFAULT_TARGET]:
+        return notify(tx["amount"], label)
+    notified = False
+    for chat_id, thread_id in targets:
+        notified = notify(tx["amount"], label, chat_id, thread_id) or notified
+    return notified
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка маршрутов уведомлений")
+    parser.add_argument("wallet", nargs="?")
+    parser.add_argument("network", nargs="?", help="trc20/bep20 (или tron/bsc)")
+    parser.add_argument("token", nargs="?", help="usdt, busdt, ...")
+    parser.add_argument("amount", nargs="?", default="0")
+    parser.add_argument("--file", default=config.ROUTES_FILE or "routes.json")
+    args = parser.parse_args()
+
+    checked = Router(args.file, interval=0)
+    if not checked.reload(force=True):
+        return
+    table = checked.table
+    if not args.wallet:
+        for (wallet, network, token), targets in sorted(
+                table.index.items(), key=lambda item: tuple(part or "" for part in item[0])):
+            print(f"  {wallet or '*'} {network or '*'} {token or '*'} -> {targets}")
+        print(f"  по умолчанию -> {table.default if table.default is not None else 'TELEGRAM_CHAT_ID'}")
+        return
+
+    tx = {"wallet": args.wallet, "network": args.network, "token": args.token,
+          "amount": args.amount}
+    started = time.perf_counter()
+    targets = checked.targets(tx)
+    elapsed = time.perf_counter() - started
+    for chat_id, thread_id in targets:
+        print(f"  -> {chat_id or 'TELEGRAM_CHAT_ID'}" + (f" / тема {thread_id}" if thread_id else ""))
+    if not targets:
+        print("  не отправляется (меньше минимальной суммы маршрутов)")
+    print(f"  поиск {elapsed * 1e6:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Адаптивное расписание опроса.
+У каждого источника (сеть, кошелек, контракт) своё время следующего опроса:
+после новых переводов интервал сокращается, при простое и ошибках
+экспоненциально растёт, к интервалу добавляется случайный разброс.
+"""
+
+import random
+import time
+
+import config
+from ratelimit import limiter
+
+
+class Source:
+    """Источник опроса: контракт на кошельке конкретного трекера."""
+
+    def __init__(self, tracker, contract: str, interval: float):
+        self.tracker = tracker
+        self.contract = contract
+        self.interval = interval
+        self.next_due = 0.0
+        self.errors = 0
+        self.polls = 0
+        self.found = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.tracker.chain}:{self.tracker.wallet}:{self.contract}"
+
+
+class PollScheduler:
+    """Раздаёт источники к опросу по их собственным интервалам."""
+
+    def __init__(self, trackers: list, base_interval: float = None,
+                 min_interval: float = None, max_interval: float = None,
+                 backoff: float = None, jitter: float = None):
+        self.base_interval = base_interval or config.CHECK_INTERVAL
+        self.min_interval = min_interval or config.POLL_MIN_INTERVAL
+        self.max_interval = max_interval or config.POLL_MAX_INTERVAL
+        self.backoff = backoff or config.POLL_IDLE_BACKOFF
+        self.jitter = config.POLL_JITTER if jitter is None else jitter
+        self.sources = [
+            Source(tracker, contract, self.base_interval)
+            for tracker in trackers
+            for contract in tracker.sources()
+        ]
+        self.floors = self._provider_floors()
+        self.last_stats = {}
+
+    def _provider_floors(self) -> dict:
+        """
+        Минимальный интервал источника, при котором суммарная частота
+        запросов к провайдеру не превышает его лимит по всем ключам.
+        """
+        counts = {}
+        for source in self.sources:
+            provider = source.tracker.provider
+            counts[provider] = counts.get(provider, 0) + 1
+
+        floors = {}
+        for provider, count in counts.items():
+            capacity = limiter.capacity(provider)
+            floors[provider] = count / capacity if capacity else 0.0
+        return floors
+
+    def _clamp(self, source: Source, interval: float) -> float:
+        floor = max(self.min_interval, self.floors.get(source.tracker.provider, 0.0))
+        return max(floor, min(self.max_interval, interval))
+
+    def due(self, now: float = None) -> list:
+        """Возвращает источники, время опроса которых наступило."""
+        now = time.monotonic() if now is None else now
+        return [source for source in self.sources if source.next_due <= now]
+
+    def report(self, source: Source, found: int, error: bool = False, now: float = None):
+        """
+        Учитывает результат опроса и назначает следующий.
+
+        Args:
+            source: Опрошенный источник
+            found: Количество новых переводов
+            error: Был ли опрос неудачным
+        """
+        now = time.monotonic() if now is None else now
+        source.polls += 1
+        source.found += found
+
+        if error:
+            source.errors += 1
+            interval = max(source.interval, self.base_interval) * 2
+        elif found:
+            source.errors = 0
+            interval = self.min_interval
+        else:
+            source.errors = 0
+            interval = source.interval * self.backoff
+        source.interval = self._clamp(source, interval)
+
+        spread = source.interval * self.jitter
+        source.next_due = now + source.interval + random.uniform(-spread, spread)
+
+    def next_wakeup(self, now: float = None) -> float:
+        """Сколько секунд спать до ближайшего опроса."""
+        now = time.monotonic() if now is None else now
+        if not self.sources:
+            return self.base_interval
+        nearest = min(source.next_due for source in self.sources)
+        return max(0.5, nearest - now)
+
+    def stats(self, polled: int = 0) -> dict:
+        """Сводка решений планировщика для вывода по циклам."""
+        intervals = [source.interval for source in self.sources] or [0]
+        self.last_stats = {
+            "sources": len(self.sources),
+            "polled": polled,
+            "active": sum(1 for s in self.sources if s.interval <= self.min_interval),
+            "backing_off": sum(1 for s in self.sources if s.errors),
+            "min_interval": min(intervals),
+            "max_interval": max(intervals),
+            "next_wakeup": self.next_wakeup(),
+        }
+        return self.last_stats
+
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        return (
+            f"опрошено {stats['polled']}/{stats['sources']}, "
+            f"активных {stats['active']}, с ошибками {stats['backing_off']}, "
+            f"интервалы {stats['min_interval']:.0f}-{stats['max_interval']:.0f} сек, "
+            f"следующий через {stats['next_wakeup']:.1f} сек"
+        )
@@ -0,0 +1,245 @@
+"""
+Шардирование кошельков между процессами или экземплярами.
+Кошельки раскладываются по шардам согласованным хэшированием, поэтому при
+добавлении шарда переезжает лишь около 1/N кошельков. У каждого шарда свои
+курсоры и хранилище обработанных транзакций.
+
+Режимы:
+- SHARD_PROCESSES=N - координатор запускает N процессов на одной машине и
+  сам отправляет все уведомления (общая склейка и лимиты Telegram);
+- SHARD_INDEX/SHARD_COUNT - один шард на экземпляр (например, на Railway),
+  уведомления экземпляр отправляет сам.
+"""
+
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from pathlib import Path
+
+import config
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Кольцо согласованного хэширования с виртуальными узлами."""
+
+    def __init__(self, count: int, vnodes: int = None):
+        vnodes = vnodes or config.SHARD_VNODES
+        points = sorted(
+            (_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(count)
+            for replica in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, key: str) -> int:
+        """Шард, которому принадлежит ключ."""
+        position = bisect.bisect(self.hashes, _hash(key)) % len(self.hashes)
+        return self.shards[position]
+
+
+def shard_index() -> int:
+    return config.SHARD_INDEX
+
+
+def shard_count() -> int:
+    return max(1, config.SHARD_COUNT)
+
+
+def wallet_key(network: str, wallet: str) -> str:
+    """Ключ кошелька для кольца (BEP20 адреса регистронезависимы)."""
+    return f"{network}:{wallet.lower() if network == 'bep20' else wallet}"
+
+
+def shard_wallets(wallets: dict, index: int = None, count: int = None) -> dict:
+    """
+    Оставляет кошельки, принадлежащие шарду.
+
+    Args:
+        wallets: Словарь {"trc20": [...], "bep20": [...]}
+
+    Returns:
+        Словарь того же вида только с кошельками шарда
+    """
+    index = shard_index() if index is None else index
+    count = shard_count() if count is None else count
+    if count <= 1:
+        return wallets
+    ring = HashRing(count)
+    return {
+        network: [w for w in items if ring.shard_for(wallet_key(network, w)) == index]
+        for network, items in wallets.items()
+    }
+
+
+def shard_path(path, index: int = None, count: int = None) -> str:
+    """Путь файла состояния шарда: state.db -> state.shard2.db."""
+    index = shard_index() if index is None else index
+    count = shard_count() if count is None else count
+    if count <= 1:
+        return str(path)
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}.shard{index}{path.suffix}"))
+
+
+def _state_paths() -> list:
+    """Общие файлы состояния, у которых бывают файлы шардов."""
+    return [config.STATE_FILE, config.STATE_DB] + [
+        config.DEDUP_FILE_TEMPLATE.format(chain=chain) for chain in ("tron", "bsc")
+    ]
+
+
+def _shard_files_exist() -> bool:
+    for path in map(Path, _state_paths()):
+        if any(path.parent.glob(f"{path.stem}.shard*{path.suffix}")):
+            return True
+    return False
+
+
+def inheritance_allowed(count: int = None) -> bool:
+    """
+    Можно ли заполнить новый файл шарда из общего состояния.
+
+    Только пока действует раскладка, с которой шардирование включили
+    впервые: тогда общее состояние актуально для всех кошельков, и шарды,
+    запущенные позже остальных, тоже получают его копию. После смены числа
+    шардов общий файл устарел - курсоры переехавших кошельков ведут другие
+    шарды, - поэтому новый файл шарда начинается пустым, а кошельки без
+    курсоров проходят холодный старт (seed). Раскладка хранится в
+    SHARD_LAYOUT_FILE; без неё при уже существующих файлах шардов (состояние
+    до появления раскладки) копирование тоже запрещено.
+    """
+    count = shard_count() if count is None else count
+    path = Path(config.SHARD_LAYOUT_FILE)
+    try:
+        layout = json.loads(path.read_text())
+    except FileNotFoundError:
+        layout = None
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения {path}: {e}")
+        layout = {}
+    if layout and layout.get("count") == count:
+        return bool(layout.get("inherit"))
+
+    inherit = layout is None and not _shard_files_exist()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_text(json.dumps({"count": count, "inherit": inherit}))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Ошибка сохранения {path}: {e}")
+    return inherit
+
+
+def inherit_file(path) -> str:
+    """
+    Путь файла шарда; при первом включении шардирования он копируется из
+    общего файла, чтобы курсоры и обработанные транзакции не начинались
+    с нуля (см. inheritance_allowed).
+    """
+    sharded = shard_path(path)
+    if (sharded != str(path) and not Path(sharded).exists() and Path(path).exists()
+            and inheritance_allowed()):
+        shutil.copyfile(path, sharded)
+    return sharded
+
+
+class ShardNotifier:
+    """Уведомления процесса-шарда: передаются координатору через очередь."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def submit(self, amount, token_type: str, chat_id=None, thread_id=None) -> bool:
+        self.channel.put((amount, token_type, chat_id, thread_id))
+        return True
+
+    def depth(self) -> int:
+        return 0
+
+    def close(self, timeout: float = 30):
+        """Уведомления досылает координатор."""
+
+
+def _worker(index: int, count: int, channel):
+    """Точка входа процесса-шарда."""
+    from main import run_monitor
+    from ratelimit import limiter
+
+    config.SHARD_INDEX = index
+    config.SHARD_COUNT = count
+    # У каждого процесса свой порт /metrics и свой журнал событий
+    if config.METRICS_PORT:
+        config.METRICS_PORT += index
+    if config.METRICS_LOG:
+        config.METRICS_LOG = shard_path(config.METRICS_LOG)
+    # Процессы делят одни API ключи: каждому достаётся 1/N лимита
+    limiter.scale(1 / count)
+    run_monitor(notifier=ShardNotifier(channel))
+
+
+def run_coordinator(count: int = None):
+    """
+    Запускает шарды в отдельных процессах и отправляет их уведомления
+    через одну очередь. Упавший шард перезапускается.
+    """
+    from notifier import NotificationQueue
+
+    count = count or config.SHARD_PROCESSES
+    channel = multiprocessing.Queue()
+    notifier = NotificationQueue()
+    processes = {}
+
+    def spawn(index: int):
+        process = multiprocessing.Process(
+            target=_worker, args=(index, count, channel), name=f"shard-{index}"
+        )
+        process.start()
+        processes[index] = process
+
+    print(f"Координатор: запуск {count} шардов")
+    for index in range(count):
+        spawn(index)
+
+    stopping = False
+    try:
+        while True:
+            try:
+                notifier.submit(*channel.get(timeout=1))
+            except queue.Empty:
+                pass
+            for index, process in list(processes.items()):
+                if not process.is_alive() and process.exitcode != 0:
+                    print(f"Шард {index} завершился с кодом {process.exitcode}, перезапуск")
+                    time.sleep(1)
+                    spawn(index)
+    except KeyboardInterrupt:
+        stopping = True
+        print("\nКоординатор: ожидание остановки шардов...")
+    finally:
+        if not stopping:
+            for process in processes.values():
+                process.terminate()
+        # Шард не завершится, пока его записи в очереди не вычитаны,
+        # поэтому уведомления забираются и во время остановки
+        while any(process.is_alive() for process in processes.values()):
+            try:
+                notifier.submit(*channel.get(timeout=0.5))
+            except queue.Empty:
+                pass
+        # Досылаем уведомления, поставленные шардами перед остановкой
+        while True:
+            try:
+                notifier.submit(*channel.get(timeout=0.5))
+            except queue.Empty:
+                break
+        notifier.close()
@@ -0,0 +1,460 @@
+"""
+Хранилища состояния монитора: обработанные транзакции, курсоры и журнал.
+FileState - файлы на диске (JSON с курсорами, dedup-файлы и файл итогов),
+SqliteState - одна база SQLite в режиме WAL.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+from dedup import DedupStore, tx_key
+from rollups import Rollups, read_rollup_file
+from sharding import inherit_file, inheritance_allowed, shard_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка состояния не поддерживается
+    fcntl = None
+
+# ledger.notified: 1 - отправлено, 0 - ошибка отправки, 2 - маршруты не отправляют перевод,
+# 3 - найден догрузкой без уведомления (backfill.py без --replay)
+LEDGER_NOT_ROUTED = 2
+LEDGER_BACKFILLED = 3
+
+
+class StateLocked(RuntimeError):
+    """Состояние уже используется другим процессом (монитор или догрузка)."""
+
+
+def write_atomic(path, data: str):
+    """Записывает файл через временный файл и rename, чтобы сбой не портил старую версию."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FileState:
+    """
+    Состояние в файлах: курсоры в STATE_FILE, транзакции в dedup-файлах,
+    итоги в ROLLUP_FILE.
+    """
+
+    def __init__(self, path: str = None):
+        inherited = False
+        if path is None:
+            own = Path(shard_path(config.STATE_FILE))
+            inherited = str(own) != config.STATE_FILE and not own.exists()
+            path = inherit_file(config.STATE_FILE)
+            rollup_path = shard_path(config.ROLLUP_FILE)
+        else:
+            rollup_path = Path(path).with_name(Path(config.ROLLUP_FILE).name)
+        self.path = Path(path)
+        self.rollup_path = Path(rollup_path)
+        self.stores = {}
+        self._legacy = {}
+        self._pending = []
+        self.rollups = Rollups()
+        self._rollups_changed = False
+        self._rollups_saved = time.monotonic()
+
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    self._legacy = json.load(f)
+            except Exception as e:
+                print(f"Ошибка загрузки состояния: {e}")
+        if self.rollup_path.exists():
+            self.rollups.load_rows(read_rollup_file(self.rollup_path))
+        elif not inherited:
+            # Раньше итоги хранились в STATE_FILE; у скопированного в шард
+            # файла они остаются общему файлу, иначе считались бы в каждом шарде
+            self.rollups.load_rows(self._legacy.get("rollups", []))
+            self._rollups_changed = "rollups" in self._legacy
+
+    def dedup(self, chain: str) -> DedupStore:
+        """Возвращает хранилище обработанных транзакций сети."""
+        store = self.stores.get(chain)
+        if store is None:
+            path = inherit_file(config.DEDUP_FILE_TEMPLATE.format(chain=chain))
+            store = self.stores[chain] = DedupStore(path=path)
+            # Списки из старого формата состояния переносятся в хранилище
+            store.update(self._legacy.pop(chain, []))
+        return store
+
+    def load_cursors(self) -> dict:
+        """Возвращает сохранённые курсоры."""
+        return dict(self._legacy.get("cursors", {}))
+
+    def save_cursors(self, cursors: dict):
+        """Атомарно записывает курсоры и ожидающие переводы в STATE_FILE."""
+        data = {"cursors": cursors}
+        if self._pending:
+            data["pending"] = self._pending
+        write_atomic(self.path, json.dumps(data, indent=2))
+
+    def load_pending(self) -> list:
+        """Возвращает переводы, ожидающие подтверждений."""
+        return list(self._legacy.get("pending", []))
+
+    def save_pending(self, items: list):
+        """Запоминает ожидающие переводы (пишутся вместе с курсорами)."""
+        self._pending = list(items)
+
+    def record_transfer(self, tx: dict, notified: bool = True):
+        """Добавляет перевод в итоги (журнал переводов ведётся только в SQLite)."""
+        self.rollups.add(tx)
+
+    def flush(self):
+        """Дописывает новые обработанные транзакции на диск, итоги - раз в ROLLUP_FLUSH_INTERVAL."""
+        for store in self.stores.values():
+            store.flush()
+        self._save_rollups()
+
+    def _save_rollups(self, force: bool = False):
+        """
+        Перезаписывает ROLLUP_FILE, если итоги изменились. Итоги - сводка
+        для отчёта, поэтому при сбое теряется не больше ROLLUP_FLUSH_INTERVAL
+        секунд поступлений, а курсоры и dedup-файлы не переписывают их на
+        каждом цикле.
+        """
+        rows, pruned = self.rollups.take_dirty()
+        self._rollups_changed = self._rollups_changed or bool(rows or pruned)
+        now = time.monotonic()
+        if not self._rollups_changed or (
+                not force and now - self._rollups_saved < config.ROLLUP_FLUSH_INTERVAL):
+            return
+        try:
+            write_atomic(self.rollup_path, json.dumps(self.rollups.to_rows()))
+        except OSError as e:
+            print(f"Ошибка сохранения {self.rollup_path}: {e}")
+            return
+        self._rollups_changed = False
+        self._rollups_saved = now
+
+    def close(self):
+        self.flush()
+        self._save_rollups(force=True)
+
+
+class SqliteDedup:
+    """Обработанные транзакции сети в таблице SQLite с пакетной записью."""
+
+    def __init__(self, state: "SqliteState", chain: str):
+        self.state = state
+        self.chain = chain
+        self._pending = set()
+
+    def add(self, tx_id: str) -> bool:
+        """
+        Помечает транзакцию обработанной (запишется при flush).
+
+        Returns:
+            False, если транзакция уже была отмечена (например, другим потоком)
+        """
+        with self.state.lock:
+            if tx_id in self:
+                return False
+            self._pending.add(tx_key(tx_id))
+            return True
+
+    def update(self, tx_ids):
+        """Добавляет несколько транзакций."""
+        for tx_id in tx_ids:
+            self.add(tx_id)
+
+    def update_keys(self, keys):
+        """Добавляет готовые 32-байтные ключи."""
+        with self.state.lock:
+            self._pending.update(keys)
+
+    def discard(self, tx_id: str):
+        """Снимает отметку обработки (например, после реорганизации блока)."""
+        key = tx_key(tx_id)
+        with self.state.lock, self.state.conn:
+            self._pending.discard(key)
+            self.state.conn.execute(
+                "DELETE FROM processed WHERE chain = ? AND tx_key = ?", (self.chain, key)
+            )
+
+    def __contains__(self, tx_id) -> bool:
+        key = tx_key(tx_id)
+        with self.state.lock:
+            if key in self._pending:
+                return True
+            row = self.state.conn.execute(
+                "SELECT 1 FROM processed WHERE chain = ? AND tx_key = ?",
+                (self.chain, key),
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self.state.lock:
+            (count,) = self.state.conn.execute(
+                "SELECT COUNT(*) FROM processed WHERE chain = ?", (self.chain,)
+            ).fetchone()
+            return count + len(self._pending)
+
+    def take_pending(self) -> list:
+        """Забирает накопленные записи. Вызывать под блокировкой."""
+        pending, self._pending = self._pending, set()
+        return [(self.chain, key) for key in pending]
+
+
+class SqliteState:
+    """Состояние в SQLite (WAL): транзакции, курсоры и журнал уведомлений."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS processed (
+            chain TEXT NOT NULL,
+            tx_key BLOB NOT NULL,
+            PRIMARY KEY (chain, tx_key)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS cursors (
+            source TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ledger (
+            chain TEXT NOT NULL,
+            tx_id TEXT NOT NULL,
+            wallet TEXT,
+            token TEXT,
+            amount TEXT,
+            from_address TEXT,
+            block INTEGER,
+            timestamp INTEGER,
+            notified INTEGER NOT NULL,
+            recorded_at INTEGER NOT NULL,
+            PRIMARY KEY (chain, tx_id, wallet, token)
+        );
+        CREATE INDEX IF NOT EXISTS ledger_wallet_ts ON ledger (wallet, timestamp);
+        CREATE TABLE IF NOT EXISTS pending (
+            chain TEXT NOT NULL,
+            tx_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (chain, tx_id)
+        );
+        CREATE TABLE IF NOT EXISTS rollups (
+            granularity TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            network TEXT NOT NULL,
+            token TEXT NOT NULL,
+            wallet TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            amount TEXT NOT NULL,
+            PRIMARY KEY (granularity, bucket, network, token, wallet)
+        );
+    """
+    UPSERT_ROLLUP = """
+        INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (granularity, bucket, network, token, wallet)
+        DO UPDATE SET count = excluded.count, amount = excluded.amount
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.STATE_DB
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_ledger()
+        self.conn.executescript(self.SCHEMA)
+        self.stores = {}
+        self._ledger = []
+        self.rollups = Rollups()
+        self.rollups.load_rows(self.conn.execute("SELECT * FROM rollups"))
+
+    def _migrate_ledger(self):
+        """
+        Журнал прежнего формата с ключом (chain, tx_id) терял переводы одной
+        транзакции на разные кошельки; переносим его в таблицу с ключом
+        (chain, tx_id, wallet, token).
+        """
+        columns = self.conn.execute("PRAGMA table_info(ledger)").fetchall()
+        key = [name for _, name, _, _, _, pk in sorted(columns, key=lambda c: c[5]) if pk]
+        if key != ["chain", "tx_id"]:
+            return
+        self.conn.executescript(f"""
+            BEGIN;
+            ALTER TABLE ledger RENAME TO ledger_old;
+            DROP INDEX IF EXISTS ledger_wallet_ts;
+            {self.SCHEMA}
+            INSERT INTO ledger SELECT * FROM ledger_old;
+            DROP TABLE ledger_old;
+            COMMIT;
+        """)
+
+    def dedup(self, chain: str) -> SqliteDedup:
+        """Возвращает хранилище обработанных транзакций сети."""
+        store = self.stores.get(chain)
+        if store is None:
+            store = self.stores[chain] = SqliteDedup(self, chain)
+        return store
+
+    def load_cursors(self) -> dict:
+        """Возвращает сохранённые курсоры."""
+        with self.lock:
+            rows = self.conn.execute("SELECT source, value FROM cursors").fetchall()
+        return dict(rows)
+
+    def save_cursors(self, cursors: dict):
+        """Заменяет курсоры в одной транзакции (как файл состояния)."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cursors")
+            self.conn.executemany(
+                "INSERT INTO cursors (source, value) VALUES (?, ?)",
+                list(cursors.items()),
+            )
+
+    def load_pending(self) -> list:
+        """Возвращает переводы, ожидающие подтверждений."""
+        with self.lock:
+            rows = self.conn.execute("SELECT payload FROM pending").fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def save_pending(self, items: list):
+        """Заменяет список ожидающих переводов в одной транзакции."""
+        rows = [(item["chain"], item.get("key") or item["tx_id"], json.dumps(item))
+                for item in items]
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM pending")
+            self.conn.executemany("INSERT OR REPLACE INTO pending VALUES (?, ?, ?)", rows)
+
+    def record_transfer(self, tx: dict, notified: bool = True):
+        """
+        Добавляет перевод в журнал (запишется при flush).
+
+        Args:
+            tx: Перевод в формате Transfer.to_dict
+            notified: Результат отправки; None - маршруты не отправляют перевод,
+                LEDGER_BACKFILLED - найден догрузкой без уведомления
+        """
+        row = (
+            tx.get("network", ""),
+            tx.get("tx_id") or tx.get("tx_hash"),
+            tx.get("wallet"),
+            tx.get("token"),
+            str(tx.get("amount")),
+            tx.get("from"),
+            tx.get("block"),
+            tx.get("timestamp"),
+            LEDGER_NOT_ROUTED if notified is None else int(notified),
+            int(time.time()),
+        )
+        with self.lock:
+            self._ledger.append(row)
+        self.rollups.add(tx)
+
+    def flush(self):
+        """Пакетно записывает накопленные за цикл транзакции и журнал."""
+        with self.lock:
+            processed = []
+            for store in self.stores.values():
+                processed += store.take_pending()
+            ledger, self._ledger = self._ledger, []
+            rollups, pruned = self.rollups.take_dirty()
+            if not processed and not ledger and not rollups and not pruned:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO processed (chain, tx_key) VALUES (?, ?)",
+                    processed,
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ledger,
+                )
+                # Итоги корзин записываются целиком, поэтому повторная запись безопасна
+                self.conn.executemany(self.UPSERT_ROLLUP, rollups)
+                for granularity, cutoff in pruned.items():
+                    self.conn.execute(
+                        "DELETE FROM rollups WHERE granularity = ? AND bucket <= ?",
+                        (granularity, cutoff),
+                    )
+
+    def import_from(self, file_state: FileState, chains=("tron", "bsc")):
+        """Переносит курсоры, обработанные транзакции и итоги из файлового состояния."""
+        for chain in chains:
+            self.dedup(chain).update_keys(file_state.dedup(chain).keys())
+        rollups = file_state.rollups.to_rows()
+        self.rollups.load_rows(rollups)
+        with self.lock, self.conn:
+            self.conn.executemany(self.UPSERT_ROLLUP, rollups)
+        self.flush()
+        self.save_pending(file_state.load_pending())
+        self.save_cursors(file_state.load_cursors())
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+def _inherit_db(path: str) -> str:
+    """
+    Путь базы шарда; при первом включении шардирования в неё копируется
+    общая база (через backup API, чтобы забрать и записи из WAL).
+    """
+    sharded = shard_path(path)
+    if (sharded != path and not Path(sharded).exists() and Path(path).exists()
+            and inheritance_allowed()):
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(sharded)
+        try:
+            source.backup(target)
+            # Итоги до шардирования остаются в общей базе, иначе отчёт,
+            # объединяющий шарды, учёл бы их в каждом
+            if target.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollups'").fetchone():
+                with target:
+                    target.execute("DELETE FROM rollups")
+        finally:
+            target.close()
+            source.close()
+    return sharded
+
+
+def open_state():
+    """Открывает хранилище состояния согласно STATE_BACKEND."""
+    if config.STATE_BACKEND == "sqlite":
+        state = SqliteState(_inherit_db(config.STATE_DB))
+        # При переходе с файлового хранилища переносим накопленное состояние
+        legacy = (Path(config.STATE_FILE), Path(shard_path(config.STATE_FILE)))
+        if not state.load_cursors() and any(path.exists() for path in legacy):
+            state.import_from(FileState())
+        return state
+    return FileState()
+
+
+def lock_state():
+    """
+    Эксклюзивная блокировка состояния процесса (файл .lock рядом с
+    STATE_FILE или STATE_DB шарда). Монитор и догрузка пишут итоги и
+    журнал из памяти, поэтому вторым процессом то же состояние не открывается.
+    Блокировка снимается при закрытии возвращённого файла или завершении
+    процесса, в том числе аварийном.
+
+    Returns:
+        Открытый файл блокировки
+
+    Raises:
+        StateLocked: Состояние держит другой процесс
+    """
+    base = config.STATE_DB if config.STATE_BACKEND == "sqlite" else config.STATE_FILE
+    path = shard_path(base) + ".lock"
+    handle = open(path, "a")
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise StateLocked(f"{path} занят другим процессом") from None
+    return handle
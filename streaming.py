@@ -0,0 +1,283 @@
+"""
+Потоковый разбор страниц TronGrid и BscScan.
+Тело ответа читается кусками, строки массива выделяются регулярным
+выражением, а поля получателя, суммы и курсора проверяются прямо в тексте.
+В словари превращаются только строки, прошедшие фильтр (получатель -
+отслеживаемый кошелек, контракт - отслеживаемый токен, если фильтр их
+задаёт, сумма не меньше MIN_AMOUNT); остальные отбрасываются,
+от них остаются лишь счётчик и курсор. Так страница на 10000 строк не
+разворачивается целиком во вложенные словари.
+"""
+
+import codecs
+import json
+import re
+
+import config
+from response_cache import ResponseCache
+
+# Объект строки: плоский или с одним уровнем вложенности (token_info TronGrid)
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_NESTED = r'\{[^{}"]*(?:%s[^{}"]*)*\}' % _STRING
+# Развёрнутый цикл без неоднозначных повторов: на недочитанной строке
+# совпадение проваливается за линейное время
+ROW = re.compile(r'\{[^{}"]*(?:(?:%s|%s)[^{}"]*)*\}' % (_STRING, _NESTED))
+SEPARATOR = re.compile(r"[\s,]*")
+# Размер куска чтения тела ответа
+CHUNK_SIZE = 65536
+
+
+def _field(name: str):
+    """Значение поля строки: строка в кавычках или число."""
+    return re.compile(r'"%s"\s*:\s*"?([^",}]*)' % name)
+
+
+class RowFormat:
+    """Где в ответе массив строк и как называются нужные поля."""
+
+    def __init__(self, key: str, decimals: str, default_decimals: int, cursor: str,
+                 contract: str, lowercase: bool):
+        self.key = key
+        self.array = re.compile(r'"%s"\s*:\s*\[' % key)
+        self.to = _field("to")
+        self.contract = _field(contract)
+        self.value = _field("value")
+        self.decimals = _field(decimals)
+        self.default_decimals = default_decimals
+        self.cursor_name = cursor
+        self.cursor = _field(cursor)
+        self.lowercase = lowercase
+
+
+# Контракт TronGrid - token_info.address (других полей address в строке нет)
+TRONGRID = RowFormat("data", "decimals", 6, "block_timestamp", "address", lowercase=False)
+BSCSCAN = RowFormat("result", "tokenDecimal", 18, "blockNumber", "contractAddress", lowercase=True)
+
+
+class Page:
+    """Разобранная страница: нужные строки, их общее число и курсор."""
+
+    __slots__ = ("status_code", "text", "envelope", "key", "rows", "total", "latest", "last",
+                 "conditions")
+
+    def __init__(self, status_code: int, envelope: dict = None, key: str = "", rows: list = None,
+                 total: int = 0, latest: int = 0, last: int = 0, text: str = ""):
+        self.status_code = status_code
+        self.envelope = envelope if isinstance(envelope, dict) else {}
+        self.key = key
+        self.rows = rows or []
+        self.total = total  # строк на странице до фильтра
+        self.latest = latest  # наибольшее значение курсора на странице
+        self.last = last  # значение курсора последней строки
+        self.text = text
+        self.conditions = {}  # заголовки условного запроса для перепроверки в кэше
+
+    def json(self) -> dict:
+        """Ответ в прежнем виде; в массиве только отобранные строки."""
+        if isinstance(self.envelope.get(self.key), list):
+            return dict(self.envelope, **{self.key: self.rows})
+        return self.envelope
+
+    @classmethod
+    def from_data(cls, status_code: int, data: dict, fmt: RowFormat) -> "Page":
+        """Страница из уже разобранного JSON (путь со словарями)."""
+        rows = data.get(fmt.key) if isinstance(data, dict) else None
+        if not isinstance(rows, list):
+            return cls(status_code, data, fmt.key)
+        values = [int(row.get(fmt.cursor_name) or 0) for row in rows]
+        return cls(status_code, data, fmt.key, rows, len(rows), max(values, default=0),
+                   values[-1] if values else 0)
+
+
+def _accept(buf: str, start: int, end: int, fmt: RowFormat, flt) -> bool:
+    """Проверка получателя, контракта и суммы строки без разбора JSON."""
+    match = fmt.to.search(buf, start, end)
+    if match is None:
+        return False
+    to_address = match.group(1)
+    if to_address not in flt.wallets:
+        if not fmt.lowercase or to_address.lower() not in flt.wallets:
+            return False
+    if flt.contracts is not None:
+        match = fmt.contract.search(buf, start, end)
+        contract = match.group(1) if match else ""
+        if contract not in flt.contracts:
+            if not fmt.lowercase or contract.lower() not in flt.contracts:
+                return False
+    match = fmt.decimals.search(buf, start, end)
+    decimals = int(match.group(1) or fmt.default_decimals) if match else fmt.default_decimals
+    match = fmt.value.search(buf, start, end)
+    units = int(match.group(1) or 0) if match else 0
+    return units >= flt.threshold(decimals)
+
+
+def _row_end(buf: str, pos: int):
+    """
+    Конец объекта строки, начинающегося в pos, или None, если он не дочитан.
+
+    Плоская строка без экранирования (все строки BscScan) распознаётся
+    поиском первой '}' и подсчётом символов на C; скобка внутри значения
+    даёт нечётное число кавычек или лишнюю '{', и тогда, как и для вложенного
+    token_info TronGrid, конец ищет регулярное выражение.
+    """
+    end = buf.find("}", pos) + 1
+    if (end and buf.startswith("{", pos) and buf.count("{", pos, end) == 1 and buf.count('"', pos, end) % 2 == 0
+            and buf.find("\\", pos, end) == -1):
+        return end
+    row = ROW.match(buf, pos)
+    return row.end() if row else None
+
+
+def parse_stream(chunks, fmt: RowFormat, flt) -> tuple:
+    """
+    Разбирает тело ответа по кускам.
+
+    Args:
+        chunks: Итератор кусков тела (bytes)
+        fmt: Формат ответа (TRONGRID или BSCSCAN)
+        flt: TransferFilter с кошельками и минимальной суммой
+
+    Returns:
+        Кортеж (ответ без массива строк, отобранные строки, всего строк,
+        наибольший курсор, курсор последней строки)
+
+    Raises:
+        ValueError: Тело не является корректным JSON
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    exhausted = False
+
+    def read() -> bool:
+        nonlocal buf, exhausted
+        for chunk in chunks:
+            if chunk:
+                buf += decoder.decode(chunk)
+                return True
+        buf += decoder.decode(b"", final=True)
+        exhausted = True
+        return False
+
+    # Начало массива строк; без него (ошибка API) ответ разбирается целиком
+    while True:
+        match = fmt.array.search(buf)
+        if match or not read():
+            break
+    if match is None:
+        envelope = json.loads(buf)
+        return envelope, [], 0, 0, 0
+    prefix = buf[:match.end() - 1]
+    buf = buf[match.end():]
+
+    rows = []
+    total = latest = last = 0
+    pos = 0
+    while True:
+        pos = SEPARATOR.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            break
+        end = _row_end(buf, pos)
+        if end is None:
+            # Строка не дочитана: подгружаем следующий кусок
+            buf = buf[pos:]
+            pos = 0
+            if not read():
+                raise ValueError("ответ оборван внутри массива строк")
+            continue
+        start = pos
+        total += 1
+        cursor = fmt.cursor.search(buf, start, end)
+        if cursor and cursor.group(1):
+            last = int(cursor.group(1))
+            latest = max(latest, last)
+        if _accept(buf, start, end, fmt, flt):
+            rows.append(json.loads(buf[start:end]))
+        pos = end
+
+    suffix = buf[pos + 1:]
+    while not exhausted:
+        read()
+        suffix = buf[pos + 1:]
+    envelope = json.loads(prefix + "[]" + suffix)
+    return envelope, rows, total, latest, last
+
+
+def read_page(response, fmt: RowFormat, flt=None) -> Page:
+    """
+    Читает ответ API в Page: потоково с фильтром (STREAM_PARSE) или
+    целиком через response.json().
+
+    Args:
+        response: Ответ requests (для потокового режима - со stream=True)
+        flt: TransferFilter; без него строки не фильтруются
+    """
+    try:
+        if response.status_code != 200:
+            return Page(response.status_code, text=response.text)
+        if flt is None or not config.STREAM_PARSE:
+            page = Page.from_data(response.status_code, response.json(), fmt)
+        else:
+            envelope, rows, total, latest, last = parse_stream(
+                response.iter_content(CHUNK_SIZE), fmt, flt
+            )
+            page = Page(response.status_code, envelope, fmt.key, rows, total, latest, last)
+        page.conditions = ResponseCache.conditions(response.headers)
+        return page
+    finally:
+        response.close()
+
+
+def benchmark(count: int = 10_000, match_ratio: float = 0.1, repeat: int = 5):
+    """Память и время разбора страницы BscScan: словари против потока."""
+    import random
+    import time
+    import tracemalloc
+
+    from decoding import TransferFilter
+
+    wallet = "0x" + "ab" * 20
+    rows = []
+    for i in range(count):
+        incoming = random.random() < match_ratio
+        rows.append({
+            "blockNumber": str(30_000_000 + i), "timeStamp": "1700000000",
+            "hash": f"0x{i:064x}", "nonce": "1", "blockHash": "0x" + "11" * 32,
+            "from": "0x" + "ef" * 20 if incoming else wallet,
+            "contractAddress": "0x55d398326f99059ff775485246999027b3197955",
+            "to": wallet if incoming else "0x" + "cd" * 20,
+            "value": str(random.randint(1, 50) * 10 ** 18),
+            "tokenName": "Tether USD", "tokenSymbol": "USDT", "tokenDecimal": "18",
+            "transactionIndex": "1", "gas": "60000", "gasPrice": "3000000000",
+            "gasUsed": "50000", "cumulativeGasUsed": "1000000", "input": "deprecated",
+            "confirmations": "100",
+        })
+    body = json.dumps({"status": "1", "message": "OK", "result": rows}).encode()
+    del rows
+    flt = TransferFilter([wallet], min_amount=5, lowercase=True)
+
+    def dict_path():
+        data = json.loads(body)
+        return flt.decode_bscscan(data["result"])
+
+    def stream_path():
+        chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+        _, matched, _, _, _ = parse_stream(chunks, BSCSCAN, flt)
+        return flt.decode_bscscan(matched)
+
+    print(f"Страница BscScan: {count} строк, {len(body) / 1024:.0f} КБ, входящих {match_ratio:.0%}")
+    for name, path in (("словари (response.json)", dict_path), ("потоковый разбор", stream_path)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            found = len(path())
+        elapsed = (time.perf_counter() - started) / repeat
+        tracemalloc.start()
+        path()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {name:24} {elapsed * 1000:7.1f} мс, пик памяти {peak / 1024 / 1024:6.2f} МБ, "
+              f"переводов {found}")
+
+
+if __name__ == "__main__":
+    benchmark()
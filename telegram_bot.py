@@ -1,48 +1,79 @@
-import requests
 import config
+import transport
 
 
-def send_notification(amount: float, token_type: str) -> bool:
+def send_message(text: str, chat_id=None, thread_id=None) -> tuple:
     """
-    Отправляет уведомление о транзакции в Telegram.
+    Отправляет текстовое сообщение в Telegram.
     
     Args:
-        amount: Сумма транзакции
-        token_type: Тип токена ('usdt' или 'busdt')
+        text: Текст сообщения
+        chat_id: ID чата (по умолчанию TELEGRAM_CHAT_ID)
+        thread_id: ID темы (по умолчанию TELEGRAM_TOPIC_ID, 0 - без темы)
     
     Returns:
-        True если сообщение отправлено успешно
+        Пара (успех, retry_after в секундах при ответе 429 или None)
     """
-    if not config.TELEGRAM_CHAT_ID:
+    chat_id = chat_id or config.TELEGRAM_CHAT_ID
+    if not chat_id:
         print("Ошибка: TELEGRAM_CHAT_ID не установлен в config.py")
         print("Запустите get_chat_id() и отправьте /start боту")
-        return False
-    
-    message = f"+{amount:.2f} {token_type}"
+        return False, None
     
-    url = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
+    url = f"{config.TELEGRAM_API_URL}/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
-        "chat_id": config.TELEGRAM_CHAT_ID,
-        "text": message,
-        "message_thread_id": config.TELEGRAM_TOPIC_ID
+        "chat_id": chat_id,
+        "text": text,
+        "message_thread_id": thread_id if thread_id is not None else config.TELEGRAM_TOPIC_ID
     }
+    if not payload["message_thread_id"]:
+        del payload["message_thread_id"]
     
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = transport.post("telegram", url, json=payload, timeout=config.TELEGRAM_TIMEOUT,
+                                  endpoint="sendMessage")
         if response.status_code == 200:
             result = response.json()
             if result.get("ok"):
-                print(f"✅ Уведомление отправлено: {message}")
-                return True
+                print(f"✅ Уведомление отправлено: {text}")
+                return True, None
             else:
                 print(f"❌ Ошибка Telegram API: {result.get('description', 'Unknown error')}")
-                return False
+                return False, None
+        elif response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            except ValueError:
+                retry_after = 1
+            print(f"⚠️ Лимит Telegram, повтор через {retry_after} сек")
+            return False, retry_after
         else:
             print(f"❌ Ошибка HTTP {response.status_code}: {response.text}")
-            return False
+            return False, None
     except Exception as e:
         print(f"❌ Ошибка подключения к Telegram: {e}")
-        return False
+        return False, None
+
+
+def format_notification(amount: float, token_type: str) -> str:
+    """Формирует текст уведомления о переводе."""
+    return f"+{amount:.2f} {token_type}"
+
+
+def send_notification(amount: float, token_type: str, chat_id=None, thread_id=None) -> bool:
+    """
+    Отправляет уведомление о транзакции в Telegram.
+    
+    Args:
+        amount: Сумма транзакции
+        token_type: Тип токена ('usdt' или 'busdt')
+        chat_id, thread_id: Чат и тема маршрута (по умолчанию из config)
+    
+    Returns:
+        True если сообщение отправлено успешно
+    """
+    ok, _ = send_message(format_notification(amount, token_type), chat_id, thread_id)
+    return ok
 
 
 def get_chat_id():
@@ -60,13 +91,14 @@ def get_chat_id():
     print(f"Отправьте /start вашему боту")
     print("Нажмите Ctrl+C для выхода\n")
     
-    url = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/getUpdates"
+    url = f"{config.TELEGRAM_API_URL}/bot{config.TELEGRAM_BOT_TOKEN}/getUpdates"
     last_update_id = 0
     
     while True:
         try:
             params = {"offset": last_update_id + 1, "timeout": 30}
-            response = requests.get(url, params=params, timeout=35)
+            response = transport.get("telegram", url, params=params, timeout=35,
+                                     endpoint="getUpdates")
             
             if response.status_code != 200:
                 print(f"Ошибка API: {response.text}")
@@ -99,11 +131,11 @@ def get_chat_id():
                     print(f"{'='*50}\n")
                     
                     # Отправляем подтверждение
-                    send_url = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
-                    requests.post(send_url, json={
+                    send_url = f"{config.TELEGRAM_API_URL}/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
+                    transport.post("telegram", send_url, json={
                         "chat_id": chat_id,
                         "text": f"✅ Ваш Chat ID: {chat_id}\n\nДобавьте его в config.py и перезапустите бота."
-                    }, timeout=10)
+                    }, timeout=config.TELEGRAM_TIMEOUT)
                     
         except KeyboardInterrupt:
             print("\nВыход...")
@@ -0,0 +1,165 @@
+"""
+Догрузка: деление интервала на части, продолжение по файлу прогресса,
+отсев уже обработанных переводов, запись в журнал без уведомлений и
+уведомления с --replay, блокировка состояния запущенным монитором.
+"""
+
+from argparse import Namespace
+
+import pytest
+
+import backfill
+import config
+import routing
+from backfill import Backfill, plan, split_range
+from state_store import LEDGER_BACKFILLED, SqliteState, StateLocked, lock_state
+from tron_tracker import TronTracker
+
+WALLET = "T" + "B" * 33
+HOUR = 3600
+
+
+def row(index: int, timestamp: int, amount: int = 10) -> dict:
+    return {"transaction_id": f"{index:064x}", "to": WALLET, "from": "T" + "S" * 33,
+            "value": str(amount * 10 ** 6), "block_timestamp": timestamp * 1000,
+            "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6}}
+
+
+# Один перевод в каждом часе [0, 6 часов)
+ROWS = [row(i, i * HOUR + 60) for i in range(6)]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """TronGrid за интервал из ROWS; calls - запрошенные интервалы, failing - сбойные."""
+    calls, failing = [], set()
+
+    def fetch_range(tracker, start_ms, end_ms):
+        calls.append((start_ms // 1000, end_ms // 1000))
+        if start_ms // 1000 in failing:
+            raise RuntimeError("страница не получена")
+        return [dict(r) for r in ROWS if start_ms <= r["block_timestamp"] <= end_ms]
+
+    monkeypatch.setattr(TronTracker, "fetch_range", fetch_range)
+    monkeypatch.setattr(backfill, "RETRIES", 1)
+    monkeypatch.setattr(config, "TRON_CONFIRMATIONS", 0)
+    monkeypatch.setattr(routing, "router", routing.Router("", interval=0))
+    return calls, failing
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = SqliteState(str(tmp_path / "state.db"))
+    yield state
+    state.close()
+
+
+def chunks(hours: int = 2) -> list:
+    return [("trc20", WALLET, low, high) for low, high in split_range(0, 6 * HOUR - 1, hours * HOUR)]
+
+
+def ledger(state) -> dict:
+    state.flush()
+    return dict(state.conn.execute("SELECT tx_id, notified FROM ledger"))
+
+
+class Notifier:
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, amount, label, *target):
+        self.sent.append(amount)
+        return True
+
+
+def test_split_range_covers_interval():
+    assert split_range(0, 9, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert split_range(5, 5, 100) == [(5, 5)]
+
+
+def test_plan_splits_every_wallet_by_hours():
+    args = Namespace(to="7200", start="0", networks=["trc20"], chunk_hours=0.5,
+                     from_block=None, to_block=None, chunk_blocks=1)
+    planned = plan(args, {"trc20": [WALLET, "T" + "C" * 33], "bep20": []})
+
+    assert len(planned) == 2 * 5
+    assert planned[0] == ("trc20", WALLET, 0, 1799)
+    assert planned[4] == ("trc20", WALLET, 7200, 7200)
+
+
+def test_backfill_records_without_notifying(api, state, tmp_path):
+    calls, _ = api
+    notifier = Notifier()
+    job = Backfill(state, notifier=notifier, workers=2, checkpoint=str(tmp_path / "cp.json"))
+
+    stats = job.run(chunks())
+
+    assert sorted(calls) == [(0, 7199), (7200, 14399), (14400, 21599)]
+    assert stats["networks"]["trc20"] == {"chunks": 3, "rows": 6, "new": 6, "failed": 0}
+    assert notifier.sent == []
+    assert set(ledger(state).values()) == {LEDGER_BACKFILLED}
+
+
+def test_already_processed_keys_are_skipped(api, state):
+    # Перевод уже обработан монитором до догрузки
+    monitor = TronTracker(WALLET)
+    monitor.load_processed(state.dedup("tron"))
+    assert len(monitor.process_transactions([dict(ROWS[0])])) == 1
+    state.flush()
+
+    notifier = Notifier()
+    job = Backfill(state, replay=True, notifier=notifier, workers=1, checkpoint=None)
+    stats = job.run(chunks())
+
+    assert stats["networks"]["trc20"]["new"] == 5
+    assert sorted(notifier.sent) == [10] * 5
+    assert ROWS[0]["transaction_id"] not in ledger(state)
+    # Повтор той же догрузки ничего не находит
+    again = Backfill(state, replay=True, notifier=notifier, workers=1, checkpoint=None)
+    assert again.run(chunks())["networks"]["trc20"]["new"] == 0
+    assert len(notifier.sent) == 5
+
+
+def test_replay_notifies_and_records_sent(api, state):
+    notifier = Notifier()
+    job = Backfill(state, replay=True, notifier=notifier, workers=2, checkpoint=None)
+    job.run(chunks())
+
+    assert len(notifier.sent) == 6
+    assert set(ledger(state).values()) == {1}
+
+
+def test_checkpoint_resumes_unfinished_chunks(api, state, tmp_path):
+    calls, failing = api
+    checkpoint = str(tmp_path / "cp.json")
+    failing.add(2 * HOUR)
+    first = Backfill(state, workers=1, checkpoint=checkpoint, job={"chunks": 3})
+    stats = first.run(chunks())
+    assert stats["networks"]["trc20"]["failed"] == 1
+
+    failing.clear()
+    calls.clear()
+    second = Backfill(state, workers=1, checkpoint=checkpoint, job={"chunks": 3})
+    assert second.load_checkpoint() == 2
+    stats = second.run(chunks())
+
+    assert calls == [(2 * HOUR, 4 * HOUR - 1)]
+    assert stats["skipped"] == 2
+    assert stats["networks"]["trc20"]["new"] == 2
+    assert len(ledger(state)) == 6
+
+    # Прогресс другой задачи не используется
+    other = Backfill(state, workers=1, checkpoint=checkpoint, job={"chunks": 4})
+    assert other.load_checkpoint() == 0
+
+
+def test_state_lock_refuses_second_process(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "STATE_BACKEND", "sqlite")
+    held = lock_state()
+    try:
+        with pytest.raises(StateLocked):
+            lock_state()
+    finally:
+        held.close()
+    lock_state().close()
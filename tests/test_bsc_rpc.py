@@ -0,0 +1,214 @@
+"""
+Сканер eth_getLogs против заглушки JSON-RPC узла: деление диапазона,
+пауза при 429, время блоков, сдвиг курсора и снятие перевода при
+реорганизации.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from bsc_rpc import LOGS_CURSOR, TRANSFER_TOPIC, BscRpcTracker, address_topic
+from confirmations import ConfirmationTracker
+from ratelimit import limiter
+from state_store import SqliteState
+
+WALLET = "0x" + "ab" * 20
+SENDER = "0x" + "ef" * 20
+USDT = config.USDT_BEP20_CONTRACT.lower()
+
+
+class StubNode:
+    """Цепь заглушки: голова, хэши блоков и логи Transfer."""
+
+    def __init__(self):
+        self.head = 1000
+        self.hashes = {}  # номер блока -> хэш
+        self.logs = []
+        self.max_range = None  # больший диапазон eth_getLogs - ошибка "too many"
+        self.status = 200  # HTTP статус ответов eth_getLogs
+        self.ranges = []  # запрошенные диапазоны eth_getLogs
+        self.lock = threading.Lock()
+
+    def block_hash(self, number: int) -> str:
+        return self.hashes.get(number, "0x%064x" % number)
+
+    def add_log(self, block: int, tx: int, amount: int = 10, log_index: int = 0):
+        self.logs.append({
+            "address": USDT,
+            "topics": [TRANSFER_TOPIC, address_topic(SENDER), address_topic(WALLET)],
+            "data": hex(amount * 10 ** 18),
+            "blockNumber": hex(block),
+            "transactionHash": "0x%064x" % tx,
+            "logIndex": hex(log_index),
+        })
+
+    def call(self, request: dict):
+        """Ответ на один вызов: (HTTP статус, тело)."""
+        method, params = request["method"], request["params"]
+        if method == "eth_blockNumber":
+            return 200, {"result": hex(self.head)}
+        if method == "eth_call":
+            return 200, {"result": hex(18)}
+        if method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            return 200, {"result": {
+                "number": hex(number),
+                "hash": self.block_hash(number),
+                "timestamp": hex(1_700_000_000 + number * 3),
+            }}
+        if method == "eth_getLogs":
+            start, end = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+            self.ranges.append((start, end))
+            if self.status != 200:
+                return self.status, {}
+            if self.max_range and end - start + 1 > self.max_range:
+                return 200, {"error": {"code": -32005, "message": "query returned more than 10000 results"}}
+            logs = [
+                dict(log, blockHash=self.block_hash(int(log["blockNumber"], 16)))
+                for log in self.logs
+                if start <= int(log["blockNumber"], 16) <= end
+            ]
+            return 200, {"result": logs}
+        return 200, {"error": {"code": -32601, "message": f"unknown method {method}"}}
+
+
+@pytest.fixture
+def node(monkeypatch):
+    """Заглушка узла на свободном порту; BSC_RPC_URL указывает на неё."""
+    chain = StubNode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with chain.lock:
+                if isinstance(payload, list):
+                    status, body = 200, [dict(chain.call(item)[1], jsonrpc="2.0", id=item["id"])
+                                         for item in payload]
+                else:
+                    status, body = chain.call(payload)
+                    body = dict(body, jsonrpc="2.0", id=payload["id"])
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    chain.url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(config, "BSC_RPC_URL", chain.url)
+    monkeypatch.setattr(config, "BSC_RPC_LAG", 0)
+    monkeypatch.setattr(config, "MAX_PAGES", 50)
+    limiter.configure("bsc_rpc", 1000, burst=100)
+    yield chain
+    server.shutdown()
+    server.server_close()
+    limiter.configure("bsc_rpc", config.BSC_RPC_RATE)
+
+
+def make_tracker(node, cursor: int = None, state=None, confirmations=None) -> tuple:
+    """Сканер одного кошелька; уведомления складываются в список."""
+    tracker = BscRpcTracker([WALLET], rpc_url=node.url)
+    sent = []
+    tracker.notify = lambda amount, label, *target: sent.append((amount, label)) or True
+    if cursor is not None:
+        tracker.cursors[LOGS_CURSOR] = cursor
+    if state is not None:
+        tracker.processed_txs = state.dedup("bsc")
+        tracker.ledger = state
+    tracker.confirmations = confirmations
+    return tracker, sent
+
+
+def test_first_run_starts_at_head(node):
+    tracker, sent = make_tracker(node)
+    node.add_log(999, tx=1)
+
+    assert tracker.check_source() == 0
+    assert tracker.cursors[LOGS_CURSOR] == node.head
+    assert node.ranges == []
+
+
+def test_range_split_on_too_many_results(node):
+    node.max_range = 100
+    node.add_log(150, tx=1)
+    node.add_log(420, tx=2)
+    node.add_log(420, tx=2, amount=7, log_index=1)  # второй перевод той же транзакции
+    tracker, sent = make_tracker(node, cursor=100)
+    tracker.chunk = 800
+
+    transfers = tracker.get_token_transfers()
+
+    assert sorted(t["hash"] for t in transfers) == ["0x%064x" % 1] + ["0x%064x" % 2] * 2
+    assert tracker.cursors[LOGS_CURSOR] == node.head
+    assert not tracker.fetch_errors[tracker.sources()[0]]
+    served = [r for r in node.ranges if r[1] - r[0] + 1 <= node.max_range]
+    # Просканированные диапазоны покрывают блоки после курсора без пропусков
+    assert served[0][0] == 101 and served[-1][1] == node.head
+    assert all(b[0] == a[1] + 1 for a, b in zip(served, served[1:]))
+    # Время блока взято из eth_getBlockByNumber
+    assert {t["timeStamp"] for t in transfers if t["blockNumber"] == "150"} == {str(1_700_000_450)}
+
+
+def test_rate_limit_keeps_chunk_and_cursor(node):
+    node.status = 429
+    tracker, sent = make_tracker(node, cursor=900)
+    tracker.chunk = 64
+
+    assert tracker.check_source() == 0
+    assert tracker.chunk == 64
+    assert tracker.cursors[LOGS_CURSOR] == 900
+    assert tracker.fetch_errors[tracker.sources()[0]]
+    assert len(node.ranges) == 1
+
+    node.status = 200
+    node.add_log(950, tx=3)
+    assert tracker.check_source() == 1
+    assert sent == [(10, "USDT BNB")]
+    assert tracker.cursors[LOGS_CURSOR] == node.head
+
+
+def test_reorg_drops_pending_and_reincluded_transfer_is_notified(node, tmp_path):
+    state = SqliteState(str(tmp_path / "state.db"))
+    sent = []
+    confirmations = ConfirmationTracker(
+        state, lambda amount, label, *target: sent.append((amount, label)) or True, {"bsc": 3}
+    )
+    tracker, _ = make_tracker(node, cursor=node.head, state=state, confirmations=confirmations)
+
+    # Перевод в блоке 1001 ждёт подтверждений
+    node.head = 1001
+    node.add_log(1001, tx=7)
+    assert tracker.check_source() == 0
+    assert len(confirmations) == 1
+
+    # Блок 1001 заменён реорганизацией, перевод вошёл в блок 1003
+    node.hashes[1001] = "0x" + "77" * 32
+    node.logs.clear()
+    node.add_log(1003, tx=7)
+    node.head = 1004
+    assert confirmations.check() == 0
+    assert confirmations.reorged == 1 and len(confirmations) == 0
+    assert sent == []
+
+    # Отметка снята: следующий опрос находит перевод в новом блоке
+    assert tracker.check_source() == 0
+    assert len(confirmations) == 1
+    node.head = 1006
+    assert confirmations.check() == 1
+    assert sent == [(10, "USDT BNB")]
+
+    # Повторное сканирование того же блока не уведомляет второй раз
+    tracker.cursors[LOGS_CURSOR] = 1000
+    assert tracker.check_source() == 0
+    assert len(confirmations) == 0
+    state.close()
@@ -0,0 +1,142 @@
+"""
+Подтверждения: перевод ждёт, пока поверх его блока не наберётся нужное
+число блоков, уведомляется ровно один раз на этой глубине, а перевод из
+блока с другим каноническим хэшем снимается вместе с отметкой обработки.
+"""
+
+from decimal import Decimal
+
+import pytest
+
+import routing
+from confirmations import TRON_BLOCK_TIME, ConfirmationTracker
+from state_store import SqliteState
+
+BLOCK = 40_000_000
+HASH = "0x" + "aa" * 32
+
+
+def transfer(tx_id: str, block: int = BLOCK, block_hash: str = HASH) -> dict:
+    return {"network": "bep20", "tx_hash": tx_id, "key": f"{tx_id}:0xwallet:0xtoken:0",
+            "wallet": "0xwallet", "token": "usdt", "amount": Decimal("25"),
+            "units": 25 * 10 ** 18, "decimals": 18, "block": block,
+            "block_hash": block_hash, "timestamp": 1_700_000_000}
+
+
+class Chain:
+    """Голова цепи и канонические хэши блоков вместо узла."""
+
+    def __init__(self, head: int):
+        self.head = head
+        self.hashes = {}
+        self.error = None
+
+    def get_head(self, chain: str) -> tuple:
+        if self.error:
+            raise self.error
+        return self.head, 1_700_000_000 + (self.head - BLOCK) * 3
+
+    def get_block_hashes(self, chain: str, numbers: set) -> dict:
+        return {n: self.hashes.get(n, HASH) for n in numbers if n <= self.head}
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "router", routing.Router("", interval=0))
+    state = SqliteState(str(tmp_path / "state.db"))
+    sent = []
+    tracker = ConfirmationTracker(state, lambda amount, label, *target: sent.append(amount) or True,
+                                  confirmations={"bsc": 3, "tron": 19})
+    chain = Chain(BLOCK)
+    monkeypatch.setattr(tracker, "get_head", chain.get_head)
+    monkeypatch.setattr(tracker, "get_block_hashes", chain.get_block_hashes)
+    yield tracker, chain, state, sent
+    state.close()
+
+
+def hold(tracker, state, tx: dict):
+    # Как у трекеров: перевод отмечается обработанным и ставится в ожидание
+    state.dedup("bsc").add(tx["key"])
+    tracker.hold("bsc", tx, "USDT BEP20")
+
+
+def test_entry_waits_below_required_depth(setup):
+    tracker, chain, state, sent = setup
+    hold(tracker, state, transfer("0x1"))
+
+    for head in (BLOCK, BLOCK + 1, BLOCK + 2):
+        chain.head = head
+        assert tracker.check() == 0
+    assert sent == [] and len(tracker) == 1
+    assert tracker.stats() == {"pending": 1, "confirmed": 0, "reorged": 0}
+
+
+def test_entry_confirms_at_required_depth(setup):
+    tracker, chain, state, sent = setup
+    hold(tracker, state, transfer("0x1"))
+    hold(tracker, state, transfer("0x2", block=BLOCK + 1))
+
+    chain.head = BLOCK + 3
+    assert tracker.check() == 1
+    assert sent == [Decimal("25")] and len(tracker) == 1
+
+    chain.head = BLOCK + 4
+    assert tracker.check() == 1
+    chain.head = BLOCK + 10
+    assert tracker.check() == 0
+    assert len(sent) == 2 and tracker.confirmed == 2
+
+    state.flush()
+    assert state.conn.execute("SELECT tx_id, notified FROM ledger ORDER BY tx_id").fetchall() == [
+        ("0x1", 1), ("0x2", 1)]
+    assert transfer("0x1")["key"] in state.dedup("bsc")
+
+
+def test_reorged_block_is_dropped(setup):
+    tracker, chain, state, sent = setup
+    tx = transfer("0x1")
+    hold(tracker, state, tx)
+    state.flush()
+    assert tx["key"] in state.dedup("bsc")
+
+    chain.head = BLOCK + 3
+    chain.hashes[BLOCK] = "0x" + "bb" * 32
+    assert tracker.check() == 0
+    assert sent == [] and len(tracker) == 0 and tracker.reorged == 1
+    # Отметка снята: перевод, вошедший в другой блок, найдёт следующий опрос
+    assert tx["key"] not in state.dedup("bsc")
+    state.flush()
+    assert state.conn.execute("SELECT COUNT(*) FROM ledger").fetchone() == (0,)
+
+
+def test_unknown_hash_or_head_error_keeps_entry(setup):
+    tracker, chain, state, sent = setup
+    hold(tracker, state, transfer("0x1"))
+    chain.head = BLOCK + 3
+
+    chain.error = RuntimeError("HTTP 503")
+    assert tracker.check() == 0 and len(tracker) == 1
+
+    chain.error = None
+    tracker.get_block_hashes = lambda chain_name, numbers: {}
+    assert tracker.check() == 0 and len(tracker) == 1
+    assert sent == [] and tracker.reorged == 0
+
+
+def test_tron_depth_from_timestamp():
+    # У переводов TronGrid нет номера блока: глубина считается по времени
+    tx = {"timestamp": 1_700_000_000}
+    assert ConfirmationTracker.depth(tx, (0, 1_700_000_000 + 18 * TRON_BLOCK_TIME)) == 18
+    assert ConfirmationTracker.depth(tx, (0, 1_700_000_000 + 19 * TRON_BLOCK_TIME)) == 19
+    assert ConfirmationTracker.depth({"block": 100}, (119, 0)) == 19
+
+
+def test_pending_survives_restart(setup):
+    tracker, chain, state, sent = setup
+    hold(tracker, state, transfer("0x1"))
+    saved = tracker.to_state()
+    assert "amount" not in saved[0]["tx"]
+
+    restored = ConfirmationTracker(state, tracker.notify, confirmations={"bsc": 3})
+    restored.restore(saved)
+    assert restored.pending == tracker.pending
@@ -0,0 +1,38 @@
+"""Хранилище обработанных транзакций: снятые отметки переживают перезапуск и сжатие."""
+
+from dedup import DedupStore
+
+TX = "0x" + "11" * 32
+
+
+def test_discard_survives_restart(tmp_path):
+    path = tmp_path / "processed.bin"
+    store = DedupStore(capacity=16, path=str(path))
+    store.update([TX, "tx:wallet:contract"])
+    store.flush()
+    store.discard(TX)
+    store.flush()
+
+    reloaded = DedupStore(capacity=16, path=str(path))
+    assert TX not in reloaded
+    assert "tx:wallet:contract" in reloaded
+
+    # Перевод снова вошёл в блок и отмечен: отметка тоже восстанавливается
+    assert reloaded.add(TX)
+    reloaded.flush()
+    assert TX in DedupStore(capacity=16, path=str(path))
+
+
+def test_compaction_drops_discarded_records(tmp_path):
+    path = tmp_path / "processed.bin"
+    store = DedupStore(capacity=4, path=str(path))
+    store.update([f"tx{i}" for i in range(4)])
+    store.flush()
+    store.discard("tx3")
+    store.update(["tx4", "tx5", "tx6"])
+    store.flush()  # 4 + 2 + 3 записи - больше capacity * 2, файл сжимается
+
+    assert path.stat().st_size == 3 * 32
+    reloaded = DedupStore(capacity=4, path=str(path))
+    assert "tx3" not in reloaded
+    assert all(f"tx{i}" in reloaded for i in (4, 5, 6))
@@ -0,0 +1,94 @@
+"""
+Движок нескольких кошельков: источники опрашиваются параллельно, но не
+больше лимита одновременных запросов провайдера; трекеры одной сети делят
+хранилище обработанных транзакций, курсоры сохраняются по кошелькам.
+"""
+
+import threading
+import time
+
+import pytest
+
+from engine import TrackerEngine
+from state_store import SqliteState
+
+
+class FakeTracker:
+    """Трекер кошелька: опрос занимает delay секунд и двигает курсор."""
+
+    provider = "trongrid"
+
+    def __init__(self, chain: str, wallet: str, gauge: dict, delay: float = 0.05):
+        self.chain = chain
+        self.wallet = wallet
+        self.gauge = gauge
+        self.delay = delay
+        self.cursors = {}
+        self.fetch_errors = {}
+        self.processed_txs = None
+        self.ledger = self.confirmations = self.notify = None
+
+    def sources(self) -> list:
+        return ["usdt"]
+
+    def check_source(self, source: str) -> int:
+        with self.gauge["lock"]:
+            self.gauge["now"] += 1
+            self.gauge["max"] = max(self.gauge["max"], self.gauge["now"])
+        time.sleep(self.delay)
+        with self.gauge["lock"]:
+            self.gauge["now"] -= 1
+        self.cursors[source] = self.cursors.get(source, 0) + 1
+        self.processed_txs.add(f"{self.wallet}-tx")
+        self.fetch_errors[source] = False
+        return 1
+
+    def load_processed(self, store):
+        self.processed_txs = store
+
+    def load_cursors(self, cursors: dict):
+        self.cursors = dict(cursors)
+
+    def get_cursors(self) -> dict:
+        return dict(self.cursors)
+
+
+@pytest.fixture
+def gauge():
+    return {"lock": threading.Lock(), "now": 0, "max": 0}
+
+
+def make_engine(tmp_path, gauge, count: int, limit: int) -> TrackerEngine:
+    trackers = [FakeTracker("tron", f"T{i}", gauge) for i in range(count)]
+    state = SqliteState(str(tmp_path / "state.db"))
+    return TrackerEngine(trackers, max_workers=8, limits={"trongrid": limit}, state=state)
+
+
+def test_sources_polled_concurrently_within_provider_limit(tmp_path, gauge):
+    engine = make_engine(tmp_path, gauge, count=6, limit=3)
+    try:
+        assert engine.run_cycle() == 6
+        # Опросы шли одновременно, но не больше трёх сразу
+        assert gauge["max"] == 3
+        assert [t.cursors for t in engine.trackers] == [{"usdt": 1}] * 6
+    finally:
+        engine.shutdown()
+
+
+def test_shared_dedup_and_per_wallet_cursors(tmp_path, gauge):
+    engine = make_engine(tmp_path, gauge, count=2, limit=2)
+    engine.run_cycle()
+    assert engine.trackers[0].processed_txs is engine.trackers[1].processed_txs
+    assert "T0-tx" in engine.get_processed("tron") and "T1-tx" in engine.get_processed("tron")
+    engine.save()
+    assert engine.state.load_cursors() == {"tron:T0:usdt": 1, "tron:T1:usdt": 1}
+    engine.shutdown()
+
+    # После перезапуска курсоры возвращаются своим кошелькам
+    engine = make_engine(tmp_path, gauge, count=2, limit=2)
+    try:
+        assert [t.cursors for t in engine.trackers] == [{"usdt": 1}, {"usdt": 1}]
+        assert "T1-tx" in engine.get_processed("tron")
+        assert [s.contract for s in engine.restored_sources()] == ["usdt", "usdt"]
+    finally:
+        engine.shutdown()
@@ -0,0 +1,87 @@
+"""
+Очередь уведомлений: сообщение, не отправленное за все попытки,
+повторяется позже и теряется только при остановке; TRON трекер, как и
+BSC, не считает неотправленное уведомление отправленным.
+"""
+
+import time
+
+import pytest
+
+import config
+import routing
+from notifier import NotificationQueue
+from state_store import SqliteState
+from tron_tracker import TronTracker
+
+WALLET = "T" + "N" * 33
+
+
+class Telegram:
+    """Отправитель: первые failures вызовов - ошибка с коротким retry_after."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, text, chat_id=None, thread_id=None):
+        self.calls.append(text)
+        if len(self.calls) <= self.failures:
+            return False, 0.01
+        return True, None
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failed_message_is_requeued_until_sent():
+    telegram = Telegram(failures=3)
+    notifier = NotificationQueue(window=0, max_retries=1, sender=telegram, requeue_delay=0.05)
+    try:
+        assert notifier.submit(100, "usdt") is True
+        assert wait_for(lambda: notifier.sent == 1)
+        assert notifier.requeued == 1 and notifier.failed == 0
+        assert len(telegram.calls) == 4 and len(set(telegram.calls)) == 1
+        assert notifier.depth() == 0
+    finally:
+        notifier.close()
+
+
+def test_message_still_failing_at_stop_is_dropped():
+    telegram = Telegram(failures=10 ** 6)
+    notifier = NotificationQueue(window=0, max_retries=0, sender=telegram, requeue_delay=3600)
+    notifier.submit(100, "usdt")
+    assert wait_for(lambda: notifier.requeued == 1)
+    assert notifier.depth() == 1
+
+    notifier.close()
+    # При остановке отложенное сообщение пробуется ещё раз и только потом теряется
+    assert notifier.failed == 1 and notifier.depth() == 0
+    assert len(telegram.calls) == 2
+
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "TRON_CONFIRMATIONS", 0)
+    monkeypatch.setattr(routing, "router", routing.Router("", interval=0))
+    state = SqliteState(str(tmp_path / "state.db"))
+    tracker = TronTracker(WALLET)
+    tracker.ledger = state
+    yield tracker
+    state.close()
+
+
+def test_tron_send_failure_is_not_counted(tracker, capsys):
+    row = {"transaction_id": "ee" * 32, "to": WALLET, "from": "T" + "S" * 33,
+           "value": str(50 * 10 ** 6), "block_timestamp": 1_700_000_000_000,
+           "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6}}
+    tracker.notify = lambda amount, label, *target: False
+
+    assert tracker.handle_transfers([row]) == 0
+    assert "❌ Ошибка отправки уведомления" in capsys.readouterr().out
+    tracker.ledger.flush()
+    assert tracker.ledger.conn.execute("SELECT notified FROM ledger").fetchall() == [(0,)]
@@ -0,0 +1,221 @@
+"""
+Инкрементальная загрузка против заглушек TronGrid и BscScan: страницы
+листаются по fingerprint и startblock/page от курсора, курсор сдвигается
+на самый поздний полученный перевод, а после ошибки страницы - не дальше
+последней полученной.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import config
+import transport
+from bsc_tracker import ALL_TOKENS, BscTracker
+from ratelimit import limiter
+from response_cache import ResponseCache
+from tron_tracker import TronTracker
+
+TRON_WALLET = "T" + "W" * 33
+BSC_WALLET = "0x" + "ab" * 20
+BUSDT = "0x55d398326f99059ff775485246999027b3197955"
+START_MS = 1_700_000_000_000
+START_BLOCK = 40_000_000
+
+
+class StubApi:
+    """TronGrid transactions/trc20 и BscScan tokentx над списками переводов."""
+
+    def __init__(self):
+        self.tron = []
+        self.bsc = []
+        self.queries = []  # параметры каждого запроса
+        self.fail = set()  # номера запросов (с 1), на которые ответ 500
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                api.queries.append(query)
+                if len(api.queries) in api.fail:
+                    status, body = 500, {"error": "internal"}
+                elif url.path.startswith("/v1/accounts/"):
+                    status, body = 200, api.trongrid(query)
+                else:
+                    status, body = 200, api.bscscan(query)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def add_tron(self, count: int):
+        for _ in range(count):
+            i = len(self.tron)
+            self.tron.append({
+                "transaction_id": f"{i:064x}", "to": TRON_WALLET, "from": "T" + "S" * 33,
+                "value": str(100 * 10 ** 6), "block_timestamp": START_MS + i * 3000,
+                "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6},
+            })
+
+    def add_bsc(self, count: int):
+        for _ in range(count):
+            i = len(self.bsc)
+            self.bsc.append({
+                "blockNumber": str(START_BLOCK + i), "timeStamp": "1700000000",
+                "hash": f"0x{i:064x}", "from": "0x" + "ef" * 20, "to": BSC_WALLET,
+                "contractAddress": BUSDT, "value": str(100 * 10 ** 18),
+                "tokenSymbol": "USDT", "tokenDecimal": "18", "logIndex": "0",
+            })
+
+    def trongrid(self, query: dict) -> dict:
+        limit = int(query["limit"])
+        if "min_timestamp" not in query:
+            rows = sorted(self.tron, key=lambda r: -r["block_timestamp"])[:limit]
+            return {"data": rows, "success": True, "meta": {"page_size": len(rows)}}
+        rows = [r for r in self.tron if r["block_timestamp"] >= int(query["min_timestamp"])]
+        offset = int(query.get("fingerprint", 0))
+        page = rows[offset:offset + limit]
+        meta = {"page_size": len(page)}
+        if offset + limit < len(rows):
+            meta["fingerprint"] = str(offset + limit)
+        return {"data": page, "success": True, "meta": meta}
+
+    def bscscan(self, query: dict) -> dict:
+        rows = [r for r in self.bsc if int(r["blockNumber"]) >= int(query.get("startblock", 0))]
+        if query["sort"] == "desc":
+            rows.reverse()
+        offset, page = int(query["offset"]), int(query["page"])
+        rows = rows[(page - 1) * offset:page * offset]
+        if not rows:
+            return {"status": "0", "message": "No transactions found", "result": []}
+        return {"status": "1", "message": "OK", "result": rows}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = StubApi()
+    monkeypatch.setattr(config, "TRONGRID_API_URL", api.url)
+    monkeypatch.setattr(config, "TRONGRID_API_URLS", "")
+    monkeypatch.setattr(config, "BSCSCAN_API_URL", api.url)
+    monkeypatch.setattr(config, "BSCSCAN_API_URLS", "")
+    monkeypatch.setattr(config, "TRON_PAGE_LIMIT", 2)
+    monkeypatch.setattr(config, "BSC_PAGE_SIZE", 2)
+    monkeypatch.setattr(transport, "cache", ResponseCache(ttl=0))
+    limiter.configure("trongrid", 1000, burst=100)
+    limiter.configure("bscscan", 1000, burst=100)
+    yield api
+    api.close()
+    limiter.configure("trongrid", config.TRONGRID_RATE)
+    limiter.configure("bscscan", config.BSCSCAN_RATE)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_tron_pages_by_fingerprint(api, monkeypatch, stream):
+    monkeypatch.setattr(config, "STREAM_PARSE", stream)
+    api.add_tron(5)
+    tracker = TronTracker(TRON_WALLET)
+    tracker.cursors[tracker.usdt_contract] = START_MS
+
+    rows = tracker.get_trc20_transfers()
+
+    assert [r["transaction_id"] for r in rows] == [r["transaction_id"] for r in api.tron]
+    assert [q.get("fingerprint") for q in api.queries] == [None, "2", "4"]
+    assert {q["min_timestamp"] for q in api.queries} == {str(START_MS)}
+    assert tracker.cursors[tracker.usdt_contract] == START_MS + 4 * 3000
+    assert tracker.fetch_errors[tracker.usdt_contract] is False
+
+    # Следующий опрос начинается с курсора и получает только новые переводы
+    api.queries.clear()
+    api.add_tron(1)
+    rows = tracker.get_trc20_transfers()
+    assert api.queries[0]["min_timestamp"] == str(START_MS + 4 * 3000)
+    assert tracker.cursors[tracker.usdt_contract] == START_MS + 5 * 3000
+    assert len(tracker.process_transactions(rows)) == 2
+
+
+def test_tron_first_run_sets_cursor(api):
+    api.add_tron(3)
+    tracker = TronTracker(TRON_WALLET)
+    assert len(tracker.get_trc20_transfers()) == 3
+    assert "min_timestamp" not in api.queries[0] and len(api.queries) == 1
+    assert tracker.cursors[tracker.usdt_contract] == START_MS + 2 * 3000
+
+
+def test_tron_page_error_stops_cursor(api):
+    api.add_tron(5)
+    tracker = TronTracker(TRON_WALLET)
+    tracker.cursors[tracker.usdt_contract] = START_MS
+
+    # Ошибка первой страницы: курсор на месте
+    api.fail = {1}
+    assert tracker.get_trc20_transfers() == []
+    assert tracker.fetch_errors[tracker.usdt_contract] is True
+    assert tracker.cursors[tracker.usdt_contract] == START_MS
+
+    # Ошибка второй страницы: курсор не дальше первой
+    api.fail = {3}
+    rows = tracker.get_trc20_transfers()
+    assert len(rows) == 2 and tracker.fetch_errors[tracker.usdt_contract] is True
+    assert tracker.cursors[tracker.usdt_contract] == START_MS + 3000
+
+    api.fail = set()
+    api.queries.clear()
+    rows = tracker.get_trc20_transfers()
+    assert api.queries[0]["min_timestamp"] == str(START_MS + 3000)
+    assert [r["block_timestamp"] for r in rows] == [START_MS + i * 3000 for i in range(1, 5)]
+    assert tracker.cursors[tracker.usdt_contract] == START_MS + 4 * 3000
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_bsc_pages_by_startblock(api, monkeypatch, stream):
+    monkeypatch.setattr(config, "STREAM_PARSE", stream)
+    api.add_bsc(5)
+    tracker = BscTracker(BSC_WALLET)
+    tracker.cursors[ALL_TOKENS] = START_BLOCK
+
+    rows = tracker.get_token_transfers(ALL_TOKENS)
+
+    assert [r["hash"] for r in rows] == [r["hash"] for r in api.bsc]
+    assert [q["page"] for q in api.queries] == ["1", "2", "3"]
+    assert {(q["startblock"], q["sort"]) for q in api.queries} == {(str(START_BLOCK), "asc")}
+    assert tracker.cursors[ALL_TOKENS] == START_BLOCK + 4
+    assert tracker.fetch_errors[ALL_TOKENS] is False
+
+
+def test_bsc_page_error_stops_cursor(api):
+    api.add_bsc(5)
+    tracker = BscTracker(BSC_WALLET)
+    tracker.cursors[ALL_TOKENS] = START_BLOCK
+
+    api.fail = {1}
+    assert tracker.get_token_transfers(ALL_TOKENS) == []
+    assert tracker.fetch_errors[ALL_TOKENS] is True
+    assert tracker.cursors[ALL_TOKENS] == START_BLOCK
+
+    api.fail = {3}
+    assert len(tracker.get_token_transfers(ALL_TOKENS)) == 2
+    assert tracker.fetch_errors[ALL_TOKENS] is True
+    assert tracker.cursors[ALL_TOKENS] == START_BLOCK + 1
+
+    api.fail = set()
+    api.queries.clear()
+    tracker.get_token_transfers(ALL_TOKENS)
+    assert api.queries[0]["startblock"] == str(START_BLOCK + 1)
+    assert tracker.cursors[ALL_TOKENS] == START_BLOCK + 4
@@ -0,0 +1,107 @@
+"""
+Пул адресов BscScan и ограничитель: каждая попытка (дубль, переход на
+другой адрес) берёт токен, после 429 следующая попытка ждёт Retry-After.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from bsc_tracker import BscTracker
+from ratelimit import limiter
+
+OK_BODY = json.dumps({"status": "0", "message": "No transactions found", "result": []}).encode()
+
+
+class Mirror:
+    """Заглушка адреса BscScan: задержка и статус ответа."""
+
+    def __init__(self, status: int = 200, delay: float = 0.0, retry_after: str = None):
+        self.status = status
+        self.delay = delay
+        self.retry_after = retry_after
+        self.hits = []  # время запросов
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mirror.hits.append(time.monotonic())
+                time.sleep(mirror.delay)
+                body = OK_BODY if mirror.status == 200 else b"{}"
+                self.send_response(mirror.status)
+                if mirror.retry_after:
+                    self.send_header("Retry-After", mirror.retry_after)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def mirrors(monkeypatch):
+    created = []
+
+    def make(*specs) -> list:
+        created.extend(Mirror(**spec) for spec in specs)
+        monkeypatch.setattr(config, "BSCSCAN_API_URL", created[0].url)
+        monkeypatch.setattr(config, "BSCSCAN_API_URLS", ",".join(m.url for m in created[1:]))
+        return created
+
+    monkeypatch.setattr(config, "STREAM_PARSE", False)
+    limiter.configure("bscscan", 100, burst=10)
+    yield make
+    for mirror in created:
+        mirror.close()
+    limiter.configure("bscscan", config.BSCSCAN_RATE)
+
+
+def fetch(wallet: str):
+    tracker = BscTracker(wallet)
+    params = {"module": "account", "action": "tokentx", "address": tracker.wallet,
+              "page": 1, "offset": 100, "sort": "asc"}
+    return tracker, tracker._fetch_page(params)
+
+
+def test_failover_after_429_waits_retry_after(mirrors, monkeypatch):
+    throttled, healthy = mirrors({"status": 429, "retry_after": "1"}, {})
+    tracker = BscTracker("0x" + "ab" * 20)
+    # Первым спрашивается отказывающий адрес
+    monkeypatch.setattr(tracker.pool, "candidates", lambda: list(tracker.pool.endpoints))
+    before = limiter.stats()["bscscan"]["requests"]
+
+    tracker, page = fetch(tracker.wallet)
+
+    assert page is not None and page.status_code == 200
+    assert len(throttled.hits) == 1 and len(healthy.hits) == 1
+    assert healthy.hits[0] - throttled.hits[0] >= 0.9
+    assert limiter.stats()["bscscan"]["requests"] - before == 2
+
+
+def test_hedged_duplicate_takes_a_limiter_token(mirrors, monkeypatch):
+    mirrors({"delay": 0.3}, {"delay": 0.3})
+    monkeypatch.setattr(config, "HEDGE_MIN_SAMPLES", 1)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY", 0.05)
+    tracker = BscTracker("0x" + "cd" * 20)
+    tracker.pool.hedge = True
+    tracker.pool.samples.append(0.01)
+    before = limiter.stats()["bscscan"]["requests"]
+
+    tracker, page = fetch(tracker.wallet)
+
+    assert page is not None and page.status_code == 200
+    assert tracker.pool.counters["hedged"] >= 1
+    assert limiter.stats()["bscscan"]["requests"] - before == 2
@@ -0,0 +1,124 @@
+"""
+Кэш ответов: устаревший ответ с ETag перепроверяется условным запросом,
+на 304 используется сохранённая страница; метрика полученных строк
+считает только ответы API, а не попадания в кэш.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+import transport
+from metrics import metrics
+from response_cache import ResponseCache
+from tron_tracker import TronTracker
+
+WALLET = "T" + "E" * 33
+
+
+class TronGrid:
+    """Заглушка TronGrid с ETag: на совпавший If-None-Match отвечает 304."""
+
+    def __init__(self):
+        self.etag = '"v1"'
+        self.requests = []  # If-None-Match каждого запроса
+        self.rows = [self.row(i) for i in range(3)]
+        grid = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                condition = self.headers.get("If-None-Match")
+                grid.requests.append(condition)
+                if condition == grid.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", grid.etag)
+                    self.end_headers()
+                    return
+                body = json.dumps({"data": grid.rows, "success": True, "meta": {}}).encode()
+                self.send_response(200)
+                self.send_header("ETag", grid.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @staticmethod
+    def row(i: int) -> dict:
+        return {"transaction_id": f"{i:064x}", "to": WALLET, "from": "T" + "S" * 33,
+                "value": str(10 * 10 ** 6), "block_timestamp": 1_700_000_000_000 + i,
+                "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def grid(monkeypatch):
+    grid = TronGrid()
+    monkeypatch.setattr(config, "TRONGRID_API_URL", grid.url)
+    monkeypatch.setattr(config, "TRONGRID_API_URLS", "")
+    monkeypatch.setattr(transport, "cache", ResponseCache(ttl=0.2, size=16))
+    fetched = []
+    monkeypatch.setattr(metrics, "record_fetched", lambda chain, count: fetched.append(count))
+    yield grid, fetched
+    grid.close()
+
+
+def fetch(tracker):
+    path = f"/v1/accounts/{tracker.wallet}/transactions/trc20"
+    return tracker._fetch_page(path, {"only_to": "true", "limit": 200})
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_stale_page_is_revalidated(grid, monkeypatch, stream):
+    grid, fetched = grid
+    monkeypatch.setattr(config, "STREAM_PARSE", stream)
+    tracker = TronTracker(WALLET)
+
+    first = fetch(tracker)
+    assert len(first.rows) == 3 and first.conditions == {"If-None-Match": '"v1"'}
+    # Свежий ответ берётся из кэша без запроса и без учёта в метрике
+    assert fetch(tracker) is first
+    assert grid.requests == [None] and fetched == [3]
+
+    time.sleep(0.25)
+    assert fetch(tracker) is first
+    assert grid.requests == [None, '"v1"'] and fetched == [3]
+    assert transport.cache.stats()["revalidated"] == 1
+
+    # Изменившаяся страница загружается заново
+    grid.etag = '"v2"'
+    grid.rows.append(grid.row(3))
+    time.sleep(0.25)
+    page = fetch(tracker)
+    assert len(page.rows) == 4 and page.conditions == {"If-None-Match": '"v2"'}
+    assert fetched == [3, 4]
+
+
+def test_response_without_validators_expires():
+    cache = ResponseCache(ttl=0.05, size=4)
+    calls = []
+
+    class Response:
+        status_code = 200
+
+    def loader(*conditions):
+        calls.append(conditions)
+        return Response()
+
+    cache.fetch(("k", ()), loader)
+    time.sleep(0.06)
+    cache.fetch(("k", ()), loader)
+    assert calls == [(), ()]
+    assert cache.stats()["revalidated"] == 0
@@ -0,0 +1,122 @@
+"""
+Итоги поступлений: отчёт по шардам читает файлы только на чтение и не
+учитывает итоги до шардирования в каждом шарде; FileState пишет итоги
+в свой файл не чаще ROLLUP_FLUSH_INTERVAL.
+"""
+
+import json
+import os
+import time
+from decimal import Decimal
+
+import pytest
+
+import config
+from rollups import load_rollups
+from state_store import FileState, SqliteState, _inherit_db, open_state
+
+
+def transfer(amount, wallet: str = "T1") -> dict:
+    return {"network": "trc20", "token": "usdt", "wallet": wallet,
+            "amount": Decimal(amount), "timestamp": int(time.time())}
+
+
+def today_total(rollups) -> Decimal:
+    since = int(time.time()) - 3600
+    return sum((amount for _, amount in rollups.totals("hour", since).values()), Decimal(0))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "SHARD_INDEX", 0)
+    monkeypatch.setattr(config, "SHARD_COUNT", 1)
+    monkeypatch.setattr(config, "SHARD_PROCESSES", 1)
+    return tmp_path
+
+
+def state_files(directory) -> list:
+    """Файлы состояния без служебных -wal/-shm SQLite."""
+    return sorted(p for p in os.listdir(directory) if p.endswith((".db", ".json")))
+
+
+def reshard(index: int, count: int):
+    config.SHARD_INDEX, config.SHARD_COUNT = index, count
+
+
+@pytest.mark.parametrize("backend", ["file", "sqlite"])
+def test_presharding_totals_counted_once(workdir, monkeypatch, backend):
+    monkeypatch.setattr(config, "STATE_BACKEND", backend)
+    state = open_state()
+    state.record_transfer(transfer(100))
+    state.close()
+
+    for index in range(3):
+        reshard(index, 3)
+        state = open_state()
+        state.record_transfer(transfer(1, wallet=f"T{index}"))
+        state.save_cursors({})
+        state.close()
+
+    reshard(0, 3)
+    files = state_files(workdir)
+    assert today_total(load_rollups()) == Decimal(103)
+    # Отчёт не создаёт файлы состояния и не меняет шард процесса
+    assert state_files(workdir) == files
+    assert (config.SHARD_INDEX, config.SHARD_COUNT) == (0, 3)
+
+
+def test_report_skips_missing_shards(workdir, monkeypatch):
+    monkeypatch.setattr(config, "STATE_BACKEND", "sqlite")
+    reshard(1, 4)
+    state = open_state()
+    state.record_transfer(transfer(7))
+    state.close()
+
+    assert today_total(load_rollups()) == Decimal(7)
+    assert [p for p in state_files(workdir) if p.endswith(".db")] == ["state.shard1.db"]
+
+
+def test_legacy_rollups_in_state_file_are_moved(workdir):
+    rows = [["hour", (int(time.time()) // 3600) * 3600, "trc20", "usdt", "T1", 2, "50"]]
+    (workdir / config.STATE_FILE).write_text(json.dumps({"cursors": {}, "rollups": rows}))
+
+    state = FileState()
+    assert today_total(state.rollups) == Decimal(50)
+    state.save_cursors({"tron:T1:usdt": 1})
+    state.close()
+
+    assert "rollups" not in json.loads((workdir / config.STATE_FILE).read_text())
+    assert today_total(FileState().rollups) == Decimal(50)
+
+
+def test_rollup_file_is_flushed_on_interval(workdir, monkeypatch):
+    monkeypatch.setattr(config, "ROLLUP_FLUSH_INTERVAL", 3600)
+    state = FileState()
+    rollup_path = workdir / config.ROLLUP_FILE
+
+    state.record_transfer(transfer(5))
+    state.flush()
+    state.save_cursors({})
+    assert not rollup_path.exists()
+
+    monkeypatch.setattr(config, "ROLLUP_FLUSH_INTERVAL", 0)
+    state.flush()
+    assert today_total(FileState().rollups) == Decimal(5)
+
+    # Без изменений файл не переписывается
+    mtime = rollup_path.stat().st_mtime_ns
+    state.flush()
+    assert rollup_path.stat().st_mtime_ns == mtime
+
+
+def test_sqlite_shard_copy_has_no_rollups(workdir):
+    base = SqliteState(config.STATE_DB)
+    base.record_transfer(transfer(100))
+    base.close()
+
+    reshard(2, 3)
+    shard = _inherit_db(config.STATE_DB)
+    state = SqliteState(shard)
+    assert today_total(state.rollups) == 0
+    state.close()
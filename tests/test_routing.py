@@ -0,0 +1,59 @@
+"""
+Маршруты уведомлений: перевод меньше min_amount всех целей не отправляется,
+и это не считается ошибкой отправки ни в логе, ни в журнале.
+"""
+
+import json
+from decimal import Decimal
+
+import pytest
+
+import config
+import routing
+from state_store import LEDGER_NOT_ROUTED, SqliteState
+from tron_tracker import TronTracker
+
+WALLET = "T" + "R" * 33
+
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    """TRON трекер с журналом SQLite и маршрутом от 100 USDT."""
+    routes = tmp_path / "routes.json"
+    routes.write_text(json.dumps({"default": [{"chat": "-100111", "min_amount": 100}]}))
+    monkeypatch.setattr(routing, "router", routing.Router(str(routes), interval=0))
+    monkeypatch.setattr(config, "TRON_CONFIRMATIONS", 0)
+    state = SqliteState(str(tmp_path / "state.db"))
+    tracker = TronTracker(WALLET)
+    tracker.ledger = state
+    tracker.sent = []
+    tracker.notify = lambda amount, label, *target: tracker.sent.append((amount, target)) or True
+    yield tracker
+    state.close()
+
+
+def row(tx_id: str, amount: int) -> dict:
+    return {"transaction_id": tx_id, "to": WALLET, "from": "T" + "S" * 33,
+            "value": str(amount * 10 ** 6), "block_timestamp": 1_700_000_000_000,
+            "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6}}
+
+
+def test_deliver_reports_not_routed(tracker):
+    tx = {"amount": 5, "wallet": WALLET, "network": "trc20", "token": "usdt"}
+    assert routing.deliver(tracker.notify, tx, "USDT TRC20") is routing.NOT_ROUTED
+    assert routing.deliver(tracker.notify, dict(tx, amount=150), "USDT TRC20") is True
+    assert tracker.sent == [(150, ("-100111", 0))]
+
+
+def test_below_route_minimum_is_not_a_send_error(tracker, capsys):
+    assert tracker.handle_transfers([row("aa" * 32, 5), row("bb" * 32, 150)]) == 1
+    assert [amount for amount, _ in tracker.sent] == [150]
+
+    out = capsys.readouterr().out
+    assert "не отправляется по маршрутам" in out
+    assert "Ошибка отправки" not in out
+
+    tracker.ledger.flush()
+    rows = tracker.ledger.conn.execute("SELECT amount, notified FROM ledger")
+    assert {Decimal(amount): notified for amount, notified in rows} == {
+        Decimal(5): LEDGER_NOT_ROUTED, Decimal(150): 1}
@@ -0,0 +1,46 @@
+"""Файлы шардов наследуют общее состояние только в первой раскладке."""
+
+import json
+
+import pytest
+
+import config
+from state_store import FileState
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "SHARD_INDEX", 0)
+    monkeypatch.setattr(config, "SHARD_COUNT", 1)
+    (tmp_path / config.STATE_FILE).write_text(json.dumps({"cursors": {"tron:T1:usdt": 5}}))
+    return tmp_path
+
+
+def open_shard(index: int, count: int) -> FileState:
+    config.SHARD_INDEX, config.SHARD_COUNT = index, count
+    return FileState()
+
+
+def test_shards_started_later_still_inherit_first_layout(state_dir):
+    first = open_shard(0, 3)
+    first.save_cursors(first.load_cursors())
+    # Остальные шарды запускаются, когда файл шарда 0 уже есть
+    assert open_shard(2, 3).load_cursors() == {"tron:T1:usdt": 5}
+
+
+def test_resharding_does_not_copy_stale_state(state_dir):
+    for index in range(3):
+        state = open_shard(index, 3)
+        state.save_cursors(state.load_cursors())
+
+    assert open_shard(3, 4).load_cursors() == {}
+    assert not (state_dir / "last_transactions.shard3.json").exists()
+    # Существующие шарды сохраняют свои курсоры
+    assert open_shard(1, 4).load_cursors() == {"tron:T1:usdt": 5}
+
+
+def test_existing_shards_without_layout_are_not_inherited_into(state_dir):
+    (state_dir / "last_transactions.shard0.json").write_text(json.dumps({"cursors": {}}))
+
+    assert open_shard(1, 2).load_cursors() == {}
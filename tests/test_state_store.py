@@ -0,0 +1,141 @@
+"""
+Хранилище SQLite: перенос файлового состояния при переходе на sqlite,
+журнал с кодами notified, пакетная запись при flush и состояние после
+повторного открытия базы.
+"""
+
+import json
+import sqlite3
+import time
+from decimal import Decimal
+
+import pytest
+
+import config
+from state_store import LEDGER_BACKFILLED, LEDGER_NOT_ROUTED, FileState, SqliteState, open_state
+
+
+def transfer(tx_id: str, amount: str = "5", wallet: str = "T1") -> dict:
+    return {"network": "trc20", "tx_id": tx_id, "wallet": wallet, "token": "usdt",
+            "amount": Decimal(amount), "from": "TS", "block": 100,
+            "timestamp": int(time.time())}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "SHARD_INDEX", 0)
+    monkeypatch.setattr(config, "SHARD_COUNT", 1)
+    monkeypatch.setattr(config, "SHARD_PROCESSES", 1)
+    return tmp_path
+
+
+def test_file_state_is_migrated(workdir, monkeypatch):
+    # Файловое состояние: dedup-файлы, курсоры, ожидающие переводы, итоги
+    # и списки транзакций старого формата прямо в STATE_FILE
+    monkeypatch.setattr(config, "STATE_BACKEND", "file")
+    state = open_state()
+    state.dedup("tron").update(["t1", "t2"])
+    state.dedup("bsc").add("0xb1")
+    state.record_transfer(transfer("t1", "7"))
+    pending = [{"chain": "tron", "tx_id": "t3", "key": "t3:T1", "tx": {"wallet": "T1"}}]
+    state.save_pending(pending)
+    state.save_cursors({"tron:T1:usdt": 1_700_000_000_000, "bsc:0xb:usdt": 40_000_000})
+    state.close()
+    data = json.loads((workdir / config.STATE_FILE).read_text())
+    data["tron"] = ["legacy"]
+    (workdir / config.STATE_FILE).write_text(json.dumps(data))
+
+    monkeypatch.setattr(config, "STATE_BACKEND", "sqlite")
+    state = open_state()
+    assert isinstance(state, SqliteState)
+    state.close()
+
+    state = SqliteState(config.STATE_DB)
+    try:
+        assert state.load_cursors() == {"tron:T1:usdt": 1_700_000_000_000, "bsc:0xb:usdt": 40_000_000}
+        assert all(tx in state.dedup("tron") for tx in ("t1", "t2", "legacy"))
+        assert "0xb1" in state.dedup("bsc") and "t1" not in state.dedup("bsc")
+        assert len(state.dedup("tron")) == 3
+        assert state.load_pending() == pending
+        since = int(time.time()) - 3600
+        assert [amount for _, amount in state.rollups.totals("hour", since).values()] == [Decimal(7)]
+    finally:
+        state.close()
+
+    # Повторное открытие не переносит состояние второй раз
+    state = open_state()
+    try:
+        assert len(state.dedup("tron")) == 3
+        assert state.conn.execute("SELECT SUM(count) FROM rollups WHERE granularity = 'hour'"
+                                  ).fetchone() == (1,)
+    finally:
+        state.close()
+
+
+def test_ledger_is_written_on_flush_and_survives_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    state = SqliteState(path)
+    state.record_transfer(transfer("sent"), True)
+    state.record_transfer(transfer("error"), False)
+    state.record_transfer(transfer("skipped"), None)
+    state.record_transfer(transfer("backfilled"), LEDGER_BACKFILLED)
+    state.dedup("tron").update(["sent", "error"])
+    state.save_cursors({"blocks": 1000})
+
+    # До flush журнал и транзакции только в памяти
+    assert state.conn.execute("SELECT COUNT(*) FROM ledger").fetchone() == (0,)
+    assert state.conn.execute("SELECT COUNT(*) FROM processed").fetchone() == (0,)
+    assert "sent" in state.dedup("tron")
+    state.flush()
+    state.save_cursors({"blocks": 1005})
+    state.close()
+
+    state = SqliteState(path)
+    try:
+        rows = dict(state.conn.execute("SELECT tx_id, notified FROM ledger"))
+        assert rows == {"sent": 1, "error": 0, "skipped": LEDGER_NOT_ROUTED,
+                        "backfilled": LEDGER_BACKFILLED}
+        (amount,) = state.conn.execute("SELECT amount FROM ledger WHERE tx_id = 'sent'").fetchone()
+        assert Decimal(amount) == 5
+        assert state.load_cursors() == {"blocks": 1005}
+        assert "sent" in state.dedup("tron") and "error" in state.dedup("tron")
+        assert "sent" not in state.dedup("bsc")
+        assert state.dedup("tron").add("sent") is False
+
+        state.dedup("tron").discard("error")
+        assert "error" not in state.dedup("tron")
+    finally:
+        state.close()
+
+    state = SqliteState(path)
+    try:
+        assert len(state.dedup("tron")) == 1
+    finally:
+        state.close()
+
+
+def test_old_ledger_key_is_migrated(tmp_path):
+    # Журнал с ключом (chain, tx_id) терял переводы одной транзакции на разные кошельки
+    path = str(tmp_path / "state.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE ledger (
+            chain TEXT NOT NULL, tx_id TEXT NOT NULL, wallet TEXT, token TEXT,
+            amount TEXT, from_address TEXT, block INTEGER, timestamp INTEGER,
+            notified INTEGER NOT NULL, recorded_at INTEGER NOT NULL,
+            PRIMARY KEY (chain, tx_id)
+        );
+        INSERT INTO ledger VALUES ('trc20', 'x', 'T1', 'usdt', '1', 'TS', 1, 1, 1, 1);
+    """)
+    conn.commit()
+    conn.close()
+
+    state = SqliteState(path)
+    try:
+        state.record_transfer(transfer("x", wallet="T2"))
+        state.flush()
+        rows = state.conn.execute("SELECT wallet FROM ledger ORDER BY wallet").fetchall()
+        assert rows == [("T1",), ("T2",)]
+    finally:
+        state.close()
@@ -0,0 +1,146 @@
+"""
+Потоковый разбор страниц против разбора словарями (Page.from_data):
+те же отобранные строки, число строк, курсоры и ответ без массива при
+любом разбиении тела на куски, многобайтовом UTF-8, необычных tokenName,
+вложенном token_info TronGrid и строковом "result" BscScan.
+"""
+
+import json
+
+import pytest
+
+import config
+from decoding import TransferFilter
+from streaming import BSCSCAN, TRONGRID, Page, parse_stream
+
+BSC_WALLET = "0x" + "ab" * 20
+BUSDT = "0x55d398326f99059ff775485246999027b3197955"
+TRON_WALLET = "T" + "W" * 33
+USDT = config.USDT_TRC20_CONTRACT
+
+ODD_NAMES = [
+    "Tether USD",
+    'Tether "USD"',
+    "a}b{c",
+    "back\\slash",
+    "Тетер ₮ 💵",
+    f'"to":"{BSC_WALLET}"',
+    "comma, and ] bracket",
+    'quote"} brace',
+    "",
+]
+
+
+def bsc_rows() -> list:
+    rows = []
+    for i, name in enumerate(ODD_NAMES):
+        incoming = i % 3 != 2
+        rows.append({
+            "blockNumber": str(40_000_000 + i), "timeStamp": "1700000000",
+            "hash": f"0x{i:064x}", "blockHash": "0x" + "11" * 32,
+            "from": "0x" + "ef" * 20 if incoming else BSC_WALLET,
+            # Получатель в смешанном регистре и чужой контракт тоже проверяются
+            "to": (BSC_WALLET.upper().replace("0X", "0x") if i % 4 == 1 else BSC_WALLET)
+            if incoming else "0x" + "cd" * 20,
+            "contractAddress": BUSDT if i % 5 else "0x" + "99" * 20,
+            "value": str((i % 7) * 10 ** 18),
+            "tokenName": name, "tokenSymbol": "USDT", "tokenDecimal": "18",
+            "logIndex": str(i), "confirmations": "100",
+        })
+    return rows
+
+
+def tron_rows() -> list:
+    rows = []
+    for i, name in enumerate(ODD_NAMES):
+        token_info = {"symbol": "USDT", "address": USDT if i % 5 else "T" + "F" * 33,
+                      "decimals": 6, "name": name}
+        rows.append({
+            "transaction_id": f"{i:064x}",
+            "token_info": token_info,
+            "block_timestamp": 1_700_000_000_000 + i * 3000,
+            "from": "T" + "S" * 33,
+            "to": TRON_WALLET if i % 3 != 2 else "T" + "X" * 33,
+            "type": "Transfer",
+            "value": str((i % 7) * 10 ** 6),
+        })
+    return rows
+
+
+def bsc_body(ensure_ascii: bool = True) -> bytes:
+    data = {"status": "1", "message": "OK", "result": bsc_rows()}
+    return json.dumps(data, ensure_ascii=ensure_ascii).encode()
+
+
+def tron_body(ensure_ascii: bool = True) -> bytes:
+    data = {"data": tron_rows(), "success": True,
+            "meta": {"at": 1_700_000_100_000, "page_size": 9, "fingerprint": "abc}{\"",
+                     "links": {"next": "https://api.trongrid.io/v1/...?fingerprint=abc"}}}
+    return json.dumps(data, ensure_ascii=ensure_ascii).encode()
+
+
+FORMATS = {
+    "bsc": (BSCSCAN, lambda: TransferFilter([BSC_WALLET], [BUSDT], min_amount=2, lowercase=True),
+            "decode_bscscan", bsc_body),
+    "tron": (TRONGRID, lambda: TransferFilter([TRON_WALLET], [USDT], min_amount=2),
+             "decode_trongrid", tron_body),
+}
+
+
+def assert_parity(body: bytes, chunks: list, chain: str):
+    fmt, make_filter, decode, _ = FORMATS[chain]
+    flt = make_filter()
+    data = json.loads(body)
+    expected = Page.from_data(200, data, fmt)
+    envelope, rows, total, latest, last = parse_stream(chunks, fmt, flt)
+    streamed = Page(200, envelope, fmt.key, rows, total, latest, last)
+
+    selected = [row for row in expected.rows if getattr(flt, decode)([row])]
+    assert streamed.rows == selected
+    assert (streamed.total, streamed.latest, streamed.last) == (
+        expected.total, expected.latest, expected.last)
+    assert {k: v for k, v in streamed.envelope.items() if k != fmt.key} == {
+        k: v for k, v in data.items() if k != fmt.key}
+    keys = [t.key for t in getattr(flt, decode)(streamed.rows)]
+    assert keys == [t.key for t in getattr(flt, decode)(expected.rows)]
+    return streamed
+
+
+@pytest.mark.parametrize("chain", sorted(FORMATS))
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_parity_at_every_split(chain, ensure_ascii):
+    body = FORMATS[chain][3](ensure_ascii)
+    streamed = assert_parity(body, [body], chain)
+    assert 0 < len(streamed.rows) < streamed.total
+    for split in range(1, len(body)):
+        assert_parity(body, [body[:split], body[split:]], chain)
+
+
+@pytest.mark.parametrize("chain", sorted(FORMATS))
+def test_parity_byte_by_byte(chain):
+    # Каждый многобайтовый символ приходит по частям
+    body = FORMATS[chain][3](False)
+    assert_parity(body, [body[i:i + 1] for i in range(len(body))], chain)
+
+
+@pytest.mark.parametrize("chain", sorted(FORMATS))
+def test_empty_page(chain):
+    fmt = FORMATS[chain][0]
+    body = json.dumps({"status": "0", "message": "No transactions found", fmt.key: []}).encode()
+    streamed = assert_parity(body, [body], chain)
+    assert streamed.rows == [] and streamed.total == 0
+
+
+def test_bscscan_string_result():
+    body = json.dumps({"status": "0", "message": "NOTOK",
+                       "result": "Max rate limit reached"}).encode()
+    for split in range(1, len(body)):
+        streamed = assert_parity(body, [body[:split], body[split:]], "bsc")
+        assert streamed.json() == json.loads(body)
+        assert streamed.total == 0
+
+
+def test_truncated_body_is_an_error():
+    body = bsc_body()
+    with pytest.raises(ValueError):
+        parse_stream([body[:len(body) // 2]], BSCSCAN, FORMATS["bsc"][1]())
@@ -0,0 +1,222 @@
+"""
+Сканер блоков TRON против заглушки HTTP API узла: блоки запрашиваются
+диапазонами, логи - только для блоков с вызовами на отслеживаемые адреса,
+курсор сдвигается по готовым блокам, запросы идут через пул адресов.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from confirmations import ConfirmationTracker
+from metrics import metrics
+from ratelimit import limiter
+from tron_blocks import BLOCKS_CURSOR, TRANSFER_TOPIC, TronBlockTracker, base58_to_hex, hex_to_base58
+
+WALLET_HEX = "ab" * 20
+WALLET = hex_to_base58(WALLET_HEX)
+SENDER_HEX = "ef" * 20
+OTHER_HEX = "cd" * 20
+
+
+def word(value) -> str:
+    """32-байтовое слово ABI: адрес (hex) или число."""
+    return value.rjust(64, "0") if isinstance(value, str) else "%064x" % value
+
+
+class StubNode:
+    """Цепь заглушки: блоки с вызовами transfer и логи их транзакций."""
+
+    def __init__(self, status: int = 200):
+        self.head = 1000
+        self.status = status  # HTTP статус всех ответов
+        self.transfers = {}  # номер блока -> [(получатель hex, сумма)]
+        self.missing = set()  # блоки, которых узел не отдаёт
+        self.calls = []  # (путь, тело запроса)
+        self.lock = threading.Lock()
+        self.contract_hex = base58_to_hex(config.USDT_TRC20_CONTRACT)
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+                with node.lock:
+                    node.calls.append((self.path, payload))
+                    body = node.answer(self.path, payload) if node.status == 200 else {}
+                data = json.dumps(body).encode()
+                self.send_response(node.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tx_id(self, number: int, index: int) -> str:
+        return "%056x%08x" % (number, index)
+
+    def block(self, number: int) -> dict:
+        transactions = [{
+            # Вызов чужого адреса в каждом блоке
+            "txID": self.tx_id(number, 999),
+            "ret": [{"contractRet": "SUCCESS"}],
+            "raw_data": {"contract": [self.trigger(OTHER_HEX, 1)]},
+        }]
+        for index, (to_hex, amount) in enumerate(self.transfers.get(number, [])):
+            transactions.append({
+                "txID": self.tx_id(number, index),
+                "ret": [{"contractRet": "SUCCESS"}],
+                "raw_data": {"contract": [self.trigger(to_hex, amount)]},
+            })
+        return {"block_header": {"raw_data": {"number": number,
+                                              "timestamp": 1_700_000_000_000 + number * 3000}},
+                "transactions": transactions}
+
+    def trigger(self, to_hex: str, amount: int) -> dict:
+        return {"type": "TriggerSmartContract", "parameter": {"value": {
+            "contract_address": "41" + self.contract_hex,
+            "data": "a9059cbb" + word(to_hex) + word(amount),
+        }}}
+
+    def answer(self, path: str, payload: dict):
+        if path == "/wallet/getnowblock":
+            return self.block(self.head)
+        if path == "/wallet/getblockbylimitnext":
+            numbers = range(payload["startNum"], min(payload["endNum"], self.head + 1))
+            return {"block": [self.block(n) for n in numbers if n not in self.missing]}
+        if path == "/wallet/gettransactioninfobyblocknum":
+            number = payload["num"]
+            return [{
+                "id": self.tx_id(number, index),
+                "blockNumber": number,
+                "blockTimeStamp": 1_700_000_000_000 + number * 3000,
+                "receipt": {"result": "SUCCESS"},
+                "log": [{"address": self.contract_hex, "data": word(amount),
+                         "topics": [TRANSFER_TOPIC, word(SENDER_HEX), word(to_hex)]}],
+            } for index, (to_hex, amount) in enumerate(self.transfers.get(number, []))]
+        return {}
+
+    def paths(self, name: str) -> list:
+        return [payload for path, payload in self.calls if path.endswith(name)]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def node(monkeypatch):
+    """Заглушка узла; TRON_NODE_URL указывает на неё."""
+    node = StubNode()
+    monkeypatch.setattr(config, "TRON_NODE_URL", node.url)
+    monkeypatch.setattr(config, "TRON_NODE_URLS", "")
+    monkeypatch.setattr(config, "TRON_NODE_LAG", 0)
+    monkeypatch.setattr(config, "TRON_SCAN_BATCH", 20)
+    limiter.configure("tron_node", 1000, burst=100)
+    yield node
+    node.close()
+    limiter.configure("tron_node", config.TRON_NODE_RATE)
+
+
+def make_tracker(cursor: int = None) -> TronBlockTracker:
+    tracker = TronBlockTracker([WALLET])
+    if cursor is not None:
+        tracker.cursors[BLOCKS_CURSOR] = cursor
+    return tracker
+
+
+def test_first_run_starts_at_head(node):
+    tracker = make_tracker()
+    assert tracker.get_trc20_transfers() == []
+    assert tracker.cursors[BLOCKS_CURSOR] == node.head
+    assert node.paths("getblockbylimitnext") == []
+
+
+def test_blocks_are_requested_in_ranges(node):
+    node.transfers = {960: [(WALLET_HEX, 5 * 10 ** 6)], 990: [(WALLET_HEX, 7 * 10 ** 6)]}
+    tracker = make_tracker(cursor=955)
+
+    transfers = tracker.get_trc20_transfers()
+
+    # 45 блоков - три запроса диапазонов, логи только у двух блоков с переводами
+    assert [(p["startNum"], p["endNum"]) for p in node.paths("getblockbylimitnext")] == [
+        (956, 976), (976, 996), (996, 1001)]
+    assert [p["num"] for p in node.paths("gettransactioninfobyblocknum")] == [960, 990]
+    assert [(t["block"], t["to"], t["value"]) for t in transfers] == [
+        (960, WALLET, str(5 * 10 ** 6)), (990, WALLET, str(7 * 10 ** 6))]
+    assert transfers[0]["from"] == hex_to_base58(SENDER_HEX)
+    assert tracker.cursors[BLOCKS_CURSOR] == node.head
+    assert tracker.fetch_errors[BLOCKS_CURSOR] is False
+
+
+def test_failed_call_does_not_fetch_logs(node):
+    node.transfers = {999: [(WALLET_HEX, 10 ** 6)]}
+    tracker = make_tracker(cursor=995)
+    original = node.block
+
+    def reverted(number):
+        block = original(number)
+        for tx in block["transactions"]:
+            tx["ret"] = [{"contractRet": "REVERT"}]
+        return block
+
+    node.block = reverted
+    assert tracker.get_trc20_transfers() == []
+    assert node.paths("gettransactioninfobyblocknum") == []
+    assert tracker.cursors[BLOCKS_CURSOR] == node.head
+
+
+def test_missing_block_keeps_cursor(node, capsys):
+    node.missing = {985}
+    tracker = make_tracker(cursor=960)
+
+    assert tracker.get_trc20_transfers() == []
+    assert tracker.cursors[BLOCKS_CURSOR] == 984
+    assert tracker.fetch_errors[BLOCKS_CURSOR] is True
+    assert "Ошибка запроса блока 985" in capsys.readouterr().out
+    assert len(node.paths("getblockbylimitnext")) == 2
+
+
+def test_node_error_keeps_cursor(node):
+    node.status = 503
+    tracker = make_tracker(cursor=990)
+    assert tracker.get_trc20_transfers() == []
+    assert tracker.cursors[BLOCKS_CURSOR] == 990
+    assert tracker.fetch_errors[BLOCKS_CURSOR] is True
+
+
+def test_mirror_takes_over(node, monkeypatch):
+    # Основной адрес отвечает 503, запросы уходят на зеркало из TRON_NODE_URLS
+    broken = StubNode(status=503)
+    try:
+        monkeypatch.setattr(config, "TRON_NODE_URL", broken.url)
+        monkeypatch.setattr(config, "TRON_NODE_URLS", node.url)
+        node.transfers = {995: [(WALLET_HEX, 10 ** 6)]}
+        tracker = make_tracker(cursor=990)
+
+        assert [t["block"] for t in tracker.get_trc20_transfers()] == [995]
+        assert tracker.cursors[BLOCKS_CURSOR] == node.head
+
+        # Голова для подтверждений идёт через тот же пул
+        assert ConfirmationTracker().get_head("tron")[0] == node.head
+    finally:
+        broken.close()
+
+
+def test_fetched_counts_all_block_transactions(node, monkeypatch):
+    fetched = []
+    monkeypatch.setattr(metrics, "record_fetched", lambda chain, count: fetched.append(count))
+    node.transfers = {998: [(WALLET_HEX, 10 ** 6), (WALLET_HEX, 2 * 10 ** 6)]}
+    tracker = make_tracker(cursor=996)
+
+    assert len(tracker.get_trc20_transfers()) == 2
+    # Транзакция на чужой адрес в каждом блоке тоже считается
+    assert fetched == [1, 3, 1, 1]
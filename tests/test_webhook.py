@@ -0,0 +1,132 @@
+"""
+Приём переводов через webhook: подпись HMAC, допустимый сдвиг X-Timestamp,
+отсев чужих токенов и одно уведомление, когда перевод приходит и из
+webhook, и из опроса.
+"""
+
+import json
+import time
+
+import pytest
+import requests
+
+import config
+import webhook
+from engine import TrackerEngine
+from state_store import SqliteState
+from tron_tracker import TronTracker
+
+SECRET = "test-secret"
+WALLET = "T" + "W" * 33
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    """Движок с одним TRON кошельком и запущенный сервер на свободном порту."""
+    monkeypatch.setattr(config, "TRON_CONFIRMATIONS", 0)
+    state = SqliteState(str(tmp_path / "state.db"))
+    tracker = TronTracker(WALLET)
+    engine = TrackerEngine([tracker], state=state)
+    sent = []
+    tracker.notify = lambda amount, label, *target: sent.append((amount, label)) or True
+    server = webhook.WebhookServer(engine.ingest, secret=SECRET, host="127.0.0.1", port=0)
+    server.start()
+    url = f"http://127.0.0.1:{server.port}/webhook/tron"
+    yield url, tracker, sent, server
+    server.close()
+    state.close()
+
+
+def post(url: str, rows: list, secret: str = SECRET, timestamp: int = None):
+    """Запрос с подписью от заданного времени."""
+    body = json.dumps({"events": rows}).encode()
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    headers = {
+        "Content-Type": "application/json",
+        "X-Timestamp": timestamp,
+        "X-Signature": "sha256=" + webhook.signature(secret, timestamp, body),
+    }
+    return requests.post(url, data=body, headers=headers, timeout=5)
+
+
+def test_signed_event_is_notified(setup):
+    url, tracker, sent, server = setup
+    response = webhook.send(url, [webhook.sample_event("tron", WALLET, 100)], SECRET)
+
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 1, "notified": 1}
+    assert sent == [(100, "USDT TRC20")]
+
+
+def test_bad_signature_is_rejected(setup):
+    url, tracker, sent, server = setup
+    response = post(url, [webhook.sample_event("tron", WALLET, 100)], secret="wrong")
+
+    assert response.status_code == 401
+    assert server.stats()["rejected"] == 1
+    assert sent == []
+
+
+@pytest.mark.parametrize("shift", [-1, 1])
+def test_timestamp_outside_tolerance_is_rejected(setup, shift):
+    url, tracker, sent, server = setup
+    timestamp = int(time.time()) + shift * (server.tolerance + 60)
+    response = post(url, [webhook.sample_event("tron", WALLET, 100)], timestamp=timestamp)
+
+    assert response.status_code == 401
+    assert sent == []
+
+
+def test_timestamp_within_tolerance_is_accepted(setup):
+    url, tracker, sent, server = setup
+    timestamp = int(time.time()) - server.tolerance + 30
+    response = post(url, [webhook.sample_event("tron", WALLET, 100)], timestamp=timestamp)
+
+    assert response.status_code == 200
+    assert len(sent) == 1
+
+
+def test_other_token_contract_is_ignored(setup):
+    url, tracker, sent, server = setup
+    fake = webhook.sample_event("tron", WALLET, 100)
+    fake["token_info"] = {"address": "T" + "F" * 33, "decimals": 6, "symbol": "USDT"}
+    response = post(url, [fake])
+
+    assert response.status_code == 200
+    assert response.json()["notified"] == 0
+    assert sent == []
+
+
+def test_poll_and_webhook_deliver_one_notification(setup):
+    url, tracker, sent, server = setup
+    pushed = webhook.sample_event("tron", WALLET, 100)
+    polled = webhook.sample_event("tron", WALLET, 50)
+
+    # Webhook раньше опроса
+    assert post(url, [pushed]).json()["notified"] == 1
+    assert tracker.handle_transfers([dict(pushed)]) == 0
+
+    # Опрос раньше webhook
+    assert tracker.handle_transfers([dict(polled)]) == 1
+    assert post(url, [polled]).json()["notified"] == 0
+
+    assert sorted(sent) == [(50, "USDT TRC20"), (100, "USDT TRC20")]
+
+
+def test_reconcile_intervals_do_not_touch_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHECK_INTERVAL", 30)
+    monkeypatch.setattr(config, "POLL_MIN_INTERVAL", 5)
+    monkeypatch.setattr(config, "POLL_MAX_INTERVAL", 600)
+    intervals = webhook.reconcile_intervals(300)
+    assert intervals == {"base_interval": 300, "min_interval": 300, "max_interval": 600}
+
+    state = SqliteState(str(tmp_path / "state.db"))
+    try:
+        engine = TrackerEngine([TronTracker(WALLET)], state=state, intervals=intervals)
+        assert engine.scheduler.base_interval == 300 and engine.scheduler.min_interval == 300
+        assert engine.scheduler.sources[0].interval == 300
+        # Глобальные настройки прежние: другие движки в процессе их не наследуют
+        assert (config.CHECK_INTERVAL, config.POLL_MIN_INTERVAL) == (30, 5)
+        assert TrackerEngine([TronTracker(WALLET)], state=state).scheduler.base_interval == 30
+    finally:
+        state.close()
@@ -0,0 +1,120 @@
+"""
+Общий HTTP транспорт с пулом keep-alive соединений.
+Одна сессия на провайдера (trongrid, bscscan, telegram), чтобы
+TCP+TLS рукопожатие выполнялось один раз, а не на каждый запрос.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from metrics import metrics
+from response_cache import ResponseCache
+
+_sessions = {}
+_lock = threading.Lock()
+# Общий кэш ответов для запросов с cached=True
+cache = ResponseCache()
+
+
+def _timeout(timeout) -> tuple:
+    """Возвращает пару (connect, read) таймаутов."""
+    if timeout is None:
+        return (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return timeout
+    return (min(config.HTTP_CONNECT_TIMEOUT, timeout), timeout)
+
+
+def get_session(provider: str) -> requests.Session:
+    """
+    Возвращает пул соединений для провайдера, создавая его при первом вызове.
+
+    Args:
+        provider: Имя провайдера ('trongrid', 'bscscan', 'telegram')
+
+    Returns:
+        Сессия requests с keep-alive пулом
+    """
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=config.HTTP_POOL_SIZE,
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+    return session
+
+
+def _request(provider: str, endpoint: str, method: str, url: str, **kwargs) -> requests.Response:
+    """Запрос через пул провайдера; при включённых метриках замеряет длительность."""
+    session = get_session(provider)
+    if not metrics.enabled:
+        return session.request(method, url, **kwargs)
+
+    labels = {"provider": provider, "endpoint": endpoint or provider}
+    status = "error"
+    started = time.perf_counter()
+    try:
+        response = session.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.observe("api_request_seconds", time.perf_counter() - started, **labels)
+        metrics.inc("api_requests_total", status=status, **labels)
+
+
+def get(provider: str, url: str, params: dict = None, timeout=None,
+        headers: dict = None, endpoint: str = None, stream: bool = False) -> requests.Response:
+    """
+    GET запрос через пул провайдера.
+
+    Args:
+        endpoint: Метка метода API для метрик (по умолчанию имя провайдера)
+        stream: Не читать тело сразу (streaming.read_page читает его по кускам)
+    """
+    return _request(provider, endpoint, "GET", url, params=params, headers=headers,
+                    timeout=_timeout(timeout), stream=stream)
+
+
+def cached(url: str, params: dict, loader, cacheable=None) -> requests.Response:
+    """
+    Ответ из общего кэша или результат loader. Одновременные одинаковые
+    запросы ждут один вызов loader, поэтому лимит провайдера расходуется
+    только на настоящие запросы (loader сам берёт ключ у ограничителя).
+
+    Args:
+        url, params: Запрос, по которым строится ключ кэша
+        loader: Функция без аргументов, выполняющая запрос
+        cacheable: Проверка ответа перед сохранением (по умолчанию HTTP 200)
+    """
+    if not cache.enabled:
+        return loader()
+    return cache.fetch(ResponseCache.key(url, params), loader, cacheable)
+
+
+def post(provider: str, url: str, json=None, timeout=None,
+         endpoint: str = None) -> requests.Response:
+    """POST запрос с JSON телом через пул провайдера."""
+    return _request(provider, endpoint, "POST", url, json=json, timeout=_timeout(timeout))
+
+
+def close_all():
+    """Закрывает все пулы соединений."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
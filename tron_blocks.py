@@ -0,0 +1,280 @@
+"""
+Сканирование блоков TRON через HTTP API полного узла.
+Блоки запрашиваются диапазонами (getblockbylimitnext, TRON_SCAN_BATCH за
+запрос), и в данных вызовов контрактов ищутся адреса отслеживаемых
+кошельков. Логи (gettransactioninfobyblocknum) запрашиваются только для
+блоков с такими вызовами, и уже логи Transfer контракта USDT сверяются
+с индексом всех отслеживаемых адресов, поэтому запросы не растут с числом
+кошельков. Перевод контракта, в данных вызова которого нет адреса
+получателя (например, выплата на сохранённый в контракте адрес), этот
+источник не видит.
+"""
+
+import hashlib
+
+import config
+import transport
+from metrics import metrics
+from providers import get_pool
+from ratelimit import limiter, retry_after
+from telegram_bot import send_notification
+from tron_tracker import TronTracker
+
+# keccak256("Transfer(address,address,uint256)") без 0x, как в логах TRON
+TRANSFER_TOPIC = "ddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+# Ключ курсора: последний полностью просканированный блок
+BLOCKS_CURSOR = "blocks"
+# Нулевое дополнение адреса до 32-байтового слова ABI
+ADDRESS_PADDING = "0" * 24
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def base58_to_hex(address: str) -> str:
+    """Переводит base58check адрес TRON в 20 байт hex (без префикса 41)."""
+    num = 0
+    for char in address:
+        num = num * 58 + B58_ALPHABET.index(char)
+    raw = num.to_bytes(25, "big")
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError(f"Неверная контрольная сумма адреса {address}")
+    return payload[1:].hex()
+
+
+def hex_to_base58(address_hex: str) -> str:
+    """Переводит 20 байт hex адреса в base58check адрес TRON."""
+    payload = bytes.fromhex("41" + address_hex[-40:])
+    checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    num = int.from_bytes(payload + checksum, "big")
+    encoded = ""
+    while num:
+        num, rem = divmod(num, 58)
+        encoded = B58_ALPHABET[rem] + encoded
+    return encoded
+
+
+class TronBlockTracker:
+    """Отслеживание TRC20 USDT переводов на все кошельки по блокам."""
+
+    chain = "tron"
+    provider = "tron_node"
+
+    def __init__(self, wallets: list = None, node_url: str = None):
+        wallets = [w for w in (wallets or [config.TRC20_WALLET]) if w]
+        self.wallet = "blocks"  # для ключей курсоров и логов
+        # Основной адрес узла и взаимозаменяемые зеркала
+        self.pool = get_pool(self.provider, node_url or config.TRON_NODE_URL,
+                             "" if node_url else config.TRON_NODE_URLS)
+        self.node_url = self.pool.primary
+        self.usdt_contract = config.USDT_TRC20_CONTRACT
+        self.contract_hex = base58_to_hex(self.usdt_contract)
+        # hex адреса -> base58 адрес отслеживаемого кошелька
+        self.index = {base58_to_hex(w): w for w in wallets}
+        self.processed_txs = set()
+        self.cursors = {}
+        self.fetch_errors = {}
+        self.ledger = None
+        self.notify = send_notification
+        self.confirmations = None
+        self.wallet_trackers = {}
+
+    def _post(self, path: str, payload: dict = None) -> dict:
+        """
+        POST запрос к HTTP API узла через пул адресов. Токен ограничителя
+        берётся на каждую попытку, после 429 следующая ждёт Retry-After.
+        """
+        endpoint = path.rsplit("/", 1)[-1]
+
+        def attempt(base):
+            limiter.acquire(self.provider)
+            response = transport.post(self.provider, base + path, json=payload or {},
+                                      endpoint=endpoint)
+            if response.status_code == 429:
+                limiter.reject(self.provider, retry_after=retry_after(response))
+            return response
+
+        response = self.pool.request(attempt)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.json()
+
+    def get_head_block(self) -> int:
+        """Номер последнего блока с учётом TRON_NODE_LAG."""
+        block = self._post("/wallet/getnowblock")
+        return block["block_header"]["raw_data"]["number"] - config.TRON_NODE_LAG
+
+    def get_blocks(self, start: int, end: int) -> dict:
+        """
+        Блоки [start, end] одним запросом getblockbylimitnext.
+
+        Returns:
+            Словарь {номер блока: блок}
+        """
+        data = self._post("/wallet/getblockbylimitnext", {"startNum": start, "endNum": end + 1})
+        return {block["block_header"]["raw_data"]["number"]: block
+                for block in data.get("block", [])}
+
+    def touches_wallets(self, block: dict) -> bool:
+        """
+        Есть ли в блоке успешный вызов контракта с адресом отслеживаемого
+        кошелька в данных (transfer/transferFrom USDT или вызов другого
+        контракта, передающий адрес).
+        """
+        index = self.index
+        for tx in block.get("transactions", []):
+            ret = tx.get("ret") or [{}]
+            if ret[0].get("contractRet", "SUCCESS") != "SUCCESS":
+                continue
+            for contract in tx.get("raw_data", {}).get("contract", []):
+                if contract.get("type") != "TriggerSmartContract":
+                    continue
+                data = contract.get("parameter", {}).get("value", {}).get("data", "").lower()
+                # Аргументы - 32-байтовые слова после 4 байт селектора
+                for offset in range(8, len(data) - 63, 64):
+                    if (data.startswith(ADDRESS_PADDING, offset)
+                            and data[offset + 24:offset + 64] in index):
+                        return True
+        return False
+
+    def decode_block(self, tx_infos: list) -> list:
+        """
+        Извлекает из блока переводы USDT на отслеживаемые адреса.
+
+        Returns:
+            Список переводов в формате TronGrid transactions/trc20
+        """
+        transfers = []
+        for info in tx_infos or []:
+            if info.get("receipt", {}).get("result", "SUCCESS") != "SUCCESS":
+                continue
+            for log in info.get("log", []):
+                topics = log.get("topics", [])
+                if (len(topics) < 3 or topics[0] != TRANSFER_TOPIC
+                        or log.get("address", "")[-40:] != self.contract_hex):
+                    continue
+                wallet = self.index.get(topics[2][-40:])
+                if wallet is None:
+                    continue
+                transfers.append({
+                    "transaction_id": info.get("id"),
+                    "from": hex_to_base58(topics[1]),
+                    "to": wallet,
+                    "value": str(int(log.get("data") or "0", 16)),
+                    "token_info": {"address": self.usdt_contract, "decimals": 6},
+                    "block_timestamp": info.get("blockTimeStamp"),
+                    "block": info.get("blockNumber"),
+                })
+        return transfers
+
+    def get_trc20_transfers(self) -> list:
+        """
+        Сканирует блоки после курсора, не больше TRON_SCAN_MAX_BLOCKS за раз.
+
+        Returns:
+            Список переводов в формате TronGrid
+        """
+        self.fetch_errors[BLOCKS_CURSOR] = False
+        try:
+            head = self.get_head_block()
+        except Exception as e:
+            print(f"[TRON] Ошибка запроса: {e}")
+            self.fetch_errors[BLOCKS_CURSOR] = True
+            return []
+
+        cursor = self.cursors.get(BLOCKS_CURSOR)
+        if cursor is None:
+            # Первый запуск: начинаем с текущего блока
+            self.cursors[BLOCKS_CURSOR] = head
+            return []
+
+        transfers = []
+        last = min(head, cursor + config.TRON_SCAN_MAX_BLOCKS)
+        batch = max(1, min(config.TRON_SCAN_BATCH, 100))
+        try:
+            for start in range(cursor + 1, last + 1, batch):
+                end = min(start + batch - 1, last)
+                number = start
+                blocks = self.get_blocks(start, end)
+                for number in range(start, end + 1):
+                    block = blocks.get(number)
+                    if block is None:
+                        raise RuntimeError("узел не отдал блок")
+                    block_transfers = []
+                    if self.touches_wallets(block):
+                        tx_infos = self._post("/wallet/gettransactioninfobyblocknum",
+                                              {"num": number})
+                        block_transfers = self.decode_block(tx_infos)
+                    # Полученные строки - все транзакции блока до фильтра, как у TronGrid
+                    metrics.record_fetched(self.chain, len(block.get("transactions", [])))
+                    transfers.extend(block_transfers)
+                    self.cursors[BLOCKS_CURSOR] = number
+        except Exception as e:
+            print(f"[TRON] Ошибка запроса блока {number}: {e}")
+            self.fetch_errors[BLOCKS_CURSOR] = True
+
+        return transfers
+
+    def tracker_for(self, wallet: str) -> TronTracker:
+        """Трекер кошелька, разделяющий хранилище и уведомления со сканером."""
+        tracker = self.wallet_trackers.get(wallet)
+        if tracker is None:
+            tracker = self.wallet_trackers[wallet] = TronTracker(wallet)
+        tracker.processed_txs = self.processed_txs
+        tracker.notify = self.notify
+        tracker.ledger = self.ledger
+        tracker.confirmations = self.confirmations
+        return tracker
+
+    def sources(self) -> list:
+        """Один источник на все кошельки."""
+        return [BLOCKS_CURSOR]
+
+    def check_source(self, source: str = BLOCKS_CURSOR) -> int:
+        """Сканирует новые блоки и отправляет уведомления по всем кошелькам."""
+        by_wallet = {}
+        for transfer in self.get_trc20_transfers():
+            by_wallet.setdefault(transfer["to"], []).append(transfer)
+
+        total_notifications = 0
+        for wallet, transfers in by_wallet.items():
+            total_notifications += self.tracker_for(wallet).handle_transfers(transfers)
+        return total_notifications
+
+    def check_and_notify(self) -> int:
+        """Проверяет новые транзакции и отправляет уведомления."""
+        return self.check_source()
+
+    def seed(self, force: bool = False) -> int:
+        """Ставит курсор на текущий блок, если его ещё нет (или force)."""
+        if force or BLOCKS_CURSOR not in self.cursors:
+            self.cursors.pop(BLOCKS_CURSOR, None)
+            self.get_trc20_transfers()
+        return 0
+
+    def load_processed(self, tx_ids: set):
+        """Загружает ранее обработанные транзакции."""
+        self.processed_txs = tx_ids
+
+    def get_processed(self) -> set:
+        """Возвращает множество обработанных транзакций."""
+        return self.processed_txs
+
+    def load_cursors(self, cursors: dict):
+        """Загружает курсор сканирования."""
+        self.cursors = dict(cursors)
+
+    def get_cursors(self) -> dict:
+        """Возвращает курсор сканирования."""
+        return dict(self.cursors)
+
+
+if __name__ == "__main__":
+    # Тест
+    tracker = TronBlockTracker()
+    print(f"Узел: {tracker.node_url}")
+    head = tracker.get_head_block()
+    print(f"Последний блок: {head}")
+    tracker.cursors[BLOCKS_CURSOR] = head - 20
+    transfers = tracker.get_trc20_transfers()
+    print(f"Найдено переводов за 20 блоков: {len(transfers)}")
@@ -1,45 +1,164 @@
-import requests
 import config
+import transport
+from decoding import TransferFilter, take_new
+from metrics import metrics
+from providers import get_pool
+from ratelimit import limiter, retry_after
+from routing import NOT_ROUTED, deliver
+from streaming import TRONGRID, read_page
 from telegram_bot import send_notification
 
 
 class TronTracker:
     """Отслеживание TRC20 USDT транзакций на TRON."""
     
-    def __init__(self):
-        self.wallet = config.TRC20_WALLET
+    chain = "tron"
+    provider = "trongrid"
+    
+    def __init__(self, wallet: str = None):
+        self.wallet = wallet or config.TRC20_WALLET
         self.usdt_contract = config.USDT_TRC20_CONTRACT
         self.min_amount = config.MIN_AMOUNT
+        self.filter = TransferFilter([self.wallet], contracts=[self.usdt_contract],
+                                     min_amount=self.min_amount)
         self.processed_txs = set()
-        self.api_url = "https://api.trongrid.io"
+        self.cursors = {}  # контракт -> последний block_timestamp (мс)
+        self.fetch_errors = {}  # контракт -> был ли последний запрос неудачным
+        self.ledger = None  # журнал переводов (state_store), если задан
+        self.notify = send_notification  # или NotificationQueue.submit
+        self.confirmations = None  # ConfirmationTracker, если нужны подтверждения
+        # Основной адрес TronGrid и взаимозаменяемые зеркала
+        self.pool = get_pool(self.provider, config.TRONGRID_API_URL, config.TRONGRID_API_URLS)
+        self.api_url = self.pool.primary
     
     def get_trc20_transfers(self) -> list:
         """
         Получает TRC20 переводы на кошелек.
         
+        Без курсора возвращает последнюю страницу переводов, с курсором -
+        только переводы начиная с сохранённого block_timestamp, листая
+        страницы вперёд по fingerprint.
+        
         Returns:
             Список транзакций
         """
-        url = f"{self.api_url}/v1/accounts/{self.wallet}/transactions/trc20"
+        path = f"/v1/accounts/{self.wallet}/transactions/trc20"
+        cursor = self.cursors.get(self.usdt_contract)
         params = {
             "only_to": "true",  # Только входящие
             "limit": 50,
             "contract_address": self.usdt_contract
         }
+        if cursor is not None:
+            params.update({
+                "limit": config.TRON_PAGE_LIMIT,
+                "min_timestamp": cursor,
+                "order_by": "block_timestamp,asc"
+            })
+        
+        transactions = []
+        self.fetch_errors[self.usdt_contract] = False
+        latest = 0
+        for _ in range(config.MAX_PAGES):
+            page = self._fetch_page(path, params)
+            if page is None:
+                self.fetch_errors[self.usdt_contract] = True
+                break
+            
+            transactions.extend(page.rows)
+            latest = max(latest, page.latest)
+            
+            fingerprint = page.envelope.get("meta", {}).get("fingerprint")
+            if cursor is None or not fingerprint:
+                break
+            params["fingerprint"] = fingerprint
+        
+        self._advance_cursor(latest)
+        return transactions
+    
+    def _fetch_page(self, path: str, params: dict):
+        """
+        Запрашивает одну страницу TronGrid.
+        
+        При STREAM_PARSE тело читается потоково и в page.rows остаются только
+        входящие на кошелек переводы не меньше MIN_AMOUNT.
+        
+        Returns:
+            Страница (streaming.Page с data и meta) или None при ошибке
+        """
+        query = dict(params)  # params меняются при листании страниц
+        
+        def attempt(base, conditions):
+            # Токен ограничителя на каждую попытку, включая дубль и переход на другой адрес
+            api_key = limiter.acquire(self.provider)
+            headers = dict(conditions or {})
+            if api_key:
+                headers["TRON-PRO-API-KEY"] = api_key
+            response = transport.get(
+                self.provider, base + path, params=query, headers=headers or None,
+                endpoint="transactions/trc20", stream=config.STREAM_PARSE,
+            )
+            if response.status_code in (403, 429):
+                # Ключ на паузе: следующая попытка с ним ждёт, а не повторяет сразу
+                limiter.reject(self.provider, api_key, retry_after(response))
+            return read_page(response, TRONGRID, self.filter)
+        
+        def request(conditions=None):
+            # Лучший по задержке адрес пула, при ошибке или задержке - следующий
+            page = self.pool.request(lambda base: attempt(base, conditions))
+            if page.status_code == 200:
+                # Только полученные от API строки (не из кэша), до потокового фильтра
+                metrics.record_fetched(self.chain, page.total)
+            return page
         
         try:
-            response = requests.get(url, params=params, timeout=15)
+            response = transport.cached(self.api_url + path, params, request)
             
             if response.status_code != 200:
                 print(f"[TRON] Ошибка API: {response.status_code}")
-                return []
-            
-            data = response.json()
-            return data.get("data", [])
-            
+                return None
+            return response
         except Exception as e:
             print(f"[TRON] Ошибка запроса: {e}")
-            return []
+            return None
+    
+    def fetch_range(self, start_ms: int, end_ms: int) -> list:
+        """
+        Все входящие переводы USDT за интервал времени (для backfill).
+        
+        Args:
+            start_ms, end_ms: Границы block_timestamp в миллисекундах (включительно)
+        
+        Returns:
+            Список транзакций в формате TronGrid
+        
+        Raises:
+            RuntimeError: Страница не получена
+        """
+        path = f"/v1/accounts/{self.wallet}/transactions/trc20"
+        params = {
+            "only_to": "true",
+            "contract_address": self.usdt_contract,
+            "limit": config.TRON_PAGE_LIMIT,
+            "min_timestamp": start_ms,
+            "max_timestamp": end_ms,
+            "order_by": "block_timestamp,asc",
+        }
+        transactions = []
+        while True:
+            page = self._fetch_page(path, params)
+            if page is None:
+                raise RuntimeError(f"TronGrid: страница {start_ms}-{end_ms} не получена")
+            transactions.extend(page.rows)
+            fingerprint = page.envelope.get("meta", {}).get("fingerprint")
+            if not fingerprint:
+                return transactions
+            params["fingerprint"] = fingerprint
+    
+    def _advance_cursor(self, latest: int):
+        """Сдвигает курсор на самый поздний block_timestamp из ответа."""
+        if latest and latest > self.cursors.get(self.usdt_contract, 0):
+            self.cursors[self.usdt_contract] = latest
     
     def process_transactions(self, transactions: list) -> list:
         """
@@ -51,40 +170,22 @@ class TronTracker:
         Returns:
             Список новых транзакций для уведомления
         """
-        new_transactions = []
-        
-        for tx in transactions:
-            tx_id = tx.get("transaction_id")
-            
-            # Пропускаем уже обработанные
-            if tx_id in self.processed_txs:
-                continue
-            
-            # Проверяем что это входящая транзакция на наш кошелек
-            to_address = tx.get("to")
-            if to_address != self.wallet:
-                continue
-            
-            # Получаем сумму (USDT имеет 6 decimals)
-            value = tx.get("value", "0")
-            decimals = int(tx.get("token_info", {}).get("decimals", 6))
-            amount = int(value) / (10 ** decimals)
-            
-            # Фильтруем по минимальной сумме
-            if amount < self.min_amount:
-                self.processed_txs.add(tx_id)
-                continue
-            
-            new_transactions.append({
-                "tx_id": tx_id,
-                "amount": amount,
-                "token": "usdt",
-                "network": "trc20"
-            })
-            
-            self.processed_txs.add(tx_id)
-        
-        return new_transactions
+        # Входящие на наш кошелек не меньше минимальной суммы (USDT имеет 6 decimals)
+        transfers = take_new(self.filter.decode_trongrid(transactions), self.processed_txs)
+        metrics.record_transfers(self.chain, transfers)
+        return [t.to_dict("usdt", "trc20", "tx_id") for t in transfers]
+    
+    def tracker_for(self, wallet: str) -> "TronTracker":
+        """Трекер, обрабатывающий переводы кошелька (у этого трекера кошелек один)."""
+        return self
+    
+    def sources(self) -> list:
+        """Возвращает контракты, опрашиваемые отдельными запросами."""
+        return [self.usdt_contract]
+    
+    def check_source(self, contract_address: str) -> int:
+        """Проверяет новые транзакции контракта (на TRON он один)."""
+        return self.check_and_notify()
     
     def check_and_notify(self) -> int:
         """
@@ -94,13 +195,58 @@ class TronTracker:
             Количество новых уведомлений
         """
         transactions = self.get_trc20_transfers()
+        return self.handle_transfers(transactions)
+    
+    def handle_transfers(self, transactions: list) -> int:
+        """
+        Отбирает новые переводы и отправляет уведомления
+        (или ставит их в ожидание подтверждений).
+        
+        Args:
+            transactions: Список транзакций в формате TronGrid
+        
+        Returns:
+            Количество новых уведомлений
+        """
         new_txs = self.process_transactions(transactions)
+        total_notifications = 0
         
         for tx in new_txs:
+            if self.confirmations is not None and self.confirmations.hold(self.chain, tx, "USDT TRC20"):
+                continue
             print(f"[TRON] Новая транзакция: +{tx['amount']:.2f} USDT (TRC20)")
-            send_notification(tx["amount"], "USDT TRC20")
+            notified = deliver(self.notify, tx, "USDT TRC20")
+            if notified is NOT_ROUTED:
+                print(f"[TRON] Транзакция {tx['tx_id'][:16]}... не отправляется по маршрутам")
+            elif notified:
+                total_notifications += 1
+            else:
+                print(f"[TRON] ❌ Ошибка отправки уведомления для транзакции {tx['tx_id'][:16]}...")
+            if self.ledger:
+                self.ledger.record_transfer(tx, notified)
         
-        return len(new_txs)
+        return total_notifications
+    
+    def seed(self, force: bool = False) -> int:
+        """
+        Помечает текущие транзакции обработанными без уведомлений.
+        Источник с сохранённым курсором пропускается: его переводы
+        догоняются обычным опросом от курсора.
+        
+        Args:
+            force: Помечать и при наличии курсора (старый холодный старт)
+        
+        Returns:
+            Количество помеченных транзакций
+        """
+        if not force and self.usdt_contract in self.cursors:
+            return 0
+        count = 0
+        for transfer in self.filter.decode_trongrid(self.get_trc20_transfers()):
+            if transfer.tx_id:
+                self.processed_txs.add(transfer.key)
+                count += 1
+        return count
     
     def load_processed(self, tx_ids: set):
         """Загружает ранее обработанные транзакции."""
@@ -109,6 +255,14 @@ class TronTracker:
     def get_processed(self) -> set:
         """Возвращает множество обработанных транзакций."""
         return self.processed_txs
+    
+    def load_cursors(self, cursors: dict):
+        """Загружает курсоры по контрактам."""
+        self.cursors = dict(cursors)
+    
+    def get_cursors(self) -> dict:
+        """Возвращает курсоры по контрактам."""
+        return dict(self.cursors)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+"""
+Приём переводов, присланных индексатором или webhook провайдером.
+Асинхронный HTTP сервер принимает POST /webhook/tron и /webhook/bsc,
+проверяет подпись общим секретом и передаёт переводы движку тем же путём
+process_transactions -> уведомление, что и опрос. Опрос при этом остаётся
+редкой сверкой на случай потерянных событий.
+
+Подпись: X-Timestamp - unix время в секундах, X-Signature -
+hex HMAC-SHA256 от "<X-Timestamp>.<тело запроса>" с WEBHOOK_SECRET
+(допускается префикс "sha256=").
+
+Тело: {"events": [...]}, список или один перевод в формате TronGrid
+transactions/trc20 (tron) или BscScan tokentx (bsc).
+
+Локальная отправка для проверки:
+    python webhook.py bsc 0xВАШ_КОШЕЛЕК 12.5
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import config
+from metrics import metrics
+
+ROUTES = {"/webhook/tron": "tron", "/webhook/bsc": "bsc"}
+# Сколько ждать следующего запроса в keep-alive соединении (сек)
+IDLE_TIMEOUT = 30
+REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+    405: "Method Not Allowed", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+def signature(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 подпись тела запроса."""
+    message = timestamp.encode() + b"." + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def parse_events(body: bytes) -> list:
+    """
+    Достаёт переводы из тела запроса.
+
+    Raises:
+        ValueError: Тело не JSON или не содержит переводов
+    """
+    data = json.loads(body or b"null")
+    if isinstance(data, dict):
+        data = data.get("events", [data])
+    if not isinstance(data, list):
+        raise ValueError("ожидается объект или список переводов")
+    return [row for row in data if isinstance(row, dict)]
+
+
+def reconcile_intervals(interval: float = None) -> dict:
+    """
+    Интервалы опроса в режиме редкой сверки: события приходят через
+    webhook, опрос лишь подбирает пропущенные. Конфигурация не меняется,
+    интервалы передаются движку (TrackerEngine(intervals=...)).
+
+    Returns:
+        Аргументы PollScheduler: base_interval, min_interval, max_interval
+    """
+    interval = config.WEBHOOK_RECONCILE_INTERVAL if interval is None else interval
+    return {
+        "base_interval": max(config.CHECK_INTERVAL, interval),
+        "min_interval": max(config.POLL_MIN_INTERVAL, interval),
+        "max_interval": max(config.POLL_MAX_INTERVAL, interval),
+    }
+
+
+class WebhookServer:
+    """HTTP сервер приёма переводов в отдельном потоке с циклом asyncio."""
+
+    def __init__(self, ingest, secret: str = None, host: str = None, port: int = None,
+                 workers: int = 4):
+        """
+        Args:
+            ingest: Функция (сеть, переводы) -> число уведомлений, обычно TrackerEngine.ingest
+            secret: Общий секрет подписи
+            port: Порт (0 - любой свободный)
+        """
+        self.ingest = ingest
+        self.secret = config.WEBHOOK_SECRET if secret is None else secret
+        self.host = host or config.WEBHOOK_HOST
+        self.port = config.WEBHOOK_PORT if port is None else port
+        self.tolerance = config.WEBHOOK_TOLERANCE
+        self.max_body = config.WEBHOOK_MAX_BODY
+        # Обработка переводов блокирующая (уведомления, хранилище) - в пуле потоков
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self.counters = {"requests": 0, "events": 0, "notified": 0, "rejected": 0}
+        self.loop = None
+        self.thread = None
+        self._stop = None
+        self._error = None
+        self._connections = set()  # открытые соединения (StreamWriter)
+        self._idle = set()  # соединения в ожидании следующего запроса
+
+    def start(self):
+        """Запускает сервер и ждёт, пока порт будет открыт."""
+        if not self.secret:
+            raise ValueError("WEBHOOK_SECRET не задан")
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self._serve(ready)), name="webhook", daemon=True
+        )
+        self.thread.start()
+        ready.wait()
+        if self._error:
+            raise self._error
+
+    async def _serve(self, ready: threading.Event):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            self._error = e
+            ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        ready.set()
+        async with server:
+            await self._stop.wait()
+            # Простаивающие keep-alive соединения закрываются, начатые запросы дорабатывают
+            for writer in list(self._idle):
+                writer.close()
+            while self._connections:
+                await asyncio.sleep(0.01)
+
+    def close(self):
+        """Останавливает сервер и дожидается обработки принятых запросов."""
+        if self.loop and self._stop:
+            self.loop.call_soon_threadsafe(self._stop.set)
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.executor.shutdown(wait=True)
+
+    def verify(self, headers: dict, body: bytes) -> bool:
+        """Проверяет подпись и свежесть X-Timestamp."""
+        timestamp = headers.get("x-timestamp", "")
+        received = headers.get("x-signature", "")
+        if received.startswith("sha256="):
+            received = received[len("sha256="):]
+        try:
+            if abs(time.time() - int(timestamp)) > self.tolerance:
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(signature(self.secret, timestamp, body), received)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживает соединение: запросы читаются по одному (keep-alive)."""
+        self._connections.add(writer)
+        try:
+            while True:
+                self._idle.add(writer)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(writer)
+                lines = head.decode("latin-1").split("\r\n")
+                request_line = lines[0].split(" ")
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if value:
+                        headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (
+                    not self._stop.is_set() and len(request_line) == 3 and request_line[2] == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                if len(request_line) != 3:
+                    status, payload, keep_alive = 400, {"error": "bad request line"}, False
+                elif "transfer-encoding" in headers:
+                    status, payload, keep_alive = 411, {"error": "content-length required"}, False
+                else:
+                    length = headers.get("content-length") or "0"
+                    length = int(length) if length.isdigit() else -1
+                    if length < 0:
+                        status, payload, keep_alive = 400, {"error": "bad content-length"}, False
+                    elif length > self.max_body:
+                        status, payload, keep_alive = 413, {"error": "body too large"}, False
+                    else:
+                        body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT)
+                        method, path = request_line[0], request_line[1]
+                        status, payload = await self._dispatch(method, path, headers, body)
+
+                self._respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        """
+        Проверяет запрос и передаёт переводы движку.
+
+        Returns:
+            Пара (HTTP статус, тело ответа)
+        """
+        self.counters["requests"] += 1
+        chain = ROUTES.get(path.split("?")[0])
+        if chain is None:
+            return 404, {"error": "unknown path"}
+        if method != "POST":
+            return 405, {"error": "POST only"}
+        if not self.verify(headers, body):
+            self.counters["rejected"] += 1
+            metrics.inc("webhook_requests_total", chain=chain, status="401")
+            print(f"[{chain.upper()}] Webhook: отклонён запрос с неверной подписью")
+            return 401, {"error": "bad signature"}
+        try:
+            rows = parse_events(body)
+        except ValueError as e:
+            metrics.inc("webhook_requests_total", chain=chain, status="400")
+            return 400, {"error": str(e)}
+
+        try:
+            notified = await self.loop.run_in_executor(self.executor, self.ingest, chain, rows)
+        except Exception as e:
+            print(f"[{chain.upper()}] Ошибка обработки webhook: {e}")
+            metrics.inc("webhook_requests_total", chain=chain, status="500")
+            return 500, {"error": "ingest failed"}
+        self.counters["events"] += len(rows)
+        self.counters["notified"] += notified
+        metrics.inc("webhook_requests_total", chain=chain, status="200")
+        metrics.inc("webhook_events_total", len(rows), chain=chain)
+        return 200, {"accepted": len(rows), "notified": notified}
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+    @staticmethod
+    def format_stats(stats: dict) -> str:
+        return (
+            f"запросов {stats['requests']}, переводов {stats['events']}, "
+            f"уведомлений {stats['notified']}, отклонено {stats['rejected']}"
+        )
+
+
+def sample_event(network: str, wallet: str, amount, sender: str = None) -> dict:
+    """
+    Тестовый перевод в формате TronGrid (tron) или BscScan tokentx (bsc).
+
+    Args:
+        network: "tron" или "bsc"
+        wallet: Кошелек получателя
+        amount: Сумма в токенах
+    """
+    tx_id = os.urandom(32).hex()
+    now = int(time.time())
+    if network == "tron":
+        return {
+            "transaction_id": tx_id,
+            "token_info": {"address": config.USDT_TRC20_CONTRACT, "decimals": 6},
+            "from": sender or "T" + "1" * 33,
+            "to": wallet,
+            "value": str(int(Decimal(str(amount)).scaleb(6))),
+            "block_timestamp": now * 1000,
+        }
+    from bsc_tracker import parse_tokens
+
+    contract = next(iter(parse_tokens(config.BEP20_TOKENS)), config.USDT_BEP20_CONTRACT)
+    return {
+        "hash": "0x" + tx_id,
+        "contractAddress": contract,
+        "from": sender or "0x" + "00" * 20,
+        "to": wallet,
+        "value": str(int(Decimal(str(amount)).scaleb(18))),
+        "tokenDecimal": "18",
+        "blockNumber": "0",
+        "timeStamp": str(now),
+    }
+
+
+def send(url: str, rows: list, secret: str = None, timeout: float = 10):
+    """
+    Подписывает и отправляет переводы на webhook (локальный отправитель).
+
+    Returns:
+        Ответ requests.Response
+    """
+    import requests
+
+    secret = config.WEBHOOK_SECRET if secret is None else secret
+    body = json.dumps({"events": rows}).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Timestamp": timestamp,
+        "X-Signature": "sha256=" + signature(secret, timestamp, body),
+    }
+    return requests.post(url, data=body, headers=headers, timeout=timeout)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Отправка тестового перевода на webhook")
+    parser.add_argument("network", choices=sorted(ROUTES.values()))
+    parser.add_argument("wallet", help="кошелек получателя")
+    parser.add_argument("amount", help="сумма в токенах")
+    parser.add_argument("--count", type=int, default=1, help="переводов в запросе")
+    parser.add_argument("--url", help="адрес сервера (по умолчанию локальный WEBHOOK_PORT)")
+    parser.add_argument("--secret", help="секрет подписи (по умолчанию WEBHOOK_SECRET)")
+    args = parser.parse_args()
+
+    url = args.url or f"http://127.0.0.1:{config.WEBHOOK_PORT or 8080}/webhook/{args.network}"
+    rows = [sample_event(args.network, args.wallet, args.amount) for _ in range(args.count)]
+    started = time.perf_counter()
+    response = send(url, rows, args.secret)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"HTTP {response.status_code} за {elapsed:.1f} мс: {response.text}")
+
+
+if __name__ == "__main__":
+    main()